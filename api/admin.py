@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from api.models import Profile, Folder, Document, Tag, DocumentPermission
+from api.models import (Profile, Folder, Document, Tag, DocumentPermission, LLMCacheEntry, QuotaCounter, StoredBlob,
+                        TranslationCacheEntry, TranslationMemoryEntry)
 
 # --- Personalización del Admin de Usuarios ---
 
@@ -32,9 +33,15 @@ class FolderAdmin(admin.ModelAdmin):
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ('id', 'file', 'owner', 'folder', 'uploaded_at')
+    list_display = ('id', 'original_name', 'file', 'owner', 'folder', 'uploaded_at')
     list_filter = ('owner', 'folder', 'tags')
-    search_fields = ('file', 'owner__username')
+    search_fields = ('file', 'original_name', 'owner__username')
+
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sha256', 'size', 'ref_count', 'text_extracted', 'created_at')
+    search_fields = ('sha256',)
 
 
 @admin.register(Tag)
@@ -47,3 +54,34 @@ class TagAdmin(admin.ModelAdmin):
 class DocumentPermissionAdmin(admin.ModelAdmin):
     list_display = ('document', 'user', 'permission_level')
     search_fields = ('document__file', 'user__username')
+
+
+@admin.register(TranslationCacheEntry)
+class TranslationCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'text_hash', 'source_language', 'target_language', 'backend',
+                    'hit_count', 'last_used_at')
+    list_filter = ('backend', 'target_language')
+    search_fields = ('text_hash',)
+
+
+@admin.register(LLMCacheEntry)
+class LLMCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'operation', 'model_name', 'content_hash', 'document', 'hit_count', 'last_used_at')
+    list_filter = ('operation', 'model_name')
+    search_fields = ('content_hash',)
+    raw_id_fields = ('document',)
+
+
+@admin.register(TranslationMemoryEntry)
+class TranslationMemoryEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source_language', 'target_language', 'backend', 'source_text', 'use_count',
+                    'last_used_at')
+    list_filter = ('target_language', 'backend')
+    search_fields = ('source_text', 'target_text')
+
+
+@admin.register(QuotaCounter)
+class QuotaCounterAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'window_start', 'current_count', 'previous_count')
+    list_filter = ('kind',)
+    search_fields = ('user__username',)
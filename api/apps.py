@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Registra los receptores de señales (índice de búsqueda, etc.)
+        # y los manejadores de trabajos en segundo plano
+        from . import signals, tasks  # noqa: F401
@@ -0,0 +1,165 @@
+"""
+Contexto que recibe el asistente de Gemini (api/gemini_service.py).
+
+En lugar de listar todos los documentos, carpetas y etiquetas del usuario, se
+envían como mucho ASSISTANT_CONTEXT_MAX_DOCUMENTS documentos, los más
+relevantes para la petición, y todo el contexto cabe en
+ASSISTANT_CONTEXT_MAX_TOKENS (aprox. 4 caracteres por token).
+
+- Los documentos se eligen en una sola consulta: primero los que la petición
+  menciona por id, después por relevancia en el índice de texto completo
+  (nombre > etiquetas > contenido, ver api/search.py) y por último los
+  modificados más recientemente.
+- Las carpetas y etiquetas del usuario (el "catálogo") se guardan en una caché
+  del proceso junto con la versión del catálogo (Profile.catalog_version).
+  Crear, renombrar o borrar una carpeta o etiqueta sube la versión en la base
+  de datos (api/signals.py, api/auto_tagging.py), así que el cambio se ve en
+  todos los procesos, también cuando lo hace el trabajador de 'tag_all'.
+"""
+import operator
+import re
+import threading
+from collections import OrderedDict
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Document, Folder, Profile, Tag
+from .search import search_config_for_user
+
+CHARS_PER_TOKEN = 4
+MAX_QUERY_TERMS = 20
+CATALOG_CACHE_SIZE = 1000
+DOCUMENTS_SHARE = 0.6
+
+_WORD = re.compile(r'\w{3,}')
+_NUMBER = re.compile(r'\b\d{1,9}\b')
+
+_catalogs = OrderedDict()
+_lock = threading.Lock()
+
+
+def _relevance_query(prompt, config):
+    """Cualquiera de las palabras de la petición (OR), o None si no hay ninguna útil."""
+    terms = list(dict.fromkeys(word.lower() for word in _WORD.findall(prompt) if not word.isdigit()))
+    if not terms:
+        return None
+    return reduce(operator.or_, (SearchQuery(term, config=config, search_type='plain')
+                                 for term in terms[:MAX_QUERY_TERMS]))
+
+
+def relevant_documents(user, prompt, limit):
+    """Los 'limit' documentos más relevantes para la petición (una consulta, sin el contenido)."""
+    mentioned_ids = [int(number) for number in _NUMBER.findall(prompt)][:MAX_QUERY_TERMS]
+    query = _relevance_query(prompt, search_config_for_user(user))
+
+    documents = Document.objects.filter(owner=user)
+    ordering = []
+    if mentioned_ids:
+        documents = documents.annotate(mentioned=Case(
+            When(pk__in=mentioned_ids, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        ordering.append('-mentioned')
+    if query is not None:
+        # Sin índice (search_vector NULL) el rank es NULL: al final, no al principio
+        documents = documents.annotate(rank=SearchRank(F('search_vector'), query))
+        ordering.append(F('rank').desc(nulls_last=True))
+    return list(documents.order_by(*ordering, '-modified_at', '-id').values(
+        'id', 'original_name', 'file', 'folder__name')[:limit])
+
+
+def _catalog_version(user_id):
+    return Profile.objects.filter(user_id=user_id).values_list('catalog_version', flat=True).first()
+
+
+def get_catalog(user_id):
+    """
+    (carpetas [(id, nombre)], etiquetas [nombre]) del usuario. Se consulta solo
+    la versión; el catálogo sale de la caché si la versión no ha cambiado.
+    """
+    # La versión se lee antes que el catálogo: un cambio entre medias deja una
+    # versión antigua en la caché y la siguiente llamada vuelve a consultar
+    version = _catalog_version(user_id)
+    with _lock:
+        cached = _catalogs.get(user_id)
+        if cached is not None and version is not None and cached[1] == version:
+            _catalogs.move_to_end(user_id)
+            return cached[0]
+
+    catalog = (
+        list(Folder.objects.filter(owner_id=user_id).order_by('name', 'id').values_list('id', 'name')),
+        list(Tag.objects.filter(owner_id=user_id).order_by('name').values_list('name', flat=True)),
+    )
+    if version is None:
+        # Sin perfil no hay versión que invalidar: no se guarda
+        return catalog
+    with _lock:
+        _catalogs[user_id] = (catalog, version)
+        _catalogs.move_to_end(user_id)
+        while len(_catalogs) > CATALOG_CACHE_SIZE:
+            _catalogs.popitem(last=False)
+    return catalog
+
+
+def invalidate_catalog(user_id):
+    """Sube la versión del catálogo del usuario (vale para todos los procesos)."""
+    Profile.objects.filter(user_id=user_id).update(catalog_version=F('catalog_version') + 1)
+    with _lock:
+        _catalogs.pop(user_id, None)
+
+
+def clear():
+    with _lock:
+        _catalogs.clear()
+
+
+class _Budget:
+    """Líneas de contexto mientras quepan en el presupuesto de caracteres."""
+
+    def __init__(self, max_tokens):
+        self.remaining = max_tokens * CHARS_PER_TOKEN
+        self.lines = []
+
+    def add(self, line):
+        if len(line) + 1 > self.remaining:
+            return False
+        self.lines.append(line)
+        self.remaining -= len(line) + 1
+        return True
+
+    def add_section(self, title, lines, omitted_label, share=1.0):
+        """
+        Añade la sección usando como mucho 'share' de lo que queda. Si no caben
+        todas las líneas, termina con una que indica cuántas faltan.
+        """
+        lines = list(lines)
+        reserved = self.remaining - int(self.remaining * share)
+        self.remaining -= reserved
+        self.add(title)
+        for index, line in enumerate(lines):
+            if not self.add(line):
+                self.remaining += reserved
+                self.add(f"- ({len(lines) - index} {omitted_label} más sin listar)")
+                break
+        else:
+            self.remaining += reserved
+        self.add("")
+
+
+def build_context(user, prompt):
+    """Texto con los documentos relevantes, las carpetas y las etiquetas del usuario."""
+    max_documents = getattr(settings, 'ASSISTANT_CONTEXT_MAX_DOCUMENTS', 50)
+    budget = _Budget(getattr(settings, 'ASSISTANT_CONTEXT_MAX_TOKENS', 2000))
+    documents = relevant_documents(user, prompt, max_documents)
+    folders, tags = get_catalog(user.id)
+
+    # Los documentos no pueden dejar sin sitio a las carpetas y etiquetas
+    budget.add_section("DOCUMENTOS (los más relevantes para la petición):", (
+        f"- ID: {doc['id']}, Nombre: {doc['original_name'] or doc['file'].rsplit('/', 1)[-1]}, "
+        f"Carpeta: {doc['folder__name'] or 'Raíz'}"
+        for doc in documents), 'documentos', share=DOCUMENTS_SHARE)
+    budget.add_section("CARPETAS:", (f"- ID: {folder_id}, Nombre: {name}" for folder_id, name in folders),
+                       'carpetas', share=0.5)
+    budget.add_section("ETIQUETAS EXISTENTES:", (f"- Nombre: {name}" for name in tags), 'etiquetas')
+    return "\n".join(budget.lines).rstrip()
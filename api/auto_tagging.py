@@ -0,0 +1,153 @@
+"""
+Etiquetado automático de todos los documentos de un usuario con Gemini
+(acción 'tag_all' del asistente, trabajo 'tag_all_documents' en api/tasks.py).
+
+- Cada petición a Gemini lleva TAG_ALL_BATCH_SIZE documentos (un extracto de
+  cada uno) y pide la respuesta en JSON: {"<id>": "etiqueta", ...}.
+- Los lotes se envían en paralelo (TAG_ALL_WORKERS hilos) sin pasar de
+  TAG_ALL_REQUESTS_PER_MINUTE peticiones por minuto.
+- Las etiquetas nuevas y las asignaciones se guardan con bulk_create a medida
+  que termina cada lote, y el avance se informa por documento.
+- La etiqueta sugerida para cada extracto se guarda en la caché de respuestas
+  (api/llm_cache.py): los documentos ya vistos no vuelven a enviarse a Gemini.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db.models.functions import Substr
+
+from . import assistant_context, llm_cache
+from .models import Document, Tag
+from .search import update_search_vector
+
+TAG_MAX_LENGTH = Tag._meta.get_field('name').max_length
+
+PROMPT = """Sugiere UNA etiqueta corta (máx 2 palabras) para cada uno de estos documentos.
+Responde SOLO con un objeto JSON {{"<id>": "<etiqueta>", ...}} con todos los ids.
+
+{documents}"""
+
+
+class RateLimiter:
+    """Reparte las peticiones para no pasar de 'per_minute' (compartido entre hilos)."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def pending_documents(user):
+    """(id, extracto) de los documentos del usuario con contenido extraído (una consulta)."""
+    # Solo viaja el extracto, no el contenido completo
+    excerpt = Substr('extracted_content', 1, getattr(settings, 'TAG_ALL_EXCERPT_CHARS', 500))
+    return list(Document.objects.filter(owner=user).exclude(extracted_content='').annotate(
+        excerpt=excerpt).order_by('id').values_list('id', 'excerpt'))
+
+
+def make_batches(documents, size=None):
+    size = size or getattr(settings, 'TAG_ALL_BATCH_SIZE', 20)
+    return [documents[start:start + size] for start in range(0, len(documents), size)]
+
+
+def clean_tag(name):
+    return ' '.join(str(name).replace('"', '').split())[:TAG_MAX_LENGTH]
+
+
+def suggest_tags(model, batch):
+    """Pide las etiquetas de un lote en una sola llamada. Devuelve {id_documento: etiqueta}."""
+    documents = "\n\n".join(
+        f"--- Documento {document_id} ---\n{excerpt}" for document_id, excerpt in batch)
+    raw_text = model.generate_content(PROMPT.format(documents=documents)).text
+    json_start, json_end = raw_text.find('{'), raw_text.rfind('}')
+    if json_start == -1 or json_end == -1:
+        raise ValueError("La respuesta de la IA no contenía un JSON válido.")
+    suggestions = json.loads(raw_text[json_start:json_end + 1])
+
+    ids = {document_id for document_id, _ in batch}
+    tags = {}
+    for key, name in suggestions.items():
+        name = clean_tag(name)
+        if str(key).isdigit() and int(key) in ids and name:
+            tags[int(key)] = name
+    return tags
+
+
+def apply_tags(user, tags_by_document):
+    """Crea las etiquetas que falten y las asigna, todo con inserciones masivas."""
+    if not tags_by_document:
+        return
+    names = set(tags_by_document.values())
+    Tag.objects.bulk_create([Tag(owner=user, name=name) for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(owner=user, name__in=names).values_list('name', 'id'))
+
+    Through = Document.tags.through
+    Through.objects.bulk_create([
+        Through(document_id=document_id, tag_id=tag_ids[name])
+        for document_id, name in tags_by_document.items()
+    ], ignore_conflicts=True)
+
+    # bulk_create no dispara señales: índice de búsqueda y catálogo del asistente a mano
+    update_search_vector(tags_by_document.keys())
+    assistant_context.invalidate_catalog(user.id)
+
+
+def tag_all_documents(user, model, on_progress=None):
+    """
+    Etiqueta todos los documentos del usuario. Un lote que falla no detiene el
+    resto; si fallan todos, se lanza el error para que el trabajo se reintente.
+    """
+    documents = pending_documents(user)
+    model_name = getattr(model, 'model_name', '')
+    keys = {document_id: llm_cache.make_key('tag', model_name, excerpt) for document_id, excerpt in documents}
+    cached = llm_cache.get_many(keys.values())
+    known = {document_id: cached[key] for document_id, key in keys.items() if key in cached}
+    apply_tags(user, known)
+
+    batches = make_batches([document for document in documents if document[0] not in known])
+    total, done, tagged = len(documents), len(known), len(known)
+    errors = []
+    if on_progress:
+        on_progress(done, total)
+    if not batches:
+        return {'tagged': tagged, 'failed_batches': 0, 'cached': len(known)}
+
+    limiter = RateLimiter(getattr(settings, 'TAG_ALL_REQUESTS_PER_MINUTE', 60))
+
+    def run(batch):
+        limiter.wait()
+        return suggest_tags(model, batch)
+
+    workers = max(1, min(getattr(settings, 'TAG_ALL_WORKERS', 4), len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, batch): batch for batch in batches}
+        # Los hilos solo hablan con Gemini; la base de datos se usa desde este hilo
+        for future in as_completed(futures):
+            try:
+                tags_by_document = future.result()
+            except Exception as e:
+                print(f"Error al etiquetar un lote de {len(futures[future])} documentos: {e}")
+                errors.append(e)
+            else:
+                apply_tags(user, tags_by_document)
+                llm_cache.put_many((keys[document_id], name, document_id)
+                                   for document_id, name in tags_by_document.items())
+                tagged += len(tags_by_document)
+            done += len(futures[future])
+            if on_progress:
+                on_progress(done, total)
+
+    if len(errors) == len(batches):
+        raise errors[0]
+    return {'tagged': tagged, 'failed_batches': len(errors), 'cached': len(known)}
@@ -0,0 +1,77 @@
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredBlob
+
+
+class Sha256UploadHandler(FileUploadHandler):
+    """
+    Calcula el SHA-256 de cada archivo mientras se recibe (sin releerlo después).
+    Debe ir el primero en FILE_UPLOAD_HANDLERS: deja pasar los bytes al siguiente
+    manejador y guarda el hash en request.upload_sha256[<campo>].
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_sha256'):
+            self.request.upload_sha256 = {}
+        self.request.upload_sha256[self.field_name] = self._hasher.hexdigest()
+        return None
+
+
+def sha256_of_file(uploaded_file):
+    """Hash de un archivo ya recibido (por si no pasó por Sha256UploadHandler)."""
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+def acquire_blob(uploaded_file, sha256=None):
+    """
+    Devuelve el StoredBlob para el contenido del archivo, guardándolo solo si es nuevo,
+    y suma una referencia. Retorna (blob, created).
+    """
+    digest = sha256 or sha256_of_file(uploaded_file)
+    with transaction.atomic():
+        blob, created = StoredBlob.objects.select_for_update().get_or_create(
+            sha256=digest, defaults={'size': uploaded_file.size})
+        if created:
+            blob.file.save(uploaded_file.name, uploaded_file, save=False)
+            blob.save(update_fields=['file'])
+        StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        blob.ref_count += 1
+    return blob, created
+
+
+def release_blob(blob_id):
+    """Quita una referencia; al llegar a cero borra el blob y su archivo (tras el commit)."""
+    if blob_id is None:
+        return
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        storage, name = blob.file.storage, blob.file.name
+        blob.delete()
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def remember_extracted_text(blob_id, text):
+    """Guarda el texto extraído en el blob para reutilizarlo en futuras subidas idénticas."""
+    StoredBlob.objects.filter(pk=blob_id, text_extracted=False).update(
+        extracted_text=text, text_extracted=True)
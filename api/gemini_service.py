@@ -2,8 +2,12 @@ import google.generativeai as genai
 import os
 from django.conf import settings
 from .models import Document, Folder, Tag, DocumentPermission
+from django.db.models import Q
 from django.contrib.auth.models import User
 from .text_extractor import extract_text
+from . import llm_cache, quotas, summarization
+from .assistant_context import build_context
+from .jobs import enqueue_job
 from django.core.files.base import ContentFile
 import json
 from io import BytesIO
@@ -15,23 +19,32 @@ from reportlab.lib.styles import getSampleStyleSheet
 genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
 
 class GeminiAssistant:
+    # Los documentos más largos se resumen antes de generar el mapa conceptual
+    MINDMAP_MAX_CHARS = 3000
+
     def __init__(self, user):
         self.user = user
         self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # Contenido generado de verdad por Gemini y servido desde la caché de
+        # respuestas (api/llm_cache.py); la decisión de acción no cuenta en ninguno
+        self.model_calls = 0
+        self.cache_hits = 0
+
+    @property
+    def served_from_cache(self):
+        """True si todo el contenido de la respuesta salió de la caché (no gasta cuota)."""
+        return self.model_calls == 0 and self.cache_hits > 0
     
     def process_command(self, prompt):
         """
         Procesa el comando del usuario y ejecuta la acción correspondiente
         """
-        # Obtener contexto de documentos y carpetas del usuario
-        documents = Document.objects.filter(owner=self.user)
-        folders = Folder.objects.filter(owner=self.user)
-        
-        context = self._build_context(documents, folders)
+        # Contexto acotado: documentos relevantes para la petición, carpetas y etiquetas
+        context = self._build_context(prompt)
         
         # Crear el prompt completo para Gemini
         full_prompt = f"""
-        Eres un asistente de gestión de documentos. Tienes acceso a los siguientes documentos y carpetas del usuario:
+        Eres un asistente de gestión de documentos. Tienes acceso a los siguientes documentos (los más relevantes) y carpetas del usuario:
         
         {context}
         
@@ -64,9 +77,8 @@ Acciones disponibles:
         """
         
         try:
-            response = self.model.generate_content(full_prompt)
-            
-            raw_text = response.text
+            # La decisión depende del contexto del momento: no se guarda en la caché
+            raw_text = self.model.generate_content(full_prompt).text
             
             json_start = raw_text.find('{')
             json_end = raw_text.rfind('}')
@@ -87,24 +99,33 @@ Acciones disponibles:
                 'message': f'Error al procesar el comando: {str(e)}'
             }
     
-    def _build_context(self, documents, folders):
-        """Construye el contexto de documentos, carpetas y etiquetas"""
-        context = "DOCUMENTOS:\n"
-        for doc in documents:
-            context += f"- ID: {doc.id}, Nombre: {doc.file.name}, Carpeta: {doc.folder.name if doc.folder else 'Raíz'}\n"
-        
-        context += "\nCARPETAS:\n"
-        for folder in folders:
-            context += f"- ID: {folder.id}, Nombre: {folder.name}\n"
-        
-        # --- INICIO DE LA MODIFICACIÓN ---
-        context += "\nETIQUETAS EXISTENTES:\n"
-        tags = Tag.objects.filter(owner=self.user)
-        for tag in tags:
-            context += f"- Nombre: {tag.name}\n"
-        # --- FIN DE LA MODIFICACIÓN ---
+    def _generate(self, operation, content, prompt, document=None, params=None):
+        """
+        Texto generado por Gemini para 'prompt', reutilizando la respuesta guardada
+        si ya se envió el mismo contenido con la misma operación (api/llm_cache.py).
+        """
+        key = llm_cache.make_key(operation, self.model.model_name, content, params)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        self.model_calls += 1
+        text = self.model.generate_content(prompt).text
+        llm_cache.put(key, text, document_id=document.id if document else None)
+        return text
 
-        return context
+    def _summarize(self, document):
+        """Resumen del contenido del documento, por partes si es largo (api/summarization.py)"""
+        summary, calls = summarization.summarize(self.model, document.extracted_content, document_id=document.id)
+        if calls:
+            self.model_calls += calls
+        else:
+            self.cache_hits += 1
+        return summary
+
+    def _build_context(self, prompt):
+        """Construye el contexto de documentos, carpetas y etiquetas (ver api/assistant_context.py)"""
+        return build_context(self.user, prompt)
     
     def _execute_action(self, action_data):
         """Ejecuta la acción determinada por Gemini"""
@@ -163,28 +184,16 @@ Acciones disponibles:
         
         return {
             'success': True,
-            'message': f'Etiqueta "{tag_name}" asignada al documento {document.file.name}'
+            'message': f'Etiqueta "{tag_name}" asignada al documento {document.display_name}'
         }
 
     def _tag_all_documents(self, params):
-        """Etiqueta todos los documentos según su contenido"""
-        documents = Document.objects.filter(owner=self.user)
-        tagged_count = 0
-        
-        for doc in documents:
-            if doc.extracted_content:
-                # Usar Gemini para sugerir etiquetas
-                prompt = f"Analiza este contenido y sugiere UNA etiqueta corta (máx 2 palabras):\n\n{doc.extracted_content[:500]}"
-                response = self.model.generate_content(prompt)
-                tag_name = response.text.strip().replace('"', '')
-                
-                tag, created = Tag.objects.get_or_create(name=tag_name, owner=self.user)
-                doc.tags.add(tag)
-                tagged_count += 1
-        
+        """Etiqueta todos los documentos según su contenido (en segundo plano, ver api/auto_tagging.py)"""
+        job = enqueue_job('tag_all_documents', user=self.user)
         return {
             'success': True,
-            'message': f'{tagged_count} documentos etiquetados automáticamente'
+            'message': 'Etiquetando tus documentos en segundo plano. Te avisaremos del progreso.',
+            'job_id': job.pk,
         }
     
     def _create_mindmap(self, params):
@@ -207,12 +216,14 @@ Acciones disponibles:
         
         # Verificar que el documento tenga contenido extraído
         if not document.extracted_content or document.extracted_content.strip() == "":
-            filename = os.path.basename(document.file.name)
+            filename = document.display_name
             file_ext = os.path.splitext(filename)[1].lower()
             
-            # Mensaje específico según el tipo de archivo
-            if file_ext in ['.docx', '.doc']:
-                message = f'⚠️ El documento "{filename}" aún no ha sido procesado. Los archivos .docx pueden tardar unos segundos. Por favor, recarga la página e intenta nuevamente en 10 segundos.'
+            # Mensaje específico según el estado de la extracción y el tipo de archivo
+            if document.extraction_status in (Document.EXTRACTION_PENDING, Document.EXTRACTION_RUNNING):
+                message = f'⏳ El documento "{filename}" todavía se está procesando (estado: {document.get_extraction_status_display().lower()}). Inténtalo de nuevo cuando la extracción haya terminado.'
+            elif document.extraction_status == Document.EXTRACTION_FAILED:
+                message = f'⚠️ No se pudo extraer el contenido del documento "{filename}". Prueba a subirlo de nuevo.'
             elif file_ext == '.pdf':
                 message = f'⚠️ El documento "{filename}" no tiene contenido extraído. Puede ser un PDF escaneado (imagen). Intenta con otro documento o espera a que se procese.'
             else:
@@ -223,6 +234,11 @@ Acciones disponibles:
                 'message': message
             }
         
+        # Un documento largo se resume antes por partes, en lugar de usar solo su principio
+        source_text = document.extracted_content
+        if len(source_text) > self.MINDMAP_MAX_CHARS:
+            source_text = self._summarize(document)
+
 # Generar mapa conceptual con Gemini en formato estructurado
         prompt = f"""
         Crea un mapa conceptual VISUAL del siguiente contenido en HTML.
@@ -336,11 +352,10 @@ Acciones disponibles:
         - NO agregues texto explicativo, SOLO devuelve el HTML
         
         Contenido a analizar:
-        {document.extracted_content[:3000]}
+        {source_text}
         """
         
-        response = self.model.generate_content(prompt)
-        mindmap_html = response.text
+        mindmap_html = self._generate('mindmap', source_text, prompt, document)
         
         # Limpiar el HTML si viene con markdown
         if '```html' in mindmap_html:
@@ -349,13 +364,15 @@ Acciones disponibles:
             mindmap_html = mindmap_html.split('```')[1].split('```')[0].strip()
         
         # Crear el documento HTML
-        filename = f"mapa_conceptual_{os.path.basename(document.file.name).split('.')[0]}.html"
+        filename = f"mapa_conceptual_{document.display_name.split('.')[0]}.html"
         new_doc = Document.objects.create(
             owner=self.user,
             folder=document.folder,
             file=ContentFile(mindmap_html.encode('utf-8'), name=filename),
-            extracted_content=mindmap_html  # Guardar el HTML también como contenido
+            extracted_content=mindmap_html,  # Guardar el HTML también como contenido
+            extraction_status=Document.EXTRACTION_DONE
         )
+        quotas.add(self.user.id, quotas.DOCUMENTS)
         
         return {
             'success': True,
@@ -374,6 +391,7 @@ Acciones disponibles:
         
         # Generar contenido con Gemini
         prompt = f"Escribe un documento completo sobre: {topic}. Debe ser informativo y bien estructurado."
+        self.model_calls += 1
         response = self.model.generate_content(prompt)
         content = response.text
         
@@ -388,8 +406,10 @@ Acciones disponibles:
             owner=self.user,
             folder=folder,
             file=ContentFile(content.encode('utf-8'), name=filename),
-            extracted_content=content
+            extracted_content=content,
+            extraction_status=Document.EXTRACTION_DONE
         )
+        quotas.add(self.user.id, quotas.DOCUMENTS)
         
         return {
             'success': True,
@@ -406,9 +426,7 @@ Acciones disponibles:
         document = Document.objects.get(id=doc_id, owner=self.user)
         
         # Generar resumen
-        prompt = f"Resume el siguiente texto de manera concisa:\n\n{document.extracted_content}"
-        response = self.model.generate_content(prompt)
-        summary = response.text
+        summary = self._summarize(document)
         
         if create_new:
             # Determinar carpeta destino
@@ -420,13 +438,15 @@ Acciones disponibles:
                 # Si no se especificó, usar la misma carpeta del documento original
                 folder = document.folder
             
-            filename = f"resumen_{document.file.name}"
+            filename = f"resumen_{document.display_name}"
             new_doc = Document.objects.create(
                 owner=self.user,
                 folder=folder,
                 file=ContentFile(summary.encode('utf-8'), name=filename),
-                extracted_content=summary
+                extracted_content=summary,
+                extraction_status=Document.EXTRACTION_DONE
             )
+            quotas.add(self.user.id, quotas.DOCUMENTS)
             
             return {
                 'success': True,
@@ -452,8 +472,8 @@ Acciones disponibles:
         
         # Traducir con Gemini
         prompt = f"Traduce el siguiente texto a {target_lang}:\n\n{document.extracted_content}"
-        response = self.model.generate_content(prompt)
-        translated_text = response.text
+        translated_text = self._generate('translate', document.extracted_content, prompt, document,
+                                         params={'target_language': target_lang})
         
         # Actualizar documento
         document.extracted_content = translated_text
@@ -471,13 +491,13 @@ Acciones disponibles:
         
         # Analizar contenido para sugerir carpeta
         prompt = f"Basándote en este contenido, sugiere UN nombre de carpeta corto (máx 3 palabras) para organizarlo:\n\n{document.extracted_content[:500]}"
-        response = self.model.generate_content(prompt)
-        folder_name = response.text.strip().replace('"', '')
+        folder_name = self._generate('organize', document.extracted_content[:500], prompt, document)
+        folder_name = folder_name.strip().replace('"', '')
         
-        # Crear o buscar carpeta
+        # Crear o buscar carpeta (solo cambia la carpeta: el contenido y su caché siguen valiendo)
         folder, created = Folder.objects.get_or_create(name=folder_name, owner=self.user)
         document.folder = folder
-        document.save()
+        document.save(update_fields=['folder', 'modified_at'])
         
         return {
             'success': True,
@@ -535,7 +555,8 @@ Acciones disponibles:
                 document = Document.objects.get(id=doc_id, owner=self.user)
             elif doc_name:
                 # Buscar por el nombre de archivo (usando 'icontains' para ser flexible)
-                document = Document.objects.get(file__icontains=doc_name, owner=self.user)
+                document = Document.objects.get(
+                    Q(file__icontains=doc_name) | Q(original_name__icontains=doc_name), owner=self.user)
             else:
                 # Si la IA no envió ni id ni nombre
                 raise Document.DoesNotExist
@@ -563,7 +584,7 @@ Acciones disponibles:
         
         return {
             'success': True,
-            'message': f'Documento "{os.path.basename(document.file.name)}" compartido con {username} con permisos de {permission}'
+            'message': f'Documento "{document.display_name}" compartido con {username} con permisos de {permission}'
         }
 
     def _rename_tag(self, params):
@@ -628,7 +649,7 @@ Acciones disponibles:
                 # Buscar por nombre de archivo
                 documents = Document.objects.filter(owner=self.user)
                 for doc in documents:
-                    if doc_name.lower() in doc.file.name.lower():
+                    if doc_name.lower() in doc.display_name.lower():
                         document = doc
                         break
                 
@@ -637,7 +658,7 @@ Acciones disponibles:
             else:
                 return {'success': False, 'message': 'Se requiere document_id o document_name'}
             
-            filename = os.path.basename(document.file.name)
+            filename = document.display_name
             document.delete()
             
             return {
@@ -665,7 +686,7 @@ Acciones disponibles:
         
         for doc in documents:
             try:
-                filename = os.path.basename(doc.file.name)
+                filename = doc.display_name
                 doc.delete()
                 deleted_count += 1
             except Exception as e:
@@ -0,0 +1,219 @@
+"""
+Cola de trabajos en segundo plano sobre la tabla BackgroundJob (sin broker externo).
+
+- enqueue_job() crea el trabajo dentro de la transacción actual.
+- Los workers (manage.py run_jobs) lo reclaman con SELECT ... FOR UPDATE SKIP LOCKED,
+  así varios procesos pueden consumir la cola sin pisarse.
+- Los manejadores se registran con @register_job('tipo') (ver api/tasks.py).
+- Mientras un trabajo se ejecuta, un hilo renueva locked_at (latido) para que no
+  se considere abandonado; el resultado solo se guarda si el trabajo sigue
+  reclamado por este worker (en este intento).
+- El avance y el estado final se envían por Channels al grupo del usuario
+  (job_group_name), que escucha JobProgressConsumer en ws/jobs/.
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+JOB_HANDLERS = {}
+
+# Un trabajo 'running' sin latido durante este tiempo se considera abandonado
+# (worker caído) y vuelve a poder reclamarse.
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+
+
+def register_job(kind):
+    """Decorador que registra la función manejadora de un tipo de trabajo."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind, payload=None, user=None, max_attempts=3):
+    """
+    Encola un trabajo. Si BACKGROUND_JOBS_INLINE está activo (desarrollo sin worker),
+    se ejecuta en este mismo proceso al confirmar la transacción.
+    """
+    job = BackgroundJob.objects.create(
+        kind=kind, payload=payload or {}, user=user, max_attempts=max_attempts)
+    if getattr(settings, 'BACKGROUND_JOBS_INLINE', False):
+        transaction.on_commit(lambda: run_job(claim_job(job_id=job.pk)))
+    return job
+
+
+def claim_job(worker_id=None, job_id=None):
+    """Reclama el siguiente trabajo disponible (o uno concreto) y lo marca como 'running'."""
+    now = timezone.now()
+    claimable = (
+        Q(status=BackgroundJob.STATUS_PENDING, run_after__lte=now)
+        | Q(status=BackgroundJob.STATUS_RUNNING, locked_at__lt=now - STALE_JOB_TIMEOUT)
+    )
+    with transaction.atomic():
+        queryset = BackgroundJob.objects.select_for_update(skip_locked=True).filter(claimable)
+        if job_id is not None:
+            queryset = queryset.filter(pk=job_id)
+        job = queryset.order_by('run_after', 'id').first()
+        if job is None:
+            return None
+
+        job.status = BackgroundJob.STATUS_RUNNING
+        job.attempts += 1
+        job.locked_by = worker_id or default_worker_id()
+        job.locked_at = now
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at'])
+    return job
+
+
+def _claimed(job):
+    """Filtro del trabajo mientras siga reclamado por este worker en este intento."""
+    return BackgroundJob.objects.filter(
+        pk=job.pk, status=BackgroundJob.STATUS_RUNNING, locked_by=job.locked_by, attempts=job.attempts)
+
+
+class _Heartbeat:
+    """Hilo que renueva locked_at del trabajo cada JOB_HEARTBEAT_INTERVAL segundos."""
+
+    def __init__(self, job):
+        self.job = job
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job.pk}', daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        interval = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+        try:
+            while not self.stopped.wait(interval):
+                try:
+                    _claimed(self.job).update(locked_at=timezone.now())
+                except Exception as e:
+                    print(f"No se pudo renovar el trabajo #{self.job.pk}: {e}")
+        finally:
+            # Conexión propia de este hilo
+            connection.close()
+
+
+def run_job(job):
+    """Ejecuta el manejador del trabajo y registra el resultado o el error (con reintentos)."""
+    if job is None:
+        return None
+
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No hay manejador registrado para '{job.kind}'.")
+        with _Heartbeat(job):
+            result = handler(job)
+    except Exception as e:
+        print(f"Error en el trabajo {job.kind} #{job.pk} (intento {job.attempts}): {e}")
+        job.error = traceback.format_exc()
+        if job.is_last_attempt or handler is None:
+            job.status = BackgroundJob.STATUS_FAILED
+            job.finished_at = timezone.now()
+        else:
+            # Reintento con espera exponencial: 2s, 4s, 8s...
+            job.status = BackgroundJob.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+        if _finish(job, status=job.status, error=job.error, run_after=job.run_after,
+                   finished_at=job.finished_at) and job.status == BackgroundJob.STATUS_FAILED:
+            notify_job(job)
+        return job
+
+    job.status = BackgroundJob.STATUS_DONE
+    job.result = result
+    job.finished_at = timezone.now()
+    if _finish(job, status=job.status, result=result, finished_at=job.finished_at):
+        notify_job(job)
+    return job
+
+
+def _finish(job, **fields):
+    """Guarda el final del trabajo si nadie lo ha reclamado entretanto. Devuelve si se guardó."""
+    if _claimed(job).update(**fields):
+        return True
+    print(f"El trabajo {job.kind} #{job.pk} lo reclamó otro worker; se descarta este resultado.")
+    return False
+
+
+def update_job_progress(job, done, total=None):
+    """Guarda el avance (done/total) del trabajo sin tocar el resto de columnas (también es un latido)."""
+    job.progress_done = done
+    fields = {'progress_done': done, 'locked_at': timezone.now()}
+    if total is not None:
+        job.progress_total = total
+        fields['progress_total'] = total
+    _claimed(job).update(**fields)
+    notify_job(job)
+
+
+def job_group_name(user_id):
+    """Grupo de Channels por el que un usuario recibe el avance de sus trabajos."""
+    return f'jobs_user_{user_id}'
+
+
+def job_state(job):
+    """Estado del trabajo tal como se envía al frontend (sin el traceback del error)."""
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'result': job.result,
+    }
+
+
+def notify_job(job):
+    """Envía el estado del trabajo a su usuario por WebSocket. Un fallo aquí no afecta al trabajo."""
+    channel_layer = get_channel_layer()
+    if job.user_id is None or channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            job_group_name(job.user_id), {'type': 'job.update', 'job': job_state(job)})
+    except Exception as e:
+        print(f"No se pudo notificar el avance del trabajo #{job.pk}: {e}")
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(worker_id=None, poll_interval=1.0, once=False):
+    """
+    Bucle de un worker: reclama y ejecuta trabajos hasta que se interrumpa.
+    Con once=True termina en cuanto la cola queda vacía.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while True:
+        if not once:
+            # Proceso de larga duración: descartar conexiones caducadas o rotas
+            close_old_connections()
+        job = claim_job(worker_id=worker_id)
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
@@ -0,0 +1,117 @@
+"""
+Caché de respuestas de Gemini por contenido (tabla LLMCacheEntry).
+
+La clave es (operación, modelo, sha256(texto enviado), sha256(parámetros)):
+dos documentos con el mismo texto comparten el resumen, y si el texto cambia
+la clave también, así que nunca se sirve una respuesta de un contenido
+anterior. Además, al cambiar el contenido extraído de un documento se borran
+las entradas que salieron de él (api/signals.py), y la tabla tiene caducidad
+(LLM_CACHE_TTL segundos) y tamaño máximo (LLM_CACHE_MAX_ENTRIES, se borran las
+usadas hace más tiempo).
+"""
+import hashlib
+import json
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import LLMCacheEntry
+
+LOOKUP_BATCH = 500
+
+_lock = threading.Lock()
+_writes_since_eviction = 0
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def make_key(operation, model_name, content, params=None):
+    params_hash = _sha256(json.dumps(params, sort_keys=True)) if params else ''
+    return (operation, model_name or '', _sha256(content), params_hash)
+
+
+def _ttl():
+    return getattr(settings, 'LLM_CACHE_TTL', 30 * 24 * 3600)
+
+
+def get(key):
+    """Respuesta guardada para la clave, o None."""
+    return get_many([key]).get(key)
+
+
+def get_many(keys):
+    """{clave: respuesta} de las claves que están en la caché (consultas por lotes)."""
+    found = {}
+    keys = list(dict.fromkeys(keys))
+    by_operation = {}
+    for key in keys:
+        by_operation.setdefault(key[:2], []).append(key)
+    for (operation, model_name), group in by_operation.items():
+        wanted = set(group)
+        for start in range(0, len(group), LOOKUP_BATCH):
+            batch = group[start:start + LOOKUP_BATCH]
+            for entry in LLMCacheEntry.objects.filter(
+                    operation=operation, model_name=model_name,
+                    content_hash__in=[key[2] for key in batch],
+                    last_used_at__gte=timezone.now() - timedelta(seconds=_ttl()),
+            ).values('pk', 'content_hash', 'params_hash', 'response'):
+                key = (operation, model_name, entry['content_hash'], entry['params_hash'])
+                if key in wanted:
+                    found[key] = entry
+    if found:
+        LLMCacheEntry.objects.filter(pk__in=[entry['pk'] for entry in found.values()]).update(
+            hit_count=F('hit_count') + 1, last_used_at=timezone.now())
+    return {key: entry['response'] for key, entry in found.items()}
+
+
+def put(key, response, document_id=None):
+    put_many([(key, response, document_id)])
+
+
+def put_many(items):
+    """Guarda (clave, respuesta, id_documento); si la clave ya estaba, se sustituye."""
+    global _writes_since_eviction
+    entries = {}
+    for (operation, model_name, content_hash, params_hash), response, document_id in items:
+        entries[(operation, model_name, content_hash, params_hash)] = LLMCacheEntry(
+            operation=operation, model_name=model_name, content_hash=content_hash,
+            params_hash=params_hash, response=response, document_id=document_id,
+            last_used_at=timezone.now())
+    if not entries:
+        return
+    LLMCacheEntry.objects.bulk_create(
+        entries.values(), batch_size=LOOKUP_BATCH, update_conflicts=True,
+        unique_fields=['operation', 'model_name', 'content_hash', 'params_hash'],
+        update_fields=['response', 'document', 'last_used_at'])
+
+    with _lock:
+        _writes_since_eviction += len(entries)
+        due = _writes_since_eviction >= getattr(settings, 'LLM_CACHE_EVICT_EVERY', 100)
+        if due:
+            _writes_since_eviction = 0
+    if due:
+        evict()
+
+
+def invalidate_document(document_id):
+    """Olvida las respuestas calculadas a partir del contenido de un documento."""
+    LLMCacheEntry.objects.filter(document_id=document_id).delete()
+
+
+def evict(max_entries=None):
+    """Borra las entradas caducadas y, si sobran, las usadas hace más tiempo."""
+    if max_entries is None:
+        max_entries = getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 20000)
+    LLMCacheEntry.objects.filter(last_used_at__lt=timezone.now() - timedelta(seconds=_ttl())).delete()
+
+    cutoff = LLMCacheEntry.objects.order_by('-last_used_at', '-pk').values_list(
+        'last_used_at', 'pk')[max_entries:max_entries + 1].first()
+    if cutoff is not None:
+        last_used_at, pk = cutoff
+        LLMCacheEntry.objects.filter(last_used_at__lt=last_used_at).delete()
+        LLMCacheEntry.objects.filter(last_used_at=last_used_at, pk__lte=pk).delete()
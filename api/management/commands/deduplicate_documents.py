@@ -0,0 +1,54 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.blobs import acquire_blob
+from api.models import Document
+
+
+class Command(BaseCommand):
+    help = ("Mueve los archivos de documentos antiguos al almacén por contenido (blobs), "
+            "de modo que los archivos idénticos se guarden una sola vez.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Solo informar de lo que se haría, sin modificar nada.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        migrated = reused = freed_bytes = 0
+
+        for document in Document.objects.filter(blob__isnull=True).exclude(file='').iterator():
+            storage, old_name = document.file.storage, document.file.name
+            if not storage.exists(old_name):
+                self.stderr.write(f"Falta el archivo de {document}: {old_name}")
+                continue
+            if dry_run:
+                self.stdout.write(f"Se movería {old_name}")
+                continue
+
+            with transaction.atomic():
+                with storage.open(old_name, 'rb') as old_file:
+                    old_file.name = old_name
+                    blob, created = acquire_blob(old_file)
+                document.original_name = document.original_name or os.path.basename(old_name)
+                document.blob = blob
+                document.file.name = blob.file.name
+                # update() para no tocar modified_at ni disparar la reindexación
+                Document.objects.filter(pk=document.pk).update(
+                    blob=blob, file=blob.file.name, original_name=document.original_name)
+
+            migrated += 1
+            if not created:
+                reused += 1
+            if not Document.objects.filter(file=old_name).exists():
+                # Si el blob ya existía, la copia antigua era espacio duplicado
+                if not created:
+                    freed_bytes += storage.size(old_name)
+                storage.delete(old_name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{migrated} documentos movidos al almacén ({reused} duplicados), "
+            f"{freed_bytes / (1024 * 1024):.1f} MB liberados."))
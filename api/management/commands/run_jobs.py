@@ -0,0 +1,62 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import default_worker_id, work
+
+
+def _worker_main(worker_id, poll_interval, once):
+    # Cada proceso abre su propia conexión a la base de datos
+    connections.close_all()
+    work(worker_id=worker_id, poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de trabajos en segundo plano (extracción de texto, etc.)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help="Número de procesos worker (por defecto 2).")
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Segundos de espera cuando la cola está vacía.")
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Procesar los trabajos pendientes y terminar.")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        poll_interval = options['poll_interval']
+        once = options['once']
+
+        if workers == 1:
+            processed = work(poll_interval=poll_interval, once=once)
+            if once:
+                self.stdout.write(self.style.SUCCESS(f"{processed} trabajos procesados."))
+            return
+
+        # Las conexiones heredadas no deben compartirse entre procesos
+        connections.close_all()
+        base_id = default_worker_id()
+        processes = [
+            multiprocessing.Process(
+                target=_worker_main,
+                args=(f'{base_id}/{i}', poll_interval, once),
+                # No daemon: los workers pueden necesitar su propio pool de procesos
+                # (extracción de PDFs grandes), y un proceso daemon no puede tener hijos.
+                daemon=False,
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"{workers} workers en marcha. Ctrl+C para detener.")
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:33
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+# Rellena el índice de los documentos existentes con la misma ponderación que
+# api.search.update_search_vector (nombre A, etiquetas B, contenido C).
+BACKFILL_SEARCH_VECTOR = r"""
+UPDATE api_document AS d
+SET search_vector =
+    setweight(to_tsvector(cfg.config, regexp_replace(regexp_replace(d.file, '^.*/', ''), '[\W_]+', ' ', 'g')), 'A')
+    || setweight(to_tsvector(cfg.config, coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM api_tag t
+        JOIN api_document_tags dt ON dt.tag_id = t.id
+        WHERE dt.document_id = d.id
+    ), '')), 'B')
+    || setweight(to_tsvector(cfg.config, d.extracted_content), 'C')
+FROM (
+    SELECT u.id AS user_id,
+           (CASE lower(p.language_preference)
+                WHEN 'es' THEN 'spanish'
+                WHEN 'en' THEN 'english'
+                WHEN 'fr' THEN 'french'
+                WHEN 'de' THEN 'german'
+                WHEN 'pt' THEN 'portuguese'
+                WHEN 'it' THEN 'italian'
+                ELSE 'simple'
+            END)::regconfig AS config
+    FROM auth_user u
+    LEFT JOIN api_profile p ON p.user_id = u.id
+) AS cfg
+WHERE cfg.user_id = d.owner_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_profile_daily_ai_requests_count_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_document_search_gin'),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTOR, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_folder_paths(apps, schema_editor):
+    """Calcula la ruta materializada de las carpetas existentes, nivel por nivel."""
+    Folder = apps.get_model('api', 'Folder')
+    parent_paths = {None: '/'}
+    level = list(Folder.objects.filter(parent__isnull=True))
+    while level:
+        for folder in level:
+            folder.path = f'{parent_paths[folder.parent_id]}{folder.pk}/'
+            parent_paths[folder.pk] = folder.path
+        Folder.objects.bulk_update(level, ['path'])
+        level = list(Folder.objects.filter(parent_id__in=[f.pk for f in level]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_document_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=1024),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['path'], name='api_folder_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_folder_paths, migrations.RunPython.noop),
+    ]
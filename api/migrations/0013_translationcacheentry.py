@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_storedblob_document_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(help_text='SHA-256 del texto original', max_length=64)),
+                ('source_language', models.CharField(help_text="Idioma de origen o 'auto'", max_length=10)),
+                ('target_language', models.CharField(max_length=10)),
+                ('backend', models.CharField(max_length=30)),
+                ('translated_text', models.TextField()),
+                ('detected_source_language', models.CharField(blank=True, max_length=10)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='api_translation_cache_lru_idx')],
+                'constraints': [models.UniqueConstraint(fields=('text_hash', 'source_language', 'target_language', 'backend'), name='api_translation_cache_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_translationcacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationMemoryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(help_text='SHA-256 de la frase normalizada', max_length=64)),
+                ('source_language', models.CharField(help_text="Idioma de origen o 'auto'", max_length=10)),
+                ('target_language', models.CharField(max_length=10)),
+                ('source_text', models.TextField()),
+                ('target_text', models.TextField()),
+                ('detected_source_language', models.CharField(blank=True, max_length=10)),
+                ('use_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source_hash', 'source_language', 'target_language'), name='api_translation_memory_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_documents(apps, schema_editor):
+    """La cuota de documentos empieza con los documentos que ya tiene cada usuario."""
+    Document = apps.get_model('api', 'Document')
+    QuotaCounter = apps.get_model('api', 'QuotaCounter')
+    QuotaCounter.objects.bulk_create([
+        QuotaCounter(user_id=row['owner'], kind='documents', current_count=row['total'])
+        for row in Document.objects.values('owner').annotate(total=Count('id')).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_translationmemoryentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text="Tipo de cuota (ej: 'ai_requests', 'documents')", max_length=30)),
+                ('window_start', models.BigIntegerField(default=0, help_text='Número de la ventana actual (0 si no tiene ventana)')),
+                ('current_count', models.PositiveIntegerField(default=0)),
+                ('previous_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quota_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind'), name='api_quota_counter_key')],
+            },
+        ),
+        migrations.RunPython(count_existing_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_quotacounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(help_text="Operación (ej: 'summarize', 'mindmap', 'tag')", max_length=30)),
+                ('model_name', models.CharField(max_length=100)),
+                ('content_hash', models.CharField(help_text='SHA-256 del texto enviado al modelo', max_length=64)),
+                ('params_hash', models.CharField(blank=True, help_text='SHA-256 de los parámetros extra', max_length=64)),
+                ('response', models.TextField()),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('document', models.ForeignKey(blank=True, help_text='Documento del que salió el texto (para invalidar al cambiar su contenido)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='api_llm_cache_lru_idx')],
+                'constraints': [models.UniqueConstraint(fields=('operation', 'model_name', 'content_hash', 'params_hash'), name='api_llm_cache_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+def forget_unknown_backend(apps, schema_editor):
+    # No se sabe qué backend tradujo las frases guardadas: podrían ser del 'offline'
+    apps.get_model('api', 'TranslationMemoryEntry').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_llmcacheentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_unknown_backend, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='translationmemoryentry',
+            name='api_translation_memory_key',
+        ),
+        migrations.AddField(
+            model_name='translationmemoryentry',
+            name='backend',
+            field=models.CharField(default='', help_text='Backend que tradujo la frase', max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='translationmemoryentry',
+            index=models.Index(fields=['last_used_at'], name='api_translation_memory_lru_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='translationmemoryentry',
+            constraint=models.UniqueConstraint(fields=('source_hash', 'source_language', 'target_language', 'backend'), name='api_translation_memory_key'),
+        ),
+    ]
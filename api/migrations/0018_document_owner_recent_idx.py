@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_translationmemoryentry_backend'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['owner', '-modified_at', '-id'], name='api_document_owner_recent_idx'),
+        ),
+    ]
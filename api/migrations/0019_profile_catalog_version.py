@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_document_owner_recent_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,11 @@
+import os
+
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
@@ -8,6 +14,11 @@ def user_directory_path(instance, filename):
     """Genera la ruta de archivo para nuevos documentos: MEDIA_ROOT/user_<id>/<filename>"""
     return f'user_{instance.owner.id}/{filename}'
 
+def blob_storage_path(instance, filename):
+    """Ruta direccionada por contenido: MEDIA_ROOT/blobs/<2 primeros del hash>/<sha256><ext>"""
+    _, extension = os.path.splitext(filename)
+    return f'blobs/{instance.sha256[:2]}/{instance.sha256}{extension.lower()}'
+
 def user_preview_directory_path(instance, filename):
     """Genera la ruta de archivo para las vistas previas: MEDIA_ROOT/user_<id>/previews/<filename>"""
     return f'user_{instance.owner.id}/previews/{filename}'
@@ -38,6 +49,17 @@ class Profile(models.Model):
     daily_ai_requests_count = models.IntegerField(default=0, help_text="Peticiones a la IA hoy")
     last_ai_request_date = models.DateField(default=timezone.now)
 
+    # Sube al cambiar carpetas o etiquetas: invalida el catálogo del asistente en todos los procesos
+    catalog_version = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        # catalog_version solo se cambia con UPDATE (api/assistant_context.py): un
+        # perfil cargado antes no debe volver a escribir su valor antiguo
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'catalog_version']
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Perfil de {self.user.username} ({self.subscription_plan})"
 
@@ -58,36 +80,123 @@ class Folder(models.Model):
         User, on_delete=models.CASCADE, related_name='folders')
     parent = models.ForeignKey(
         'self', on_delete=models.CASCADE, null=True, blank=True, related_name='subfolders')
+    # Ruta materializada con los IDs de los ancestros y el propio, ej: '/3/8/15/'.
+    # Permite obtener un subárbol completo con un solo 'path__startswith'.
+    path = models.CharField(max_length=1024, editable=False, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         # Evita carpetas con el mismo nombre dentro del mismo directorio padre para un usuario
         unique_together = ('owner', 'name', 'parent')
+        indexes = [
+            models.Index(fields=['path'], name='api_folder_path_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return f"Carpeta '{self.name}' de {self.owner.username}"
 
+    def save(self, *args, **kwargs):
+        """Guarda la carpeta y mantiene la ruta materializada (propia y de sus descendientes)."""
+        old_path = self.path
+        super().save(*args, **kwargs)
+
+        parent_path = '/'
+        if self.parent_id:
+            parent_path = Folder.objects.filter(
+                pk=self.parent_id).values_list('path', flat=True).get()
+        new_path = f'{parent_path}{self.pk}/'
+        if new_path == old_path:
+            return
+
+        Folder.objects.filter(pk=self.pk).update(path=new_path)
+        if old_path:
+            # La carpeta se ha movido: reescribir el prefijo de todo el subárbol
+            self.get_descendants(old_path).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)))
+        self.path = new_path
+
+    def get_descendants(self, path=None):
+        """Todas las subcarpetas (a cualquier profundidad) en una sola consulta."""
+        return Folder.objects.filter(
+            path__startswith=path or self.path).exclude(pk=self.pk)
+
+    def get_subtree(self):
+        """La carpeta y todos sus descendientes."""
+        return Folder.objects.filter(path__startswith=self.path)
+
+
+class StoredBlob(models.Model):
+    """
+    Archivo almacenado una sola vez por contenido (SHA-256), compartido por todos los
+    documentos con los mismos bytes. ref_count cuenta los documentos que lo usan.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_storage_path)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Texto extraído de los bytes originales, reutilizado al volver a subir el mismo archivo
+    extracted_text = models.TextField(blank=True)
+    text_extracted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.ref_count} refs)"
+
 
 class Document(models.Model):
     """Modelo para representar un archivo subido."""
+    # Estados de la extracción de texto en segundo plano (ver api/tasks.py)
+    EXTRACTION_PENDING = 'pending'
+    EXTRACTION_RUNNING = 'running'
+    EXTRACTION_DONE = 'done'
+    EXTRACTION_FAILED = 'failed'
+    EXTRACTION_STATUS_CHOICES = [
+        (EXTRACTION_PENDING, 'Pendiente'),
+        (EXTRACTION_RUNNING, 'En proceso'),
+        (EXTRACTION_DONE, 'Completada'),
+        (EXTRACTION_FAILED, 'Fallida'),
+    ]
+
     owner = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='documents')
     folder = models.ForeignKey(
         Folder, on_delete=models.SET_NULL, related_name='documents', null=True, blank=True)
     file = models.FileField(upload_to=user_directory_path)
+    # Los archivos subidos apuntan a un StoredBlob compartido; original_name conserva
+    # el nombre con el que el usuario lo subió (el del blob es su hash).
+    blob = models.ForeignKey(
+        StoredBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='documents')
+    original_name = models.CharField(max_length=255, blank=True)
     # UC-12: Campo para la vista previa
     preview = models.ImageField(
         upload_to=user_preview_directory_path, null=True, blank=True)
     # UC-15: Campo para el contenido extraído para búsqueda
     extracted_content = models.TextField(blank=True)
+    extraction_status = models.CharField(
+        max_length=10, choices=EXTRACTION_STATUS_CHOICES, default=EXTRACTION_PENDING)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
     tags = models.ManyToManyField(
         'Tag', blank=True, related_name='documents')
+    # UC-15: Índice de búsqueda de texto completo (nombre > etiquetas > contenido).
+    # Se mantiene desde api/signals.py mediante api.search.update_search_vector.
+    search_vector = SearchVectorField(null=True, editable=False)
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='api_document_search_gin'),
+            # Orden del listado paginado por cursor y de los documentos del asistente
+            models.Index(fields=['owner', '-modified_at', '-id'], name='api_document_owner_recent_idx'),
+        ]
 
     def __str__(self):
-        return f"Documento '{self.file.name}' de {self.owner.username}"
+        return f"Documento '{self.display_name}' de {self.owner.username}"
+
+    @property
+    def display_name(self):
+        """Nombre visible del documento (sin la ruta de almacenamiento)."""
+        return self.original_name or os.path.basename(self.file.name)
 
 
 class Tag(models.Model):
@@ -123,7 +232,7 @@ class DocumentPermission(models.Model):
         unique_together = ('document', 'user')
 
     def __str__(self):
-        return f"Permiso de '{self.permission_level}' para {self.user.username} en {self.document.file.name}"
+        return f"Permiso de '{self.permission_level}' para {self.user.username} en {self.document.display_name}"
 
 
 # --- NUEVO MODELO AÑADIDO PARA UC-20 ---
@@ -147,4 +256,162 @@ class TranslationHistory(models.Model):
         ordering = ['-translated_at'] # Muestra los más recientes primero
 
     def __str__(self):
-        return f"Traducción de {self.original_document.file.name} a {self.target_language} por {self.user.username}"
+        return f"Traducción de {self.original_document.display_name} a {self.target_language} por {self.user.username}"
+
+
+class BackgroundJob(models.Model):
+    """
+    Cola de trabajos en segundo plano guardada en la base de datos (sin broker).
+    Los workers (manage.py run_jobs) reclaman trabajos con SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_RUNNING, 'En proceso'),
+        (STATUS_DONE, 'Completado'),
+        (STATUS_FAILED, 'Fallido'),
+    ]
+
+    kind = models.CharField(max_length=50, help_text="Tipo de trabajo registrado en api/jobs.py")
+    payload = models.JSONField(default=dict, blank=True)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='background_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='api_job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trabajo {self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_last_attempt(self):
+        return self.attempts >= self.max_attempts
+
+
+class TranslationCacheEntry(models.Model):
+    """
+    Traducción ya calculada, reutilizada por documentos, fragmentos y chat
+    (segundo nivel de api/translation_cache.py, detrás de la LRU en memoria).
+    """
+    text_hash = models.CharField(max_length=64, help_text="SHA-256 del texto original")
+    source_language = models.CharField(max_length=10, help_text="Idioma de origen o 'auto'")
+    target_language = models.CharField(max_length=10)
+    backend = models.CharField(max_length=30)
+    translated_text = models.TextField()
+    detected_source_language = models.CharField(max_length=10, blank=True)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['text_hash', 'source_language', 'target_language', 'backend'],
+                name='api_translation_cache_key'),
+        ]
+        indexes = [
+            models.Index(fields=['last_used_at'], name='api_translation_cache_lru_idx'),
+        ]
+
+    def __str__(self):
+        return f"Traducción en caché {self.text_hash[:12]} {self.source_language}->{self.target_language}"
+
+
+class TranslationMemoryEntry(models.Model):
+    """
+    Memoria de traducción: par frase origen -> frase destino, reutilizable entre
+    documentos. La frase se normaliza (espacios) y se busca por su SHA-256.
+    """
+    source_hash = models.CharField(max_length=64, help_text="SHA-256 de la frase normalizada")
+    source_language = models.CharField(max_length=10, help_text="Idioma de origen o 'auto'")
+    target_language = models.CharField(max_length=10)
+    backend = models.CharField(max_length=30, default='', help_text="Backend que tradujo la frase")
+    source_text = models.TextField()
+    target_text = models.TextField()
+    detected_source_language = models.CharField(max_length=10, blank=True)
+    use_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source_hash', 'source_language', 'target_language', 'backend'],
+                name='api_translation_memory_key'),
+        ]
+        indexes = [
+            models.Index(fields=['last_used_at'], name='api_translation_memory_lru_idx'),
+        ]
+
+    def __str__(self):
+        return f"Memoria {self.source_language}->{self.target_language}: {self.source_text[:40]}"
+
+
+class QuotaCounter(models.Model):
+    """
+    Uso de una cuota por usuario (api/quotas.py). Las cuotas con ventana guardan
+    el recuento de la ventana actual y el de la anterior (ventana deslizante
+    aproximada); las que no tienen ventana (documentos) solo usan current_count.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quota_counters')
+    kind = models.CharField(max_length=30, help_text="Tipo de cuota (ej: 'ai_requests', 'documents')")
+    window_start = models.BigIntegerField(default=0, help_text="Número de la ventana actual (0 si no tiene ventana)")
+    current_count = models.PositiveIntegerField(default=0)
+    previous_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='api_quota_counter_key'),
+        ]
+
+    def __str__(self):
+        return f"Cuota {self.kind} de {self.user_id}: {self.current_count}"
+
+
+class LLMCacheEntry(models.Model):
+    """
+    Respuesta de Gemini ya calculada (resúmenes, mapas conceptuales, carpetas y
+    etiquetas sugeridas), reutilizable mientras el texto enviado sea el mismo
+    (api/llm_cache.py).
+    """
+    operation = models.CharField(max_length=30, help_text="Operación (ej: 'summarize', 'mindmap', 'tag')")
+    model_name = models.CharField(max_length=100)
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 del texto enviado al modelo")
+    params_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 de los parámetros extra")
+    response = models.TextField()
+    document = models.ForeignKey(
+        Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Documento del que salió el texto (para invalidar al cambiar su contenido)")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['operation', 'model_name', 'content_hash', 'params_hash'],
+                name='api_llm_cache_key'),
+        ]
+        indexes = [
+            models.Index(fields=['last_used_at'], name='api_llm_cache_lru_idx'),
+        ]
+
+    def __str__(self):
+        return f"Respuesta en caché {self.operation} {self.content_hash[:12]}"
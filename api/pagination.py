@@ -0,0 +1,144 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Paginación por cursor (keyset) sobre (modified_at, id).
+
+    El cursor guarda los valores de ordenación del último elemento servido, así que
+    la página siguiente se obtiene con un WHERE (modified_at, id) < (...) que no se
+    desplaza cuando se suben documentos nuevos mientras se pagina. Para los
+    documentos propios lo resuelve el índice (owner, -modified_at, -id) de Document
+    sin ordenar toda la tabla.
+    Si la consulta viene ordenada por relevancia (búsqueda de texto completo con la
+    anotación 'rank'), el rank se antepone a la ordenación del cursor. Ese rank
+    tiene que ser un valor exacto (api/search.py lo redondea a entero): con un
+    float, el valor del cursor no vuelve igual y se repetirían filas.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-modified_at', '-id')
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.current_ordering = self.get_ordering(queryset)
+
+        cursor = self.decode_cursor(request)
+        reverse = False
+        if cursor is not None:
+            values, reverse = cursor
+            queryset = queryset.filter(self._keyset_filter(values, reverse))
+
+        ordering = self.current_ordering
+        if reverse:
+            ordering = [self._invert(field) for field in ordering]
+
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        if 'rank' in queryset.query.annotations:
+            return ('-rank',) + tuple(self.ordering)
+        return tuple(self.ordering)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Página vacía tras un cursor: volver al principio
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    # --- Codificación del cursor ---
+
+    def encode_cursor(self, obj, reverse):
+        values = [self._cursor_value(obj, field) for field in self.current_ordering]
+        payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+            values, reverse = payload['v'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.current_ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def _cursor_value(obj, field):
+        value = getattr(obj, field.lstrip('-'))
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    # --- Construcción del filtro keyset ---
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _keyset_filter(self, values, reverse):
+        """
+        Para ordenación (a DESC, b DESC) y avance: a < va OR (a = va AND b < vb).
+        Al retroceder (reverse) se invierten las comparaciones.
+        """
+        condition = Q()
+        equal_prefix = Q()
+        for field, value in zip(self.current_ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'gt' if descending == reverse else 'lt'
+            condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+            equal_prefix &= Q(**{name: value})
+        return condition
@@ -0,0 +1,202 @@
+"""
+Generación de PDFs en streaming con memoria acotada.
+
+A diferencia de SimpleDocTemplate (que guarda toda la 'story' y el documento en
+memoria), aquí cada página se compone y se escribe en cuanto se llena: solo se
+conservan los desplazamientos de los objetos para la tabla xref final.
+Se usan las fuentes estándar Helvetica (sin incrustar) y las métricas de
+reportlab para partir las líneas.
+"""
+import zlib
+from array import array
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models.functions import Substr
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.lib.utils import simpleSplit
+
+from .models import Document
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = inch
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+
+TITLE_FONT, TITLE_SIZE, TITLE_LEADING, TITLE_SPACE_AFTER = 'Helvetica-Bold', 16, 19, 12 + 0.2 * inch
+BODY_FONT, BODY_SIZE, BODY_LEADING, PARAGRAPH_SPACE = 'Helvetica', 11, 14, 0.1 * inch
+
+# Nombre del recurso de fuente en el PDF para cada fuente estándar
+FONT_RESOURCES = {'Helvetica': b'F1', 'Helvetica-Bold': b'F2'}
+
+# Objetos fijos: 1 catálogo, 2 árbol de páginas, 3 y 4 fuentes. Las páginas empiezan en 5.
+CATALOG_ID, PAGES_ID, FONT_REGULAR_ID, FONT_BOLD_ID = 1, 2, 3, 4
+
+TEXT_CHUNK_SIZE = 1024 * 1024
+XREF_BATCH = 256
+
+
+def _pdf_string(text):
+    """Codifica texto como cadena literal PDF (WinAnsi, con los caracteres especiales escapados)."""
+    raw = text.encode('cp1252', errors='replace')
+    return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class StreamingPdfWriter:
+    """Escribe objetos PDF de forma incremental y recuerda sus desplazamientos."""
+
+    def __init__(self):
+        self.position = 0
+        # offsets[i] = posición del objeto i + 1 (los números de objeto son consecutivos)
+        self.offsets = array('Q', [0] * FONT_BOLD_ID)
+        self.page_ids = array('Q')
+        self.next_id = FONT_BOLD_ID + 1
+
+    def _object(self, object_id, body):
+        if object_id > len(self.offsets):
+            self.offsets.append(0)
+        self.offsets[object_id - 1] = self.position
+        data = b'%d 0 obj\n' % object_id + body + b'\nendobj\n'
+        self.position += len(data)
+        return data
+
+    def header(self):
+        data = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.position += len(data)
+        return data
+
+    def page(self, content):
+        """Devuelve los bytes de una página completa (flujo de contenido + objeto página)."""
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+
+        stream = zlib.compress(content)
+        data = self._object(
+            content_id,
+            b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        data += self._object(
+            page_id,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>'
+            % (PAGES_ID, PAGE_WIDTH, PAGE_HEIGHT, content_id, FONT_REGULAR_ID, FONT_BOLD_ID))
+        return data
+
+    def trailer(self):
+        """Árbol de páginas, catálogo, fuentes, tabla xref y trailer (la xref, por tramos)."""
+        kids = b' '.join([b'%d 0 R' % page_id for page_id in self.page_ids])
+        data = self._object(
+            PAGES_ID, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)))
+        data += self._object(CATALOG_ID, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_ID)
+        for object_id, font in ((FONT_REGULAR_ID, b'Helvetica'), (FONT_BOLD_ID, b'Helvetica-Bold')):
+            data += self._object(
+                object_id,
+                b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % font)
+
+        xref_position = self.position
+        size = self.next_id
+        yield data + b'xref\n0 %d\n0000000000 65535 f \n' % size
+        for start in range(0, len(self.offsets), XREF_BATCH):
+            yield b''.join([b'%010d 00000 n \n' % offset
+                            for offset in self.offsets[start:start + XREF_BATCH]])
+        yield b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            size, CATALOG_ID, xref_position)
+
+
+class _PageBuilder:
+    """Acumula las operaciones de texto de una sola página."""
+
+    def __init__(self):
+        self.operations = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def fits(self, leading):
+        return self.y - leading >= MARGIN
+
+    def add_line(self, text, font, size, leading):
+        self.y -= leading
+        self.operations.append(
+            b'BT /%s %d Tf %.2f %.2f Td %s Tj ET'
+            % (FONT_RESOURCES[font], size, MARGIN, self.y, _pdf_string(text)))
+
+    def content(self):
+        return b'\n'.join(self.operations)
+
+
+def iter_pdf(title, lines):
+    """
+    Genera un PDF (en trozos de bytes, una página por trozo) con un título y las
+    líneas de texto indicadas. 'lines' puede ser un iterador perezoso.
+    """
+    writer = StreamingPdfWriter()
+    yield writer.header()
+
+    page = _PageBuilder()
+    for text in simpleSplit(title, TITLE_FONT, TITLE_SIZE, TEXT_WIDTH):
+        page.add_line(text, TITLE_FONT, TITLE_SIZE, TITLE_LEADING)
+    page.y -= TITLE_SPACE_AFTER
+
+    for line in lines:
+        if not line.strip():
+            continue
+        for text in simpleSplit(line, BODY_FONT, BODY_SIZE, TEXT_WIDTH):
+            if not page.fits(BODY_LEADING):
+                yield writer.page(page.content())
+                page = _PageBuilder()
+            page.add_line(text, BODY_FONT, BODY_SIZE, BODY_LEADING)
+        page.y -= PARAGRAPH_SPACE
+
+    yield writer.page(page.content())
+    yield from writer.trailer()
+
+
+def iter_document_lines(document_id, modified_at, chunk_size=TEXT_CHUNK_SIZE, max_line_length=TEXT_CHUNK_SIZE):
+    """
+    Lee extracted_content de la base de datos por trozos (SUBSTR) y lo devuelve línea
+    a línea, sin cargar nunca el texto completo. Si el documento cambia a mitad de
+    lectura se aborta, para no mezclar versiones.
+    """
+    queryset = Document.objects.filter(pk=document_id, modified_at=modified_at)
+    start = 1
+    pending = ''
+    while True:
+        chunk = queryset.annotate(
+            part=Substr('extracted_content', start, chunk_size)
+        ).values_list('part', flat=True).first()
+        if chunk is None:
+            raise RuntimeError(f"El documento {document_id} cambió durante la descarga.")
+        if not chunk:
+            break
+        start += chunk_size
+
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        yield from lines
+        if len(pending) > max_line_length:
+            # Línea enorme sin saltos: se entrega por partes para mantener la memoria acotada
+            yield pending
+            pending = ''
+    if pending:
+        yield pending
+
+
+def streaming_content(request, chunks):
+    """
+    Bajo ASGI (Daphne), Django consumiría un iterador síncrono entero antes de enviarlo;
+    se envuelve en un iterador asíncrono que pide cada trozo en el hilo síncrono.
+    """
+    if not isinstance(getattr(request, '_request', request), ASGIRequest):
+        return chunks
+
+    async def async_chunks():
+        next_chunk = sync_to_async(next)
+        try:
+            while True:
+                chunk = await next_chunk(chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            await sync_to_async(chunks.close)()
+
+    return async_chunks()
@@ -9,6 +9,14 @@ class IsOwnerOrHasPermission(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
+        # DocumentViewSet ya anota el permiso del usuario ('caller_permission')
+        if hasattr(obj, 'caller_permission'):
+            if obj.owner_id == request.user.id:
+                return True
+            if request.method in permissions.SAFE_METHODS:
+                return obj.caller_permission is not None
+            return obj.caller_permission == 'edit'
+
         # Los permisos de lectura (GET, HEAD, OPTIONS) son permitidos
         # si el usuario es el propietario o tiene cualquier permiso sobre el documento.
         if request.method in permissions.SAFE_METHODS:
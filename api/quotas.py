@@ -0,0 +1,173 @@
+"""
+Cuotas por plan: peticiones a la IA, mensajes de chat y documentos guardados.
+
+Los límites de cada plan están en settings.QUOTA_LIMITS (None = sin límite) y
+la ventana de cada cuota en settings.QUOTA_WINDOWS (segundos; las cuotas sin
+ventana, como los documentos, cuentan lo que el usuario tiene guardado).
+
+- consume() comprueba y suma en una sola sentencia (INSERT ... ON CONFLICT DO
+  UPDATE ... WHERE): no se lee el contador para escribirlo después, así que dos
+  peticiones simultáneas no pueden pasarse del límite ni pisarse el recuento.
+- Ventana deslizante aproximada: el uso es el recuento de la ventana actual más
+  el de la anterior ponderado por la parte de ella que aún cae dentro de los
+  últimos N segundos. No hay un "reinicio a medianoche" que permita gastar dos
+  cuotas seguidas.
+- QuotaBucket reserva unidades por lotes (QUOTA_LEASE_SIZE) para quien consume
+  muchas veces seguidas (una conexión de chat): la base de datos solo se toca al
+  agotar el lote, y lo que sobra se devuelve con release().
+"""
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, PositiveIntegerField, When
+from django.db.models.functions import Greatest
+
+from .models import QuotaCounter
+
+AI_REQUESTS = 'ai_requests'
+CHAT_MESSAGES = 'chat_messages'
+DOCUMENTS = 'documents'
+
+_CONSUME_SQL = """
+    INSERT INTO api_quotacounter AS q (user_id, kind, window_start, current_count, previous_count)
+    VALUES (%(user_id)s, %(kind)s, %(window)s, %(amount)s, 0)
+    ON CONFLICT (user_id, kind) DO UPDATE SET
+        previous_count = CASE WHEN q.window_start = %(window)s THEN q.previous_count
+                              WHEN q.window_start = %(window)s - 1 THEN q.current_count
+                              ELSE 0 END,
+        current_count = CASE WHEN q.window_start = %(window)s THEN q.current_count ELSE 0 END + %(amount)s,
+        window_start = %(window)s
+"""
+
+_LIMIT_CONDITION = """
+    WHERE (CASE WHEN q.window_start = %(window)s THEN q.current_count ELSE 0 END) + %(amount)s
+          + (CASE WHEN q.window_start = %(window)s THEN q.previous_count
+                  WHEN q.window_start = %(window)s - 1 THEN q.current_count
+                  ELSE 0 END) * %(weight)s
+          <= %(limit)s
+"""
+
+
+def limit_for(plan, kind):
+    """Límite de la cuota para el plan (None = sin límite). Un plan desconocido usa el de 'free'."""
+    limits = settings.QUOTA_LIMITS
+    return limits.get(plan, limits['free']).get(kind)
+
+
+def _window(kind, now=None):
+    """(número de ventana, peso de la ventana anterior) en este momento."""
+    length = settings.QUOTA_WINDOWS.get(kind)
+    if not length:
+        return 0, 0.0
+    now = time.time() if now is None else now
+    index, elapsed = divmod(now, length)
+    return int(index), 1.0 - elapsed / length
+
+
+def consume(user_id, kind, plan, amount=1):
+    """
+    Suma 'amount' al uso si cabe en el límite del plan. Devuelve False (sin
+    contar nada) si se pasaría. Una sola sentencia, sin bloqueos previos.
+    """
+    return _consume(user_id, kind, limit_for(plan, kind), amount) is not None
+
+
+def add(user_id, kind, amount=1):
+    """Suma al uso sin comprobar el límite (p. ej. documentos que crea el asistente)."""
+    _consume(user_id, kind, None, amount)
+
+
+def _consume(user_id, kind, limit, amount):
+    """Número de ventana en la que se contó, o None si no cabía."""
+    if limit is not None and amount > limit:
+        return None
+    window, weight = _window(kind)
+    params = {'user_id': user_id, 'kind': kind, 'window': window, 'amount': amount,
+              'weight': weight, 'limit': limit}
+    sql = _CONSUME_SQL
+    if limit is not None:
+        sql += _LIMIT_CONDITION
+    with connection.cursor() as cursor:
+        cursor.execute(sql + ' RETURNING q.window_start', params)
+        row = cursor.fetchone()
+    return None if row is None else window
+
+
+def release(user_id, kind, amount=1, window=None):
+    """
+    Devuelve unidades contadas en la ventana 'window' (por defecto la actual):
+    una subida que falló, un documento borrado o lo que sobró de un QuotaBucket.
+    """
+    if window is None:
+        window, _ = _window(kind)
+    def minus(field):
+        return Greatest(F(field) - amount, 0, output_field=PositiveIntegerField())
+
+    # Si la ventana ya avanzó, lo reservado está en previous_count
+    QuotaCounter.objects.filter(user_id=user_id, kind=kind).update(
+        current_count=Case(When(window_start=window, then=minus('current_count')), default=F('current_count')),
+        previous_count=Case(When(window_start=window + 1, then=minus('previous_count')), default=F('previous_count')),
+    )
+
+
+def usage(user_id, kind):
+    """Uso actual de la cuota (con la ventana anterior ponderada), redondeado hacia abajo."""
+    counter = QuotaCounter.objects.filter(user_id=user_id, kind=kind).values(
+        'window_start', 'current_count', 'previous_count').first()
+    if counter is None:
+        return 0
+    window, weight = _window(kind)
+    if counter['window_start'] == window:
+        return int(counter['current_count'] + counter['previous_count'] * weight)
+    if counter['window_start'] == window - 1:
+        return int(counter['current_count'] * weight)
+    return 0
+
+
+class QuotaBucket:
+    """
+    Unidades de una cuota reservadas por lotes para un solo consumidor. take()
+    gasta una unidad local y solo consulta la base de datos al agotarse el lote.
+    Un lote no pasa de un cuarto del límite, y cerca del límite se reduce a la
+    mitad hasta reservar lo que quede.
+    """
+
+    def __init__(self, user_id, kind, plan, lease_size=None):
+        self.user_id = user_id
+        self.kind = kind
+        self.limit = limit_for(plan, kind)
+        self.lease_size = lease_size or getattr(settings, 'QUOTA_LEASE_SIZE', 10)
+        self.tokens = 0
+        self.window = None
+
+    @property
+    def needs_refill(self):
+        """True si el siguiente take() tiene que ir a la base de datos."""
+        return self.limit is not None and self.tokens == 0
+
+    def take(self):
+        if self.limit is None:
+            return True
+        if self.tokens == 0 and not self._refill():
+            return False
+        self.tokens -= 1
+        return True
+
+    def _refill(self):
+        # Como mucho un cuarto del límite: otra conexión del mismo usuario (otra
+        # pestaña, otra sala) también tiene que poder reservar
+        amount = min(self.lease_size, max(1, self.limit // 4))
+        while amount >= 1:
+            window = _consume(self.user_id, self.kind, self.limit, amount)
+            if window is not None:
+                self.tokens, self.window = amount, window
+                return True
+            amount //= 2
+        return False
+
+    def release(self):
+        """Devuelve las unidades reservadas que no se usaron."""
+        if self.tokens:
+            tokens, self.tokens = self.tokens, 0
+            release(self.user_id, self.kind, tokens, window=self.window)
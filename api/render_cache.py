@@ -0,0 +1,115 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+# Evita que dos evicciones simultáneas del mismo proceso compitan por los mismos archivos
+_eviction_lock = threading.Lock()
+
+
+def cache_dir():
+    path = getattr(settings, 'RENDER_CACHE_DIR')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_key(document_id, modified_at, file_format):
+    """Clave del artefacto: cambia en cuanto el documento se modifica."""
+    raw = f'{document_id}:{modified_at.isoformat()}:{file_format}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _path_for(key, file_format):
+    return os.path.join(cache_dir(), f'{key}.{file_format}')
+
+
+def open_cached(key, file_format):
+    """
+    Abre el artefacto en caché (y lo marca como usado) o devuelve None. Se abre
+    antes de nada: si otra evicción lo borra después, el archivo abierto sigue
+    pudiéndose leer.
+    """
+    path = _path_for(key, file_format)
+    try:
+        cached = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        # La fecha de modificación hace de 'último uso' para la evicción LRU
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return cached
+
+
+def put(key, file_format, write):
+    """
+    Genera el artefacto llamando a write(archivo) y lo guarda de forma atómica
+    (archivo temporal + os.replace). Devuelve el artefacto abierto para leerlo:
+    se abre antes de evictar, y la evicción de esta llamada no lo toca.
+    """
+    directory = cache_dir()
+    handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            write(output)
+        path = _path_for(key, file_format)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    cached = open(path, 'rb')
+    evict(keep=path)
+    return cached
+
+
+def stream_put(key, file_format, chunks):
+    """
+    Reenvía los trozos de 'chunks' a quien los consuma y a la vez los escribe en la
+    caché. El artefacto solo se publica (os.replace) si el flujo termina completo;
+    si el cliente se desconecta o la generación falla, se descarta el temporal.
+    """
+    handle, tmp_path = tempfile.mkstemp(dir=cache_dir(), suffix='.tmp')
+    published = False
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                yield chunk
+        os.replace(tmp_path, _path_for(key, file_format))
+        published = True
+    finally:
+        if not published and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    evict()
+
+
+def evict(max_bytes=None, keep=None):
+    """
+    Borra los artefactos usados hace más tiempo hasta quedar bajo
+    RENDER_CACHE_MAX_BYTES, salvo 'keep' (el que se acaba de generar).
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'RENDER_CACHE_MAX_BYTES')
+    with _eviction_lock:
+        entries = []
+        total = 0
+        with os.scandir(cache_dir()) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith('.tmp') or entry.path == keep:
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,133 @@
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import BigIntegerField, Case, F, Func, OuterRef, Q, Subquery, TextField, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Document, Profile, Tag
+
+# Configuraciones de PostgreSQL para cada idioma de Profile.language_preference
+SEARCH_CONFIGS = {
+    'es': 'spanish',
+    'en': 'english',
+    'fr': 'french',
+    'de': 'german',
+    'pt': 'portuguese',
+    'it': 'italian',
+}
+DEFAULT_SEARCH_CONFIG = 'simple'
+
+# Modos aceptados en ?search_mode= (se corresponden con los de SearchQuery)
+SEARCH_MODES = ('websearch', 'plain', 'phrase')
+
+# ts_rank es un float4 que no sobrevive exacto al viaje por el cursor (JSON/float8):
+# se pagina sobre el rank multiplicado por RANK_SCALE y redondeado a entero
+RANK_SCALE = 1000000.0
+
+
+def search_config_for_language(language):
+    """Devuelve la configuración de texto de PostgreSQL para un código de idioma."""
+    return SEARCH_CONFIGS.get((language or '').lower(), DEFAULT_SEARCH_CONFIG)
+
+
+def search_config_for_user(user):
+    """Devuelve la configuración de búsqueda según el idioma preferido del usuario."""
+    try:
+        return search_config_for_language(user.profile.language_preference)
+    except Profile.DoesNotExist:
+        return DEFAULT_SEARCH_CONFIG
+
+
+def owner_search_config():
+    """
+    Expresión SQL con la configuración de búsqueda de cada documento: la del
+    idioma de su propietario, que es con la que se calculó su search_vector.
+    """
+    return Case(*(When(owner__profile__language_preference__iexact=language, then=Value(config))
+                  for language, config in SEARCH_CONFIGS.items()),
+                default=Value(DEFAULT_SEARCH_CONFIG), output_field=TextField())
+
+
+def _filename_terms():
+    """Expresión SQL que convierte 'user_1/Mi_informe-final.pdf' en 'Mi informe final pdf'."""
+    # Los archivos en el almacén por contenido se llaman por su hash: usar el nombre original
+    name = Coalesce(NullIf(F('original_name'), Value('')), F('file'), output_field=TextField())
+    base_name = Func(name, Value('^.*/'), Value(''), function='regexp_replace')
+    return Func(base_name, Value(r'[\W_]+'), Value(' '), Value('g'),
+                function='regexp_replace', output_field=TextField())
+
+
+def update_search_vector(document_ids):
+    """
+    Recalcula el tsvector de los documentos indicados.
+
+    Pesos: nombre de archivo (A) > etiquetas (B) > contenido extraído (C).
+    Todo se calcula en la base de datos (una sentencia UPDATE por idioma),
+    así el contenido extraído nunca viaja a Python.
+    """
+    document_ids = list(document_ids)
+    if not document_ids:
+        return
+
+    ids_by_config = defaultdict(list)
+    rows = Document.objects.filter(pk__in=document_ids).values_list(
+        'id', 'owner__profile__language_preference')
+    for document_id, language in rows:
+        ids_by_config[search_config_for_language(language)].append(document_id)
+
+    tag_names = Tag.objects.filter(documents=OuterRef('pk')).values(
+        'documents').annotate(names=StringAgg('name', delimiter=' ')).values('names')
+
+    for config, ids in ids_by_config.items():
+        Document.objects.filter(pk__in=ids).update(
+            search_vector=(
+                SearchVector(_filename_terms(), weight='A', config=config)
+                + SearchVector(
+                    Coalesce(Subquery(tag_names), Value(''), output_field=TextField()),
+                    weight='B', config=config)
+                + SearchVector('extracted_content', weight='C', config=config)
+            )
+        )
+
+
+def reindex_user_documents(user):
+    """Recalcula el índice de todos los documentos de un usuario (ej: al cambiar de idioma)."""
+    update_search_vector(
+        Document.objects.filter(owner=user).values_list('id', flat=True))
+
+
+class DocumentFullTextSearchFilter(BaseFilterBackend):
+    """
+    UC-15: Búsqueda de texto completo sobre Document.search_vector.
+
+    Usa ?search=<términos> y, opcionalmente, ?search_mode=websearch|plain|phrase.
+    Los resultados se ordenan por relevancia (rank) y luego por fecha de modificación.
+    """
+    search_param = 'search'
+    search_mode_param = 'search_mode'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms:
+            return queryset
+
+        search_mode = request.query_params.get(self.search_mode_param, 'websearch')
+        if search_mode not in SEARCH_MODES:
+            search_mode = 'websearch'
+
+        # Cada documento se indexó con la configuración del idioma de su propietario
+        # (que puede no ser el de quien busca, en los compartidos): se compara con la
+        # consulta en esa misma configuración. Cada rama usa una consulta constante,
+        # así que el índice GIN sigue sirviendo (una rama por configuración).
+        queryset = queryset.annotate(search_config=owner_search_config())
+        matches = Q()
+        for config in sorted(set(SEARCH_CONFIGS.values()) | {DEFAULT_SEARCH_CONFIG}):
+            matches |= Q(search_config=config,
+                         search_vector=SearchQuery(terms, config=config, search_type=search_mode))
+
+        query = SearchQuery(terms, config=F('search_config'), search_type=search_mode)
+        return queryset.filter(matches).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query) * Value(RANK_SCALE), BigIntegerField())
+        ).order_by('-rank', '-modified_at', '-id')
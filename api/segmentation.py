@@ -0,0 +1,66 @@
+"""
+Segmentación de textos largos para traducirlos (y resumirlos) por partes.
+
+El texto se corta por párrafos (saltos de línea) y cada párrafo por frases;
+una frase enorme se corta por el último espacio antes del límite. Cada unidad
+guarda el separador que la seguía, así que ''.join(texto + separador)
+reconstruye el original exactamente.
+
+Las frases son la unidad de la memoria de traducción (api/translation_memory.py).
+"""
+import re
+
+# Fin de frase: puntuación final seguida de espacios
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…;:])\s+')
+
+
+def _split_long_piece(piece, max_chars):
+    """Corta un trozo sin fin de frase en partes de max_chars como mucho (por espacios si es posible)."""
+    units = []
+    while len(piece) > max_chars:
+        cut = piece.rfind(' ', 0, max_chars + 1)
+        if cut <= 0:
+            units.append((piece[:max_chars], ''))
+            piece = piece[max_chars:]
+        else:
+            units.append((piece[:cut], ' '))
+            piece = piece[cut + 1:]
+    units.append((piece, ''))
+    return units
+
+
+def _split_sentences(paragraph, max_chars):
+    """Unidades (frase, separador) de un párrafo; las frases mayores que max_chars se cortan."""
+    units = []
+    position = 0
+    for match in SENTENCE_BOUNDARY.finditer(paragraph):
+        units.extend(_with_separator(
+            _split_long_piece(paragraph[position:match.start()], max_chars), match.group()))
+        position = match.end()
+    units.extend(_split_long_piece(paragraph[position:], max_chars))
+    return units
+
+
+def _with_separator(units, separator):
+    """Sustituye el separador de la última unidad (el que seguía al trozo completo)."""
+    *head, (text, _) = units
+    return head + [(text, separator)]
+
+
+def sentence_units(text, max_chars):
+    """
+    Divide el texto en frases (siempre, aunque el párrafo quepa entero), ninguna
+    mayor que max_chars. Devuelve una lista de (frase, separador); es la unidad
+    de la memoria de traducción.
+    """
+    units = []
+    paragraphs = text.split('\n')
+    for index, paragraph in enumerate(paragraphs):
+        separator = '\n' if index < len(paragraphs) - 1 else ''
+        units.extend(_with_separator(_split_sentences(paragraph, max_chars), separator))
+    return units
+
+
+def join_segments(texts, segments):
+    """Reensambla los textos (uno por segmento, en orden) con los separadores originales."""
+    return ''.join(text + separator for text, (_, separator) in zip(texts, segments))
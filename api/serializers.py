@@ -1,5 +1,8 @@
+from collections import defaultdict
+
 from rest_framework import serializers
-from .models import Profile, Folder, Document, Tag, DocumentPermission, TranslationHistory
+from .translation_backends import selectable_backends
+from .models import BackgroundJob, Profile, Folder, Document, Tag, DocumentPermission, TranslationHistory
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -10,8 +13,38 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = Profile
         fields = ['language_preference', 'subscription_plan', 'preferred_translation_api']
 
+    def validate_preferred_translation_api(self, value):
+        allowed = selectable_backends()
+        if value not in allowed:
+            raise serializers.ValidationError(
+                f"Backend de traducción no disponible. Opciones: {', '.join(sorted(allowed))}.")
+        return value
+
+def group_folders_by_parent(folders):
+    """
+    Agrupa una lista plana de carpetas por 'parent_id' para construir el árbol en memoria.
+    El resultado se pasa a FolderSerializer en el contexto como 'folder_children'.
+    """
+    children = defaultdict(list)
+    for folder in folders:
+        children[folder.parent_id].append(folder)
+    return children
+
+
+class FolderChildrenListSerializer(serializers.ListSerializer):
+    """Lee las subcarpetas del árbol precargado en el contexto, si existe."""
+    def get_attribute(self, instance):
+        children = self.context.get('folder_children')
+        if children is not None:
+            return children.get(instance.id, [])
+        return super().get_attribute(instance)
+
+
 class RecursiveFolderSerializer(serializers.Serializer):
     """Un serializer simple para mostrar hijos de forma recursiva."""
+    class Meta:
+        list_serializer_class = FolderChildrenListSerializer
+
     def to_representation(self, value):
         # Llama al serializer principal (FolderSerializer) para renderizar el hijo
         serializer = self.parent.parent.__class__(value, context=self.context)
@@ -30,9 +63,21 @@ class FolderSerializer(serializers.ModelSerializer):
         # ¡AÑADIR 'subfolders' A LOS CAMPOS!
         fields = ['id', 'name', 'owner', 'parent', 'created_at', 'subfolders']
 
+    def validate_parent(self, parent):
+        """La carpeta padre debe ser del usuario y no puede estar dentro de la propia carpeta."""
+        if parent is None:
+            return parent
+        request = self.context.get('request', None)
+        if request and parent.owner_id != request.user.id:
+            raise serializers.ValidationError("La carpeta padre no existe.")
+        if self.instance and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError("No puedes mover una carpeta dentro de sí misma.")
+        return parent
+
 class DocumentSerializer(serializers.ModelSerializer):
     """Serializer para el modelo Document."""
     owner = serializers.ReadOnlyField(source='owner.username')
+    name = serializers.ReadOnlyField(source='display_name')
     file_url = serializers.SerializerMethodField(read_only=True)
     preview_url = serializers.SerializerMethodField(read_only=True)
     permission_level = serializers.SerializerMethodField()
@@ -40,14 +85,15 @@ class DocumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Document
-        fields = ['id', 'owner', 'folder', 'file', 'file_url',
+        fields = ['id', 'owner', 'name', 'folder', 'file', 'file_url',
                   'preview_url', 'uploaded_at', 'tags',
                   'extracted_content', 
+                  'extraction_status',
                   'permission_level', 
                   'is_shared','modified_at']
         read_only_fields = [
-            'uploaded_at', 'owner', 'file_url', 
-            'preview_url', 'permission_level', 'is_shared','modified_at'
+            'uploaded_at', 'owner', 'name', 'file_url', 
+            'preview_url', 'extraction_status', 'permission_level', 'is_shared','modified_at'
         ]
 
     # --- INICIO DE LAS FUNCIONES QUE FALTABAN ---
@@ -68,16 +114,17 @@ class DocumentSerializer(serializers.ModelSerializer):
         request = self.context.get('request', None)
         if not request or not request.user.is_authenticated:
             return None
-        if obj.owner == request.user:
+        if obj.owner_id == request.user.id:
             return "PROPIETARIO"
-        try:
-            permission = DocumentPermission.objects.get(document=obj, user=request.user)
-            if permission.permission_level == 'edit':
-                return "EDITOR"
-            else:
-                return "LECTOR"
-        except DocumentPermission.DoesNotExist:
+        # DocumentViewSet anota 'caller_permission'; fuera de él se consulta directamente
+        if hasattr(obj, 'caller_permission'):
+            permission_level = obj.caller_permission
+        else:
+            permission_level = DocumentPermission.objects.filter(
+                document=obj, user=request.user).values_list('permission_level', flat=True).first()
+        if permission_level is None:
             return None
+        return "EDITOR" if permission_level == 'edit' else "LECTOR"
 
     def get_is_shared(self, obj):
         """
@@ -87,11 +134,23 @@ class DocumentSerializer(serializers.ModelSerializer):
         if not request or not request.user.is_authenticated:
             return False
         
-        if obj.owner == request.user:
+        if obj.owner_id == request.user.id:
+            if hasattr(obj, 'has_shares'):
+                return obj.has_shares
             return DocumentPermission.objects.filter(document=obj).exists()
         
         return False
 
+class DocumentListSerializer(DocumentSerializer):
+    """
+    Variante ligera para el listado: omite 'extracted_content', que puede pesar
+    varios MB por documento. El detalle sigue usando DocumentSerializer.
+    """
+    class Meta(DocumentSerializer.Meta):
+        fields = [field for field in DocumentSerializer.Meta.fields
+                  if field != 'extracted_content']
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Serializer para el modelo Tag."""
     class Meta:
@@ -104,7 +163,7 @@ class TranslationHistorySerializer(serializers.ModelSerializer):
     """
     # Usamos ReadOnlyField para mostrar información del usuario y documento sin permitir su modificación
     user = serializers.ReadOnlyField(source='user.username')
-    original_document_name = serializers.ReadOnlyField(source='original_document.file.name')
+    original_document_name = serializers.ReadOnlyField(source='original_document.display_name')
 
     class Meta:
         model = TranslationHistory
@@ -130,3 +189,13 @@ class DocumentPermissionSerializer(serializers.ModelSerializer):
     class Meta:
         model = DocumentPermission
         fields = ['id', 'user', 'user_id', 'permission_level']
+
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    """Estado de un trabajo en segundo plano (el traceback del error no se expone)."""
+
+    class Meta:
+        model = BackgroundJob
+        fields = ['id', 'kind', 'status', 'progress_done', 'progress_total',
+                  'result', 'attempts', 'created_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,143 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import assistant_context, llm_cache, quotas, token_cache
+from .blobs import release_blob
+from .models import Document, Folder, Profile, Tag
+from .search import update_search_vector
+
+
+# --- UC-15: Mantenimiento del índice de búsqueda de texto completo ---
+
+@receiver(post_save, sender=Document)
+def refresh_document_search_vector(sender, instance, **kwargs):
+    """Recalcula el índice cuando cambia el archivo o el contenido extraído."""
+    update_search_vector([instance.pk])
+
+
+@receiver(m2m_changed, sender=Document.tags.through)
+def refresh_search_vector_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recalcula el índice al asignar o quitar etiquetas (desde el documento o desde la etiqueta)."""
+    if action == 'pre_clear' and reverse:
+        # tag.documents.clear(): guardamos los documentos afectados antes de perderlos
+        instance._search_document_ids = list(
+            instance.documents.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        update_search_vector([instance.pk])
+    elif action == 'post_clear':
+        update_search_vector(getattr(instance, '_search_document_ids', []))
+    else:
+        update_search_vector(pk_set or [])
+
+
+@receiver(post_save, sender=Tag)
+def refresh_search_vector_on_tag_rename(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vector(instance.documents.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_documents(sender, instance, **kwargs):
+    instance._search_document_ids = list(
+        instance.documents.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_search_vector_on_tag_delete(sender, instance, **kwargs):
+    update_search_vector(getattr(instance, '_search_document_ids', []))
+
+
+# --- Caché de respuestas de Gemini: olvidar las de un contenido que ya no existe ---
+
+_NOT_LOADED = object()
+
+
+def _loaded_extracted_content(instance):
+    # Sin consultar la base de datos si el campo se difirió (.only()/.defer())
+    return instance.__dict__.get('extracted_content', _NOT_LOADED)
+
+
+@receiver(post_init, sender=Document)
+def remember_extracted_content(sender, instance, **kwargs):
+    instance._saved_extracted_content = _loaded_extracted_content(instance)
+
+
+@receiver(post_save, sender=Document)
+def invalidate_llm_responses(sender, instance, created, update_fields=None, **kwargs):
+    """Solo si el contenido extraído cambió de verdad (no al renombrar o mover el documento)."""
+    if not created and (update_fields is None or 'extracted_content' in update_fields) \
+            and instance.extracted_content != instance._saved_extracted_content:
+        llm_cache.invalidate_document(instance.pk)
+    instance._saved_extracted_content = _loaded_extracted_content(instance)
+
+
+# --- Almacén por contenido: liberar la referencia al blob al borrar el documento ---
+
+@receiver(post_delete, sender=Document)
+def release_document_blob(sender, instance, **kwargs):
+    release_blob(instance.blob_id)
+
+
+@receiver(post_delete, sender=Document)
+def release_document_quota(sender, instance, **kwargs):
+    """El documento borrado deja libre su hueco en la cuota de documentos (api/quotas.py)."""
+    quotas.release(instance.owner_id, quotas.DOCUMENTS)
+
+
+# --- Chat: las conexiones abiertas guardan el perfil en memoria (chat/consumers.py) ---
+
+def profile_group_name(user_id):
+    """Grupo de Channels de las conexiones de chat de un usuario."""
+    return f'profile_user_{user_id}'
+
+
+def notify_profile_changed(user_id):
+    """Pide a las conexiones de chat del usuario que recarguen su perfil."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(profile_group_name(user_id), {'type': 'profile.changed'})
+    except Exception as e:
+        print(f"No se pudo avisar del cambio de perfil del usuario {user_id}: {e}")
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_chat_profile_state(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: notify_profile_changed(instance.user_id))
+
+
+# --- Caché de tokens (api/token_cache.py) ---
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+# --- Catálogo de carpetas y etiquetas del asistente (api/assistant_context.py) ---
+
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_assistant_catalog(sender, instance, **kwargs):
+    assistant_context.invalidate_catalog(instance.owner_id)
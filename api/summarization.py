@@ -0,0 +1,128 @@
+"""
+Resúmenes de documentos largos con Gemini por map-reduce.
+
+- Los textos de hasta SUMMARY_CHUNK_CHARS caracteres se resumen en una llamada.
+- Los más largos se cortan en fragmentos por frases (api/segmentation.py), se
+  resume cada fragmento en paralelo (SUMMARY_WORKERS hilos) y después se unen
+  los resúmenes parciales en uno solo (si aún son demasiado largos, se vuelven
+  a resumir por partes, hasta MAX_REDUCE_DEPTH rondas; lo que siga sin caber
+  se recorta con un aviso en el log).
+- Los cortes dependen del contenido (se corta tras las frases cuyo hash cumple
+  una condición, una vez pasado el mínimo de tamaño), no de la posición: un
+  cambio pequeño solo altera su fragmento y, como mucho, el siguiente.
+- Los resúmenes parciales se guardan en la caché de respuestas
+  (api/llm_cache.py) sin asociarlos al documento, para que sigan valiendo
+  después de editarlo: al volver a resumir solo se piden los fragmentos nuevos.
+"""
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import llm_cache
+from .segmentation import sentence_units
+
+logger = logging.getLogger(__name__)
+
+# Se corta tras ~1 de cada BOUNDARY_DIVISOR frases una vez superado el tamaño mínimo
+BOUNDARY_DIVISOR = 8
+MAX_REDUCE_DEPTH = 3
+
+SUMMARY_PROMPT = "Resume el siguiente texto de manera concisa:\n\n{text}"
+CHUNK_PROMPT = ("Resume el siguiente fragmento de un documento más largo, conservando los datos "
+                "y conceptos clave:\n\n{text}")
+REDUCE_PROMPT = ("Estos son, en orden, los resúmenes de las partes de un documento. Únelos en un "
+                 "único resumen conciso y coherente:\n\n{text}")
+
+
+def _chunk_size():
+    return getattr(settings, 'SUMMARY_CHUNK_CHARS', 8000)
+
+
+def _is_boundary(sentence):
+    return zlib.crc32(sentence.strip().encode('utf-8')) % BOUNDARY_DIVISOR == 0
+
+
+def chunk_text(text, max_chars=None):
+    """
+    Fragmentos de como mucho max_chars caracteres, cortados siempre entre frases.
+    Un fragmento termina tras una frase "frontera" (según su hash) cuando ya
+    tiene al menos la mitad del tamaño, o antes de pasarse del máximo.
+    """
+    max_chars = max_chars or _chunk_size()
+    min_chars = max_chars // 2
+    chunks, current = [], ''
+    for sentence, separator in sentence_units(text, max_chars):
+        piece = sentence + separator
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ''
+        current += piece
+        if len(current) >= min_chars and _is_boundary(sentence):
+            chunks.append(current)
+            current = ''
+    if current.strip():
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+class _Summarizer:
+    """Llamadas a Gemini con la caché de respuestas; cuenta las que se hicieron de verdad."""
+
+    def __init__(self, model):
+        self.model = model
+        self.model_name = getattr(model, 'model_name', '')
+        self.model_calls = 0
+
+    def _generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    def generate_many(self, operation, template, texts):
+        """Respuestas (en orden) para cada texto; los que no están en caché se piden en paralelo."""
+        keys = [llm_cache.make_key(operation, self.model_name, text) for text in texts]
+        results = llm_cache.get_many(keys)
+        missing = [(key, text) for key, text in dict(zip(keys, texts)).items() if key not in results]
+        if missing:
+            workers = max(1, min(getattr(settings, 'SUMMARY_WORKERS', 4), len(missing)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Los hilos solo hablan con Gemini; la caché se guarda desde este hilo
+                responses = list(executor.map(
+                    lambda item: self._generate(template.format(text=item[1])), missing))
+            self.model_calls += len(missing)
+            llm_cache.put_many((key, response, None) for (key, _), response in zip(missing, responses))
+            results.update((key, response) for (key, _), response in zip(missing, responses))
+        return [results[key] for key in keys]
+
+    def reduce(self, summaries, depth=1):
+        joined = "\n\n".join(summary.strip() for summary in summaries)
+        if len(joined) > _chunk_size() and depth < MAX_REDUCE_DEPTH:
+            # Demasiados resúmenes para una sola llamada: otra ronda de map
+            summaries = self.generate_many('summarize_chunk', CHUNK_PROMPT, chunk_text(joined))
+            return self.reduce(summaries, depth + 1)
+        if len(joined) > _chunk_size():
+            # Tras MAX_REDUCE_DEPTH rondas los resúmenes siguen sin caber: se recorta el final
+            logger.warning("Resumen por partes: tras %s rondas se recortan %s de %s caracteres de los "
+                           "resúmenes parciales.", depth, len(joined) - _chunk_size(), len(joined))
+        return self.generate_many('summarize_reduce', REDUCE_PROMPT, [joined[:_chunk_size()]])[0]
+
+
+def summarize(model, text, document_id=None):
+    """
+    Resumen del texto. Devuelve (resumen, llamadas reales a Gemini).
+    El resumen final se asocia al documento (se invalida al cambiar su contenido).
+    """
+    key = llm_cache.make_key('summarize', getattr(model, 'model_name', ''), text)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached, 0
+
+    summarizer = _Summarizer(model)
+    if len(text) <= _chunk_size():
+        summary = summarizer._generate(SUMMARY_PROMPT.format(text=text))
+        summarizer.model_calls += 1
+    else:
+        chunk_summaries = summarizer.generate_many('summarize_chunk', CHUNK_PROMPT, chunk_text(text))
+        summary = summarizer.reduce(chunk_summaries)
+    llm_cache.put(key, summary, document_id=document_id)
+    return summary, summarizer.model_calls
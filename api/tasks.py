@@ -0,0 +1,72 @@
+from .auto_tagging import tag_all_documents
+from .blobs import remember_extracted_text
+from .jobs import register_job, update_job_progress
+from .models import Document, TranslationHistory
+from .text_extractor import extract_text
+from .translation import translate_document_text
+from .translation_backends import preferred_backend_for
+
+
+@register_job('extract_text')
+def extract_document_text(job):
+    """Extrae el texto de un documento subido y actualiza su estado de extracción."""
+    document = Document.objects.get(pk=job.payload['document_id'])
+    Document.objects.filter(pk=document.pk).update(
+        extraction_status=Document.EXTRACTION_RUNNING)
+
+    try:
+        content = extract_text(document, strict=True)
+    except Exception:
+        if job.is_last_attempt:
+            Document.objects.filter(pk=document.pk).update(
+                extraction_status=Document.EXTRACTION_FAILED)
+        raise
+
+    document.extracted_content = content or ''
+    document.extraction_status = Document.EXTRACTION_DONE
+    document.save(update_fields=['extracted_content', 'extraction_status', 'modified_at'])
+    if document.blob_id:
+        remember_extracted_text(document.blob_id, document.extracted_content)
+    return {'characters': len(document.extracted_content)}
+
+
+@register_job('translate_document')
+def translate_document(job):
+    """
+    Traduce el contenido de un documento por segmentos, informando del avance,
+    y guarda el resultado en el historial de traducciones.
+    """
+    payload = job.payload
+    document = Document.objects.get(pk=payload['document_id'])
+    result = translate_document_text(
+        document.extracted_content, payload['target_language'], payload.get('source_language'),
+        on_progress=lambda done, total: update_job_progress(job, done, total),
+        backend=preferred_backend_for(job.user))
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+
+    history = TranslationHistory.objects.create(
+        original_document=document,
+        user=job.user,
+        source_language=result['detected_source_language'] or '',
+        target_language=payload['target_language'],
+        translated_content=result['translated_text'],
+    )
+    return {
+        'translation_id': history.pk,
+        'detected_source_language': history.source_language,
+        # Frases servidas por la memoria de traducción (sin llamar al backend)
+        'reused_segments': result['reused_segments'],
+        'total_segments': result['total_segments'],
+        'reuse_ratio': result['reuse_ratio'],
+    }
+
+
+@register_job('tag_all_documents')
+def tag_all_user_documents(job):
+    """Etiqueta con Gemini todos los documentos del usuario, por lotes y en paralelo (api/auto_tagging.py)."""
+    from .gemini_service import GeminiAssistant  # Evita importar el SDK de Gemini al cargar los trabajos
+
+    return tag_all_documents(
+        job.user, GeminiAssistant(job.user).model,
+        on_progress=lambda done, total: update_job_progress(job, done, total))
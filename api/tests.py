@@ -1,10 +1,55 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .models import (BackgroundJob, Document, DocumentPermission, Folder, LLMCacheEntry, Profile, QuotaCounter,
+                     StoredBlob, Tag, TranslationCacheEntry, TranslationMemoryEntry)
+from .jobs import JOB_HANDLERS, claim_job, enqueue_job, run_job, work
+from . import (assistant_context, auto_tagging, llm_cache, pdf_stream, quotas, render_cache, segmentation, summarization,
+               text_extractor, translation, translation_backends, token_cache, translation_cache, translation_client,
+               translation_memory)
+from concurrent.futures import ThreadPoolExecutor
+from .views import DocumentViewSet
+from googletrans import Translator
+from unittest import mock
+from reportlab.pdfgen import canvas
+from pypdf import PdfReader
+import io
 import json
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from django.utils import timezone
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 
 # Create your tests here.
 
 
+
+def reset_translation_state(test):
+    """Vacía la caché en memoria y cierra los circuitos de los backends (estado global del proceso)."""
+    def reset():
+        translation_cache.clear_local()
+        for backend in translation_backends.BACKENDS.values():
+            backend.breaker.reset()
+    reset()
+    test.addCleanup(reset)
+
+
+def patch_google_backend(translate):
+    """Sustituye la llamada de red del backend de Google; 'translate' devuelve (texto, idioma) o lanza."""
+    return mock.patch.object(
+        translation_backends.BACKENDS['google_translate'], 'translate', side_effect=translate)
+
+
 class ApiEndpointTests(TestCase):
 
     def setUp(self):
@@ -24,3 +69,1369 @@ class ApiEndpointTests(TestCase):
             'message': '¡Hola desde el backend de Django!', 'status': 'ok'}
         self.assertJSONEqual(
             str(response.content, encoding='utf8'), expected_data)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DocumentSearchTests(TestCase):
+    """UC-15: Búsqueda de texto completo sobre /api/documents/?search=."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _create_document(self, filename, content=''):
+        return Document.objects.create(
+            owner=self.user,
+            file=ContentFile(content.encode('utf-8'), name=filename),
+            extracted_content=content,
+        )
+
+    def _search(self, terms):
+        response = self.client.get(reverse('document-list'), {'search': terms})
+        self.assertEqual(response.status_code, 200)
+        return [doc['id'] for doc in response.data['results']]
+
+    def test_search_uses_spanish_stemming(self):
+        doc = self._create_document('notas.txt', 'Los contratos fueron traducidos ayer.')
+        self._create_document('otro.txt', 'Nada relevante por aquí.')
+
+        self.assertEqual(self._search('contrato traducido'), [doc.id])
+
+    def test_filename_ranks_above_tags_and_content(self):
+        in_content = self._create_document('notas.txt', 'Este texto habla de un presupuesto.')
+        in_tag = self._create_document('varios.txt', 'Sin relación.')
+        in_tag.tags.add(Tag.objects.create(name='presupuesto', owner=self.user))
+        in_name = self._create_document('presupuesto_2025.txt', 'Cifras.')
+
+        self.assertEqual(self._search('presupuesto'), [in_name.id, in_tag.id, in_content.id])
+
+    def test_search_results_page_without_repeating_rows(self):
+        documents = [self._create_document(f'notas_{i}.txt', 'presupuesto ' * (1 + i % 3) + 'y otras cosas')
+                     for i in range(7)]
+
+        seen, params = [], {'search': 'presupuesto', 'page_size': 2}
+        next_url = reverse('document-list')
+        while next_url:
+            page = self.client.get(next_url, params).data
+            params = None
+            seen += [doc['id'] for doc in page['results']]
+            next_url = page['next']
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {doc.id for doc in documents})
+
+    def test_tag_rename_refreshes_index(self):
+        doc = self._create_document('varios.txt', 'Sin relación.')
+        tag = Tag.objects.create(name='borrador', owner=self.user)
+        doc.tags.add(tag)
+        tag.name = 'factura'
+        tag.save()
+
+        self.assertEqual(self._search('factura'), [doc.id])
+        self.assertEqual(self._search('borrador'), [])
+
+    def test_shared_documents_are_searched_in_their_owner_language(self):
+        owner = User.objects.create_user(username='john', password='clave-segura-123')
+        Profile.objects.filter(user=owner).update(language_preference='en')
+        shared = Document.objects.create(
+            owner=owner, file=ContentFile(b'x', name='notes.txt'), extracted_content='The contracts were running late.')
+        DocumentPermission.objects.create(document=shared, user=self.user, permission_level='view')
+        own = self._create_document('notas.txt', 'Los contratos fueron traducidos ayer.')
+
+        # 'runs' solo coincide con 'running' con el stemming inglés del propietario
+        self.assertEqual(self._search('runs'), [shared.id])
+        self.assertEqual(self._search('contrato traducido'), [own.id])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DocumentPaginationTests(TestCase):
+    """Paginación por cursor del listado de documentos."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='luis', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.documents = [
+            Document.objects.create(
+                owner=self.user,
+                file=ContentFile(b'x', name=f'doc_{i}.txt'),
+                extracted_content=f'Contenido {i}',
+            )
+            for i in range(5)
+        ]
+
+    def test_cursor_pages_are_stable_when_rows_are_added(self):
+        url = reverse('document-list')
+        first = self.client.get(url, {'page_size': 2}).data
+        self.assertEqual([d['id'] for d in first['results']],
+                         [self.documents[4].id, self.documents[3].id])
+
+        # Un documento nuevo no debe desplazar las páginas siguientes
+        Document.objects.create(owner=self.user, file=ContentFile(b'x', name='nuevo.txt'))
+
+        seen = [d['id'] for d in first['results']]
+        next_url = first['next']
+        while next_url:
+            page = self.client.get(next_url).data
+            seen += [d['id'] for d in page['results']]
+            next_url = page['next']
+
+        self.assertEqual(seen, [doc.id for doc in reversed(self.documents)])
+
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+
+    def test_list_omits_content_unless_requested(self):
+        url = reverse('document-list')
+        listed = self.client.get(url).data['results'][0]
+        self.assertNotIn('extracted_content', listed)
+
+        with_content = self.client.get(url, {'include_content': 'true'}).data['results'][0]
+        self.assertEqual(with_content['extracted_content'], 'Contenido 4')
+
+        detail = self.client.get(reverse('document-detail', args=[self.documents[0].id])).data
+        self.assertEqual(detail['extracted_content'], 'Contenido 0')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DocumentListQueryCountTests(TestCase):
+    """El listado de documentos no debe lanzar consultas por fila."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='eva', password='clave-segura-123')
+        self.other = User.objects.create_user(username='raul', password='clave-segura-123')
+        tag = Tag.objects.create(name='informe', owner=self.user)
+        for i in range(6):
+            own = Document.objects.create(
+                owner=self.user, file=ContentFile(b'x', name=f'propio_{i}.txt'))
+            own.tags.add(tag)
+            DocumentPermission.objects.create(document=own, user=self.other, permission_level='view')
+            shared = Document.objects.create(
+                owner=self.other, file=ContentFile(b'x', name=f'ajeno_{i}.txt'))
+            DocumentPermission.objects.create(
+                document=shared, user=self.user, permission_level='edit' if i % 2 else 'view')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        url = reverse('document-list')
+        for page_size in (2, 12):
+            # 1 consulta para documentos (con permiso, compartido y propietario) + 1 para etiquetas
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+
+        levels = {doc['permission_level'] for doc in response.data['results']}
+        self.assertEqual(levels, {'PROPIETARIO', 'EDITOR', 'LECTOR'})
+        owned = [doc for doc in response.data['results'] if doc['owner'] == 'eva']
+        self.assertTrue(all(doc['is_shared'] for doc in owned))
+
+    def test_shared_documents_are_filtered_without_a_correlated_subquery(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('document-list'), {'page_size': 12})
+
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('"api_document"."id" IN (SELECT', sql)
+        self.assertNotIn('IS NOT NULL', sql)
+
+
+class FolderTreeTests(TestCase):
+    """Árbol de carpetas con ruta materializada."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sara', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.root = Folder.objects.create(name='raiz', owner=self.user)
+        self.child = Folder.objects.create(name='hija', owner=self.user, parent=self.root)
+        self.grandchild = Folder.objects.create(name='nieta', owner=self.user, parent=self.child)
+        self.other_root = Folder.objects.create(name='otra', owner=self.user)
+
+    def test_paths_follow_moves(self):
+        self.assertEqual(self.grandchild.path, f'/{self.root.id}/{self.child.id}/{self.grandchild.id}/')
+
+        response = self.client.patch(
+            reverse('folder-detail', args=[self.child.id]), {'parent': self.other_root.id})
+        self.assertEqual(response.status_code, 200)
+
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f'/{self.other_root.id}/{self.child.id}/{self.grandchild.id}/')
+        self.assertEqual(list(self.other_root.get_descendants().order_by('id')),
+                         [self.child, self.grandchild])
+
+    def test_cannot_move_folder_into_its_descendant(self):
+        response = self.client.patch(
+            reverse('folder-detail', args=[self.root.id]), {'parent': self.grandchild.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tree_is_built_from_one_query(self):
+        Folder.objects.create(name='bisnieta', owner=self.user, parent=self.grandchild)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('folder-list'))
+        self.assertEqual([f['name'] for f in response.data], ['raiz', 'otra'])
+        nested = response.data[0]['subfolders'][0]['subfolders'][0]['subfolders'][0]
+        self.assertEqual(nested['name'], 'bisnieta')
+
+    def test_delete_removes_subtree(self):
+        self.client.delete(reverse('folder-detail', args=[self.root.id]))
+        self.assertEqual(list(Folder.objects.filter(owner=self.user)), [self.other_root])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BackgroundExtractionTests(TestCase):
+    """La extracción de texto se encola y la procesa el worker (manage.py run_jobs)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='marta', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_upload_returns_pending_and_worker_extracts(self):
+        upload = SimpleUploadedFile('notas.txt', 'Texto del contrato'.encode('utf-8'))
+        response = self.client.post(reverse('document-list'), {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['extraction_status'], 'pending')
+        self.assertEqual(response.data['extracted_content'], '')
+
+        self.assertEqual(work(once=True), 1)
+
+        document = Document.objects.get(pk=response.data['id'])
+        self.assertEqual(document.extraction_status, Document.EXTRACTION_DONE)
+        self.assertEqual(document.extracted_content, 'Texto del contrato')
+        self.assertEqual(BackgroundJob.objects.get().status, BackgroundJob.STATUS_DONE)
+
+    def test_failed_extraction_is_retried_then_marked_failed(self):
+        document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'\xff\xfe roto', name='roto.txt'))
+        job = enqueue_job('extract_text', {'document_id': document.id}, max_attempts=2)
+
+        run_job(claim_job(job_id=job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.STATUS_PENDING)
+        self.assertGreater(job.run_after, job.created_at)
+
+        BackgroundJob.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        run_job(claim_job(job_id=job.id))
+        job.refresh_from_db()
+        document.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.STATUS_FAILED)
+        self.assertEqual(document.extraction_status, Document.EXTRACTION_FAILED)
+
+
+class JobLeaseTests(TransactionTestCase):
+    """Un trabajo largo sigue reclamado mientras corre; si otro worker lo reclama, no se pisan."""
+
+    def run_with_handler(self, handler):
+        job = enqueue_job('prueba')
+        with mock.patch.dict(JOB_HANDLERS, {'prueba': handler}):
+            run_job(claim_job(worker_id='worker-a', job_id=job.id))
+        job.refresh_from_db()
+        return job
+
+    @override_settings(JOB_HEARTBEAT_INTERVAL=0.05)
+    def test_heartbeat_renews_the_lock_while_the_job_runs(self):
+        seen = []
+
+        def slow(job):
+            claimed_at = BackgroundJob.objects.get(pk=job.pk).locked_at
+            time.sleep(0.3)
+            seen.append(BackgroundJob.objects.get(pk=job.pk).locked_at > claimed_at)
+            return {'ok': True}
+
+        job = self.run_with_handler(slow)
+
+        self.assertEqual(seen, [True])
+        self.assertEqual(job.status, BackgroundJob.STATUS_DONE)
+
+    def test_result_is_discarded_if_another_worker_reclaimed_the_job(self):
+        def reclaimed(job):
+            BackgroundJob.objects.filter(pk=job.pk).update(locked_by='worker-b', attempts=job.attempts + 1)
+            return {'ok': True}
+
+        job = self.run_with_handler(reclaimed)
+
+        self.assertEqual((job.status, job.locked_by, job.result), (BackgroundJob.STATUS_RUNNING, 'worker-b', None))
+
+
+class ParallelPdfExtractionTests(TestCase):
+    """Los PDFs grandes se extraen por rangos de páginas en varios procesos."""
+
+    def setUp(self):
+        handle, self.pdf_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(handle)
+        pdf = canvas.Canvas(self.pdf_path)
+        for number in range(1, 10):
+            pdf.drawString(72, 720, f'Pagina {number}')
+            pdf.showPage()
+        pdf.save()
+
+    def tearDown(self):
+        os.remove(self.pdf_path)
+
+    def test_parallel_extraction_keeps_page_order(self):
+        with self.settings(PDF_EXTRACTION_WORKERS=1):
+            sequential = text_extractor._extract_text_from_pdf(self.pdf_path)
+        with self.settings(PDF_EXTRACTION_WORKERS=2, PDF_PARALLEL_MIN_PAGES=4):
+            parallel = text_extractor._extract_text_from_pdf(self.pdf_path)
+
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([line for line in parallel.split('\n') if line],
+                         [f'Pagina {n}' for n in range(1, 10)])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTests(TestCase):
+    """Los archivos idénticos se guardan una vez y reutilizan el texto extraído."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pablo', password='clave-segura-123')
+        Profile.objects.filter(user=self.user).update(subscription_plan='premium')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _upload(self, name):
+        upload = SimpleUploadedFile(name, 'Mismo contenido'.encode('utf-8'))
+        response = self.client.post(reverse('document-list'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Document.objects.get(pk=response.data['id'])
+
+    def test_duplicate_upload_shares_blob_and_skips_extraction(self):
+        first = self._upload('informe.txt')
+        work(once=True)
+
+        second = self._upload('copia_informe.txt')
+
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(second.display_name, 'copia_informe.txt')
+        self.assertEqual(second.extraction_status, Document.EXTRACTION_DONE)
+        self.assertEqual(second.extracted_content, 'Mismo contenido')
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+
+    def test_blob_is_removed_with_its_last_document(self):
+        first = self._upload('a.txt')
+        second = self._upload('b.txt')
+        blob_path = first.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(os.path.exists(blob_path))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RENDER_CACHE_DIR=tempfile.mkdtemp())
+class DownloadCacheTests(TestCase):
+    """Las descargas generadas se reutilizan y se pueden revalidar con ETag."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ines', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='acta.pdf'),
+            extracted_content='Primera línea\nSegunda línea')
+        self.url = reverse('document-download', args=[self.document.id])
+
+    def test_second_download_is_served_from_cache(self):
+        with mock.patch.object(pdf_stream, 'iter_pdf', side_effect=lambda title, lines: iter([b'%PDF'])) as render:
+            first = self.client.get(self.url)
+            b''.join(first.streaming_content)
+            second = self.client.get(self.url)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(b''.join(second.streaming_content), b'%PDF')
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_failed_docx_render_is_logged_and_sent_as_txt(self):
+        document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='acta.docx'), extracted_content='Contenido')
+        with mock.patch.object(DocumentViewSet, '_render_docx', side_effect=ValueError('roto')), \
+                self.assertLogs('api.views', 'ERROR') as logs:
+            response = self.client.get(reverse('document-download', args=[document.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('acta_contenido.txt', response['Content-Disposition'])
+        self.assertIn('Error al generar el archivo docx', logs.output[0])
+
+    def test_revalidation_returns_304_until_document_changes(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.document.extracted_content = 'Contenido nuevo'
+        self.document.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_eviction_removes_least_recently_used(self):
+        with render_cache.put('antiguo', 'txt', lambda output: output.write(b'a' * 10)) as cached:
+            old = cached.name
+        with render_cache.put('reciente', 'txt', lambda output: output.write(b'b' * 10)) as cached:
+            recent = cached.name
+        os.utime(old, (1, 1))
+
+        render_cache.evict(max_bytes=15)
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_new_artifact_survives_its_own_eviction(self):
+        with override_settings(RENDER_CACHE_MAX_BYTES=5):
+            cached = render_cache.put('grande', 'txt', lambda output: output.write(b'c' * 10))
+        with cached:
+            self.assertEqual(cached.read(), b'c' * 10)
+        self.assertTrue(os.path.exists(cached.name))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RENDER_CACHE_DIR=tempfile.mkdtemp())
+class StreamingPdfTests(TestCase):
+    """Los PDFs se generan página a página, con memoria acotada, y se guardan en la caché."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='olga', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_download_streams_a_valid_multipage_pdf(self):
+        lines = [f'Párrafo número {i} (con paréntesis)' for i in range(200)]
+        document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='informe.pdf'),
+            extracted_content='\n'.join(lines))
+
+        response = self.client.get(reverse('document-download', args=[document.id]))
+        body = b''.join(response.streaming_content)
+
+        reader = PdfReader(io.BytesIO(body))
+        self.assertGreater(len(reader.pages), 1)
+        text = '\n'.join(page.extract_text() for page in reader.pages)
+        self.assertIn('Documento: informe', text)
+        self.assertLess(text.index('Párrafo número 10 ('), text.index('Párrafo número 199 ('))
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        key = render_cache.cache_key(document.pk, document.modified_at, 'pdf')
+        with render_cache.open_cached(key, 'pdf') as cached:
+            self.assertEqual(cached.read(), body)
+
+    def test_text_is_read_in_chunks_without_splitting_lines(self):
+        document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='a.pdf'),
+            extracted_content='uno\ndos\ntres\n\ncuatro')
+
+        lines = list(pdf_stream.iter_document_lines(document.pk, document.modified_at, chunk_size=3, max_line_length=100))
+
+        self.assertEqual(lines, ['uno', 'dos', 'tres', '', 'cuatro'])
+
+    def test_memory_does_not_grow_with_document_length(self):
+        def peak_for(line_count):
+            lines = (f'Línea {i} ' * 12 for i in range(line_count))
+            tracemalloc.start()
+            for _ in pdf_stream.iter_pdf('Grande', lines):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+
+        small, large = peak_for(2000), peak_for(40000)
+
+        self.assertLess(large, small * 2)
+
+    def test_interrupted_stream_is_not_cached(self):
+        chunks = render_cache.stream_put('cortado', 'pdf', iter([b'%PDF', b'resto']))
+        next(chunks)
+        chunks.close()
+
+        self.assertIsNone(render_cache.open_cached('cortado', 'pdf'))
+        self.assertFalse([name for name in os.listdir(render_cache.cache_dir()) if name.endswith('.tmp')])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TranslationCacheTests(TestCase):
+    """Las traducciones repetidas se sirven desde la caché (memoria o base de datos)."""
+
+    def setUp(self):
+        reset_translation_state(self)
+        patcher = patch_google_backend(
+            lambda text, target, source=None: (f'[{target}] {text}', source or 'es'))
+        self.backend = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_translation_hits_memory_then_database(self):
+        first = translation.translate_text('Hola mundo', 'en')
+        second = translation.translate_text('Hola mundo', 'en')
+        translation_cache.clear_local()
+        third = translation.translate_text('Hola mundo', 'en')
+
+        self.assertEqual(self.backend.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        stats = translation_cache.stats()
+        self.assertEqual((stats['db_hits'], stats['misses']), (1, 0))
+        self.assertEqual(TranslationCacheEntry.objects.get().hit_count, 1)
+
+    def test_key_includes_languages_and_errors_are_not_cached(self):
+        translation.translate_text('Hola', 'en')
+        translation.translate_text('Hola', 'fr')
+        translation.translate_text('Hola', 'en', 'es')
+        self.assertEqual(self.backend.call_count, 3)
+
+        self.backend.side_effect = ConnectionError('sin red')
+        translation.translate_text('Adiós', 'en')
+        self.assertEqual(TranslationCacheEntry.objects.count(), 3)
+
+    def test_eviction_drops_expired_and_least_recently_used(self):
+        for word in ('uno', 'dos', 'tres'):
+            translation.translate_text(word, 'en')
+        TranslationCacheEntry.objects.filter(
+            text_hash=translation_cache.make_key('uno', 'en', None, 'google_translate')[0]
+        ).update(last_used_at=timezone.now() - timedelta(days=365))
+
+        translation_cache.evict(max_entries=1)
+
+        remaining = TranslationCacheEntry.objects.get()
+        self.assertEqual(remaining.translated_text, '[en] tres')
+
+    def test_document_translation_uses_cache(self):
+        user = User.objects.create_user(username='pablo', password='clave-segura-123')
+        document = Document.objects.create(
+            owner=user, file=ContentFile(b'x', name='nota.txt'), extracted_content='Buenos días')
+
+        for _ in range(2):
+            job = enqueue_job('translate_document', {
+                'document_id': document.id, 'target_language': 'en'}, user=user)
+            self.assertEqual(run_job(claim_job(job_id=job.id)).status, BackgroundJob.STATUS_DONE)
+
+        self.assertEqual(self.backend.call_count, 1)
+        self.assertEqual(document.translations.first().translated_content, '[en] Buenos días')
+
+
+@override_settings(TRANSLATION_RETRY_DELAY=0)
+class SegmentedTranslationTests(TestCase):
+    """Los documentos largos se traducen por segmentos en paralelo y se reensamblan en orden."""
+
+    def setUp(self):
+        reset_translation_state(self)
+
+    def test_segments_respect_limit_and_rebuild_the_text(self):
+        text = ('Primera frase corta. ' * 30 + '\n\n' + 'x' * 250 + '\nÚltimo párrafo.')
+
+        segments = segmentation.sentence_units(text, 100)
+
+        self.assertTrue(all(len(segment) <= 100 for segment, _ in segments))
+        self.assertEqual(segmentation.join_segments([s for s, _ in segments], segments), text)
+        self.assertTrue(segments[0][0].endswith('corta.'))
+
+    @override_settings(TRANSLATION_SEGMENT_MAX_CHARS=50, TRANSLATION_WORKERS=4)
+    def test_segments_are_translated_concurrently_in_order(self):
+        paragraphs = [f'Párrafo {i} con algo de texto para traducir.' for i in range(8)]
+
+        def slow_backend(text, target, source=None):
+            time.sleep(0.2)
+            return text.upper(), 'es'
+
+        with patch_google_backend(slow_backend):
+            started = time.monotonic()
+            result = translation.translate_document_text('\n'.join(paragraphs), 'en')
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(result['translated_text'], '\n'.join(paragraphs).upper())
+        self.assertLess(elapsed, 8 * 0.2 / 2)
+
+    @override_settings(TRANSLATION_SEGMENT_MAX_CHARS=20)
+    def test_failed_segment_is_retried(self):
+        calls = []
+
+        def flaky_backend(text, target, source=None):
+            calls.append(text)
+            if text == 'segundo' and calls.count(text) == 1:
+                raise TimeoutError('tiempo agotado')
+            return f'<{text}>', 'es'
+
+        with patch_google_backend(flaky_backend):
+            result = translation.translate_document_text('primero de todos\nsegundo', 'en')
+
+        self.assertEqual(result['translated_text'], '<primero de todos>\n<segundo>')
+        self.assertEqual(calls.count('segundo'), 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TranslationMemoryTests(TestCase):
+    """Las frases ya traducidas en otros documentos se reutilizan sin llamar al backend."""
+
+    BOILERPLATE = 'Este documento es confidencial.  Prohibida su distribución.'
+
+    def setUp(self):
+        reset_translation_state(self)
+        self.sent = []
+
+        def backend(text, target, source=None):
+            self.sent.append(text)
+            return '\n'.join(f'<{line}>' for line in text.split('\n')), 'es'
+
+        patcher = patch_google_backend(backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared_sentences_are_translated_once(self):
+        first = translation.translate_document_text(f'Informe de enero.\n{self.BOILERPLATE}', 'en')
+        self.sent.clear()
+        second = translation.translate_document_text(f'  Informe de febrero.\n{self.BOILERPLATE}\n', 'en')
+
+        self.assertEqual(self.sent, ['Informe de febrero.'])
+        self.assertEqual(
+            second['translated_text'],
+            '  <Informe de febrero.>\n<Este documento es confidencial.>  <Prohibida su distribución.>\n')
+        self.assertEqual((first['reused_segments'], first['total_segments']), (0, 3))
+        self.assertEqual((second['reused_segments'], second['total_segments']), (2, 3))
+        self.assertEqual(TranslationMemoryEntry.objects.count(), 4)
+        self.assertEqual(
+            translation_memory.lookup(['Prohibida   su distribución.'], 'en', None, 'google_translate'),
+            [('<Prohibida su distribución.>', 'es')])
+
+    def test_batch_with_mismatched_lines_falls_back_to_single_sentences(self):
+        with patch_google_backend(lambda text, target, source=None: (text.replace('\n', ' ').upper(), 'es')):
+            result = translation.translate_document_text('Uno.\nDos.', 'en')
+
+        self.assertEqual(result['translated_text'], 'UNO.\nDOS.')
+        self.assertEqual(translation_memory.lookup(['Dos.'], 'en', None, 'google_translate'), [('DOS.', 'es')])
+
+    @override_settings(TRANSLATION_BACKEND_ORDER=['google_translate', 'offline'], TRANSLATION_SEGMENT_ATTEMPTS=1)
+    def test_fallback_translations_are_not_served_for_other_backends(self):
+        with patch_google_backend(ConnectionError('sin red')):
+            fallback = translation.translate_document_text('Hola.', 'en')
+        translation_backends.BACKENDS['google_translate'].breaker.reset()
+        translation_cache.clear_local()
+        self.sent.clear()
+
+        result = translation.translate_document_text('Hola.', 'en')
+
+        self.assertEqual(fallback['translated_text'], '[en] Hola.')
+        self.assertEqual(self.sent, ['Hola.'])
+        self.assertEqual(result['translated_text'], '<Hola.>')
+        self.assertEqual(set(TranslationMemoryEntry.objects.values_list('backend', flat=True)),
+                         {'offline', 'google_translate'})
+
+    def test_new_sentences_go_through_the_translation_cache(self):
+        translation.translate_document_text('Uno.\nDos.', 'en')
+        TranslationMemoryEntry.objects.all().delete()
+        self.sent.clear()
+
+        result = translation.translate_document_text('Uno.\nDos.', 'en')
+
+        self.assertEqual(self.sent, [])
+        self.assertEqual(result['translated_text'], '<Uno.>\n<Dos.>')
+
+    def test_storing_an_expired_sentence_refreshes_it(self):
+        translation_memory.store([('Uno.', 'One (old).', 'es')], 'en', None, 'google_translate')
+        TranslationMemoryEntry.objects.update(last_used_at=timezone.now() - timedelta(days=365))
+        self.assertEqual(translation_memory.lookup(['Uno.'], 'en', None, 'google_translate'), [None])
+
+        translation_memory.store([('Uno.', 'One.', 'es')], 'en', None, 'google_translate')
+
+        self.assertEqual(translation_memory.lookup(['Uno.'], 'en', None, 'google_translate'), [('One.', 'es')])
+        self.assertEqual(TranslationMemoryEntry.objects.count(), 1)
+
+    def test_eviction_keeps_most_recently_used(self):
+        translation.translate_document_text('Uno.\nDos.\nTres.', 'en')
+        translation_memory.lookup(['Uno.'], 'en', None, 'google_translate')
+
+        translation_memory.evict(max_entries=1)
+
+        self.assertEqual(list(TranslationMemoryEntry.objects.values_list('source_text', flat=True)), ['Uno.'])
+
+    def test_job_reports_reuse_ratio(self):
+        user = User.objects.create_user(username='lucia', password='clave-segura-123')
+        results = []
+        for name in ('a.txt', 'b.txt'):
+            document = Document.objects.create(
+                owner=user, file=ContentFile(b'x', name=name),
+                extracted_content=f'Documento {name}.\n{self.BOILERPLATE}')
+            job = enqueue_job('translate_document', {
+                'document_id': document.id, 'target_language': 'fr'}, user=user)
+            results.append(run_job(claim_job(job_id=job.id)).result)
+
+        self.assertEqual(results[0]['reuse_ratio'], 0.0)
+        self.assertEqual((results[1]['reused_segments'], results[1]['total_segments']), (2, 3))
+        self.assertAlmostEqual(results[1]['reuse_ratio'], 2 / 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AsyncTranslationJobTests(TestCase):
+    """translate-document responde 202 y la traducción se hace en un trabajo en segundo plano."""
+
+    def setUp(self):
+        reset_translation_state(self)
+        self.user = User.objects.create_user(username='raquel', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='carta.txt'),
+            extracted_content='Hola\nAdiós')
+        self.url = reverse('document-translate-document', args=[self.document.id])
+
+    @override_settings(TRANSLATION_SEGMENT_MAX_CHARS=5)
+    def test_translation_runs_as_job_and_reports_progress(self):
+        response = self.client.post(self.url, {'target_language': 'en'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+        self.assertFalse(self.document.translations.exists())
+
+        with patch_google_backend(lambda text, target, source=None: (text[::-1], 'es')), \
+                mock.patch('api.jobs.notify_job') as notify:
+            run_job(claim_job(job_id=job_id))
+
+        job = self.client.get(reverse('job-detail', args=[job_id])).data
+        self.assertEqual(job['status'], BackgroundJob.STATUS_DONE)
+        self.assertEqual((job['progress_done'], job['progress_total']), (2, 2))
+        history = self.client.get(
+            reverse('translation-history-detail', args=[job['result']['translation_id']])).data
+        self.assertEqual(history['translated_content'], 'aloH\nsóidA')
+        self.assertEqual(notify.call_args_list[-1].args[0].status, BackgroundJob.STATUS_DONE)
+
+    def test_invalid_requests_are_rejected_without_a_job(self):
+        self.assertEqual(self.client.post(self.url, {'target_language': 'xx'}, format='json').status_code, 400)
+        Document.objects.filter(pk=self.document.pk).update(extracted_content='')
+        self.assertEqual(self.client.post(self.url, {'target_language': 'en'}, format='json').status_code, 400)
+        self.assertFalse(BackgroundJob.objects.filter(kind='translate_document').exists())
+
+    def test_jobs_of_other_users_are_hidden(self):
+        other = User.objects.create_user(username='sergio', password='clave-segura-123')
+        job = enqueue_job('translate_document', {}, user=other)
+
+        self.assertEqual(self.client.get(reverse('job-detail', args=[job.id])).status_code, 404)
+
+
+class TranslationClientTests(TestCase):
+    """Los clientes de traducción se reutilizan en lugar de crearse en cada llamada."""
+
+    def setUp(self):
+        reset_translation_state(self)
+
+    def test_pool_reuses_translators_and_bounds_concurrency(self):
+        pool = translation_client.TranslatorPool(size=2)
+        active, peak = [0], [0]
+
+        def use_pool(_):
+            with pool.acquire() as translator:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                time.sleep(0.02)
+                active[0] -= 1
+                return translator
+
+        with mock.patch.object(pool, '_new_translator', side_effect=lambda: mock.Mock()) as new:
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                used = list(executor.map(use_pool, range(12)))
+
+        self.assertEqual(new.call_count, 2)
+        self.assertEqual(len({id(t) for t in used}), 2)
+        self.assertLessEqual(peak[0], 2)
+
+    def test_rpc_response_is_parsed_like_googletrans(self):
+        parsed = [[None, None, 'es'], [[[None, None, None, True, None, [['Hola'], ['mundo']]]]], 'es']
+        envelope = json.dumps([['wrb.fr', 'MkEWBc', json.dumps(parsed), None, None, None, 'generic']])
+        data = ")]}'\n\n123\n" + envelope + "\n25\n[[\"e\",4]]"
+
+        self.assertEqual(translation_client.parse_rpc_response(data, 'auto'), ('Hola mundo', 'es'))
+
+    # Contrato con googletrans: AsyncTranslator reproduce su petición RPC y su análisis de la respuesta
+    RPC_RESPONSE = ")]}'\n\n123\n" + json.dumps([['wrb.fr', 'MkEWBc', json.dumps(
+        [[None, None, 'es'], [[[None, None, None, True, None, [['Hola'], ['mundo']]]]], 'es']),
+        None, None, None, 'generic']]) + "\n25\n[[\"e\",4]]"
+
+    def test_installed_googletrans_is_the_rpc_compatible_version(self):
+        self.assertTrue(translation_client.rpc_compatible())
+
+    def test_rpc_parser_matches_googletrans(self):
+        translator = Translator()
+        with mock.patch.object(translator, '_translate', return_value=(self.RPC_RESPONSE, None)):
+            expected = translator.translate('Hola mundo', dest='en')
+
+        self.assertEqual(translation_client.parse_rpc_response(self.RPC_RESPONSE, 'auto'),
+                         (expected.text, expected.src))
+
+    async def test_async_request_matches_googletrans(self):
+        translator = Translator()
+        translator.client = mock.Mock()
+        translator.client.post.return_value = mock.Mock(text=self.RPC_RESPONSE, status_code=200)
+        translator.translate('Hola mundo', dest='en', src='es')
+
+        async_translator = translation_client.AsyncTranslator(1)
+        async_translator.client = mock.Mock()
+        async_translator.client.post = mock.AsyncMock(return_value=mock.Mock(text=self.RPC_RESPONSE))
+        await async_translator.translate('Hola mundo', 'en', 'es')
+
+        sent, expected = async_translator.client.post.call_args, translator.client.post.call_args
+        self.assertEqual((sent.kwargs['params'], sent.kwargs['data']),
+                         (expected.kwargs['params'], expected.kwargs['data']))
+
+    async def test_other_googletrans_versions_use_the_public_api(self):
+        pooled = mock.Mock()
+        pooled.translate.return_value = mock.Mock(text='Hello', src='es')
+        pool = mock.Mock()
+        pool.acquire.return_value.__enter__ = mock.Mock(return_value=pooled)
+        pool.acquire.return_value.__exit__ = mock.Mock(return_value=False)
+
+        async_translator = translation_client.AsyncTranslator(1)
+        async_translator.client = mock.Mock()
+        with mock.patch.object(translation_client.googletrans, '__version__', '9.9.9'), \
+                mock.patch.object(translation_client, 'get_translator_pool', return_value=pool):
+            result = await async_translator.translate('Hola', 'en', 'auto')
+
+        self.assertEqual(result, ('Hello', 'es'))
+        pooled.translate.assert_called_once_with('Hola', dest='en', src='auto')
+        async_translator.client.post.assert_not_called()
+
+    async def test_async_translation_uses_shared_client_and_cache(self):
+        client = mock.Mock()
+        client.translate = mock.AsyncMock(return_value=('Hello', 'es'))
+
+        with mock.patch.object(translation_backends, 'get_async_translator', return_value=client):
+            first = await translation.translate_text_async('Hola', 'en')
+            second = await translation.translate_text_async('Hola', 'en')
+
+        self.assertEqual(first, {'translated_text': 'Hello', 'detected_source_language': 'es'})
+        self.assertEqual(second, first)
+        client.translate.assert_awaited_once_with('Hola', 'en', 'auto')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), TRANSLATION_BACKEND_ORDER=['google_translate', 'offline'],
+                   TRANSLATION_CIRCUIT_MIN_CALLS=3)
+class TranslationBackendTests(TestCase):
+    """Backend por usuario, failover automático y circuit breaker."""
+
+    def setUp(self):
+        reset_translation_state(self)
+        self.user = User.objects.create_user(username='tomas', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(TRANSLATION_USER_BACKENDS=['google_translate', 'offline'])
+    def test_profile_preference_selects_backend(self):
+        document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='a.txt'), extracted_content='x')
+        response = self.client.patch(
+            reverse('profile-detail'), {'preferred_translation_api': 'offline'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # Como en una petición real: el usuario autenticado se carga con el perfil actualizado
+        self.user.refresh_from_db()
+
+        with patch_google_backend(AssertionError('no debería llamarse')) as google:
+            response = self.client.post(
+                reverse('document-translate-text-snippet', args=[document.id]),
+                {'text': 'Hola', 'target_language': 'en'}, format='json')
+
+        self.assertEqual(response.data['translated_text'], '[en] Hola')
+        google.assert_not_called()
+
+    def test_unknown_or_internal_backend_is_rejected(self):
+        for backend in ('inventado', 'offline'):
+            response = self.client.patch(
+                reverse('profile-detail'), {'preferred_translation_api': backend}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Profile.objects.get(user=self.user).preferred_translation_api, 'google_translate')
+
+    def test_failing_backend_fails_over_and_opens_circuit(self):
+        with patch_google_backend(ConnectionError('caído')) as google:
+            results = [translation.translate_text(f'frase {i}', 'en') for i in range(5)]
+
+        self.assertEqual(results[-1]['translated_text'], '[en] frase 4')
+        self.assertEqual(google.call_count, 3)
+        metrics = translation_backends.metrics()['google_translate']
+        self.assertEqual((metrics['state'], metrics['errors']), ('open', 3))
+
+    @override_settings(TRANSLATION_BACKEND_TIMEOUTS={'google_translate': 0.1})
+    def test_sync_call_gives_up_after_the_backend_timeout(self):
+        backend = translation_backends.BACKENDS['google_translate']
+        with patch_google_backend(lambda text, target, source=None: time.sleep(1) or (text, 'es')):
+            started = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                backend.call('Hola', 'en')
+
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual(backend.breaker.metrics()['errors'], 1)
+
+    @override_settings(TRANSLATION_CIRCUIT_MAX_P95=0.5, TRANSLATION_CIRCUIT_COOLDOWN=0)
+    def test_slow_backend_opens_on_p95_and_recovers_after_trial(self):
+        breaker = translation_backends.BACKENDS['google_translate'].breaker
+        for latency in (0.1, 0.1, 2.0):
+            breaker.record(latency, ok=True)
+        self.assertEqual(breaker.state, breaker.OPEN)
+
+        # Pasado el enfriamiento se deja pasar una sola llamada de prueba
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(0.1, ok=True)
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """La autenticación por token no consulta la base de datos si el token ya está en caché."""
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.user = User.objects.create_user(username='olga', password='clave-segura-123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_second_request_skips_token_and_user_queries(self):
+        self.assertEqual(self.client.get(reverse('profile-detail')).status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile-detail'))
+
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('authtoken_token', tables)
+        self.assertNotIn('"auth_user"', tables)
+
+    def test_deleted_token_and_inactive_user_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('profile-detail')).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('profile-detail')).status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.token.delete()
+        self.assertEqual(self.client.get(reverse('profile-detail')).status_code, 401)
+
+    def test_cached_users_are_not_shared_between_requests(self):
+        first, _ = token_cache.lookup(self.token.key)
+        second, _ = token_cache.lookup(self.token.key)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QUOTA_WINDOWS={'ai_requests': 3600, 'chat_messages': 3600})
+class QuotaTests(TestCase):
+    """Las cuotas se comprueban y suman en una sola sentencia, con ventana deslizante y límites por plan."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rosa', password='clave-segura-123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _at(self, seconds):
+        clock = mock.patch('api.quotas.time')
+        clock.start().time.return_value = seconds
+        self.addCleanup(clock.stop)
+
+    def test_consume_stops_at_the_plan_limit(self):
+        results = [quotas.consume(self.user.id, quotas.AI_REQUESTS, 'free') for _ in range(7)]
+        self.assertEqual(results, [True] * 5 + [False] * 2)
+        self.assertEqual(quotas.usage(self.user.id, quotas.AI_REQUESTS), 5)
+        self.assertTrue(all(quotas.consume(self.user.id, quotas.CHAT_MESSAGES, 'premium') for _ in range(50)))
+
+    def test_previous_window_counts_in_proportion(self):
+        self._at(3600 * 10 + 1800)
+        for _ in range(5):
+            quotas.consume(self.user.id, quotas.AI_REQUESTS, 'free')
+
+        # Media ventana después: aún cuentan la mitad de las 5 anteriores
+        self._at(3600 * 11 + 1800)
+        self.assertEqual(quotas.usage(self.user.id, quotas.AI_REQUESTS), 2)
+        results = [quotas.consume(self.user.id, quotas.AI_REQUESTS, 'free') for _ in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+
+        # Dos ventanas después ya no queda nada
+        self._at(3600 * 13)
+        self.assertEqual(quotas.usage(self.user.id, quotas.AI_REQUESTS), 0)
+
+    def test_bucket_reserves_in_batches_and_returns_what_is_left(self):
+        bucket = quotas.QuotaBucket(self.user.id, quotas.CHAT_MESSAGES, 'free', lease_size=4)
+        with CaptureQueriesContext(connection) as queries:
+            results = [bucket.take() for _ in range(11)]
+        self.assertEqual(results, [True] * 10 + [False])
+        # Lotes de 2 (un cuarto del límite de 10, menos que lease_size) y 2 y 1 fallidos
+        self.assertEqual(len(queries.captured_queries), 7)
+
+        bucket = quotas.QuotaBucket(self.user.id, quotas.AI_REQUESTS, 'free', lease_size=4)
+        self.assertTrue(bucket.take())
+        bucket.release()
+        self.assertEqual(quotas.usage(self.user.id, quotas.AI_REQUESTS), 1)
+
+    def test_two_buckets_of_the_same_user_share_the_limit(self):
+        first = quotas.QuotaBucket(self.user.id, quotas.CHAT_MESSAGES, 'free')
+        second = quotas.QuotaBucket(self.user.id, quotas.CHAT_MESSAGES, 'free')
+        # El primer lote no se queda con toda la cuota del día
+        self.assertTrue(first.take())
+        self.assertTrue(second.take())
+
+        taken = 2
+        while True:
+            results = [first.take(), second.take()]
+            taken += sum(results)
+            if not any(results):
+                break
+        self.assertEqual(taken, 10)
+
+    @mock.patch('api.views.GeminiAssistant')
+    def test_ai_assistant_enforces_the_plan_limit(self, assistant):
+        assistant.return_value.process_command.return_value = {'success': True}
+        assistant.return_value.served_from_cache = False
+        statuses = [self.client.post(reverse('ai-assistant'), {'prompt': 'hola'}).status_code for _ in range(6)]
+        self.assertEqual(statuses, [200] * 5 + [403])
+
+        self.user.profile.subscription_plan = 'premium'
+        self.user.profile.save()
+        self.assertEqual(self.client.post(reverse('ai-assistant'), {'prompt': 'hola'}).status_code, 200)
+
+    def test_document_quota_is_freed_when_a_document_is_deleted(self):
+        def upload(name):
+            upload = SimpleUploadedFile(name, name.encode('utf-8'))
+            return self.client.post(reverse('document-list'), {'file': upload}, format='multipart')
+
+        responses = [upload(f'doc_{i}.txt') for i in range(6)]
+        self.assertEqual([response.status_code for response in responses], [201] * 5 + [403])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(upload('otro.txt').status_code, 403)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+        self.client.delete(reverse('document-detail', args=[responses[0].data['id']]))
+        self.assertEqual(upload('otro.txt').status_code, 201)
+        self.assertEqual(QuotaCounter.objects.get(user=self.user, kind=quotas.DOCUMENTS).current_count, 5)
+
+
+class ConcurrentQuotaTests(TransactionTestCase):
+    """Peticiones simultáneas no pueden pasarse del límite."""
+
+    def test_concurrent_consumers_never_exceed_the_limit(self):
+        user = User.objects.create_user(username='simon', password='clave-segura-123')
+
+        def consume(_):
+            try:
+                return quotas.consume(user.id, quotas.AI_REQUESTS, 'free')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(consume, range(40)))
+
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(quotas.usage(user.id, quotas.AI_REQUESTS), 5)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), ASSISTANT_CONTEXT_MAX_DOCUMENTS=5)
+class AssistantContextTests(TestCase):
+    """El asistente recibe un contexto acotado con los documentos más relevantes para la petición."""
+
+    def setUp(self):
+        assistant_context.clear()
+        self.addCleanup(assistant_context.clear)
+        self.user = User.objects.create_user(username='tomas', password='clave-segura-123')
+        self.folder = Folder.objects.create(name='Finanzas', owner=self.user)
+        self.documents = [
+            Document.objects.create(owner=self.user, folder=self.folder if i % 2 else None,
+                                    file=ContentFile(b'x', name=f'notas_{i}.txt'), extracted_content='Texto')
+            for i in range(30)
+        ]
+        self.budget = Document.objects.create(owner=self.user, file=ContentFile(b'x', name='presupuesto_anual.txt'))
+        Tag.objects.create(name='urgente', owner=self.user)
+
+    def _listed_ids(self, context):
+        return [int(line.split(',')[0].split(': ')[1]) for line in context.splitlines()
+                if line.startswith('- ID:') and 'Carpeta:' in line]
+
+    def test_only_the_most_relevant_documents_are_listed(self):
+        context = assistant_context.build_context(self.user, 'Resume el presupuesto anual')
+        listed = self._listed_ids(context)
+        self.assertEqual(len(listed), 5)
+        self.assertEqual(listed[0], self.budget.id)
+        self.assertIn('Nombre: Finanzas', context)
+        self.assertIn('Nombre: urgente', context)
+
+        # Un documento mencionado por su id va primero; el resto, por fecha de modificación
+        listed = self._listed_ids(assistant_context.build_context(self.user, f'Etiqueta el documento {self.documents[0].id}'))
+        self.assertEqual(listed[:2], [self.documents[0].id, self.budget.id])
+
+    @override_settings(ASSISTANT_CONTEXT_MAX_DOCUMENTS=100, ASSISTANT_CONTEXT_MAX_TOKENS=200)
+    def test_context_fits_the_token_budget(self):
+        context = assistant_context.build_context(self.user, 'Organiza mis documentos')
+        self.assertLessEqual(len(context), 200 * assistant_context.CHARS_PER_TOKEN)
+        self.assertIn('documentos más sin listar', context)
+        self.assertIn('Nombre: Finanzas', context)
+
+    def test_catalog_is_cached_until_a_folder_or_tag_changes(self):
+        assistant_context.build_context(self.user, 'hola')
+        with CaptureQueriesContext(connection) as queries:
+            assistant_context.build_context(self.user, 'hola')
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        # Documentos relevantes y versión del catálogo
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertNotIn('FROM "api_folder"', sql)
+        self.assertNotIn('FROM "api_tag"', sql)
+
+        Folder.objects.create(name='Contratos', owner=self.user)
+        self.assertIn('Nombre: Contratos', assistant_context.build_context(self.user, 'hola'))
+
+    def test_catalog_invalidated_by_another_process_is_reloaded(self):
+        assistant_context.build_context(self.user, 'hola')
+        # Otro proceso (el trabajador de 'tag_all') crea una etiqueta y sube la
+        # versión; la caché de este proceso no se ha tocado
+        Tag.objects.bulk_create([Tag(owner=self.user, name='Urgente')])
+        Profile.objects.filter(user=self.user).update(catalog_version=F('catalog_version') + 1)
+
+        self.assertIn('Nombre: Urgente', assistant_context.build_context(self.user, 'hola'))
+
+    def test_saving_a_profile_loaded_earlier_keeps_the_catalog_version(self):
+        profile = Profile.objects.get(user=self.user)
+        assistant_context.invalidate_catalog(self.user.id)
+        profile.language_preference = 'en'
+        profile.save()
+
+        saved = Profile.objects.get(user=self.user)
+        self.assertEqual((saved.catalog_version, saved.language_preference), (profile.catalog_version + 1, 'en'))
+
+
+class FakeTaggingModel:
+    """Modelo de Gemini falso: etiqueta cada documento del lote según su contenido."""
+
+    def __init__(self, fail_on=None):
+        self.calls = 0
+        self.fail_on = fail_on
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        blocks = re.findall(r'--- Documento (\d+) ---\n(\w+)', prompt)
+        if self.fail_on and any(word == self.fail_on for _, word in blocks):
+            raise RuntimeError('cuota de Gemini agotada')
+        answer = json.dumps({document_id: f'"{word.title()}"' for document_id, word in blocks})
+        return mock.Mock(text=f'```json\n{answer}\n```')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), TAG_ALL_BATCH_SIZE=20, TAG_ALL_REQUESTS_PER_MINUTE=0)
+class AutoTaggingTests(TestCase):
+    """tag_all envía varios documentos por petición, en paralelo, y guarda las etiquetas en bloque."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ursula', password='clave-segura-123')
+        self.documents = [
+            Document.objects.create(owner=self.user, file=ContentFile(b'x', name=f'doc_{i}.txt'),
+                                    extracted_content=['finanzas', 'contratos', 'recetas'][i % 3] + ' ' * 600)
+            for i in range(45)
+        ]
+        Document.objects.create(owner=self.user, file=ContentFile(b'x', name='vacio.txt'))
+        Tag.objects.create(owner=self.user, name='Finanzas')
+
+    def test_documents_are_tagged_in_batches(self):
+        model = FakeTaggingModel()
+        progress = []
+        with CaptureQueriesContext(connection) as queries:
+            result = auto_tagging.tag_all_documents(
+                self.user, model, on_progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(result, {'tagged': 45, 'failed_batches': 0, 'cached': 0})
+        self.assertEqual(model.calls, 3)
+        self.assertEqual(progress[0], (0, 45))
+        self.assertEqual(progress[-1], (45, 45))
+        self.assertEqual(sorted(Tag.objects.filter(owner=self.user).values_list('name', flat=True)),
+                         ['Contratos', 'Finanzas', 'Recetas'])
+        self.assertEqual(self.documents[4].tags.get().name, 'Contratos')
+        # Consultas por lote, no por documento
+        self.assertLess(len(queries.captured_queries), 25)
+
+    def test_failed_batch_does_not_stop_the_others(self):
+        with self.settings(TAG_ALL_BATCH_SIZE=1):
+            result = auto_tagging.tag_all_documents(self.user, FakeTaggingModel(fail_on='recetas'))
+        self.assertEqual(result, {'tagged': 30, 'failed_batches': 15, 'cached': 0})
+        self.assertFalse(self.documents[2].tags.exists())
+
+    def test_rate_limiter_spaces_requests(self):
+        limiter = auto_tagging.RateLimiter(per_minute=1200)
+        started = time.monotonic()
+        for _ in range(4):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    @mock.patch('api.tasks.tag_all_documents', return_value={'tagged': 0, 'failed_batches': 0})
+    @mock.patch('api.gemini_service.genai')
+    def test_tag_all_action_runs_in_the_background(self, genai, tag_all):
+        from .gemini_service import GeminiAssistant
+
+        result = GeminiAssistant(self.user)._execute_action({'action': 'tag_all', 'parameters': {}})
+        job = BackgroundJob.objects.get(pk=result['job_id'])
+        self.assertEqual((job.kind, job.status), ('tag_all_documents', BackgroundJob.STATUS_PENDING))
+        tag_all.assert_not_called()
+
+        work(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.STATUS_DONE)
+        tag_all.assert_called_once()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class LLMResponseCacheTests(TestCase):
+    """Las respuestas de Gemini se reutilizan para el mismo contenido."""
+
+    def setUp(self):
+        assistant_context.clear()
+        self.user = User.objects.create_user(username='victor', password='clave-segura-123')
+        self.document = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='informe.txt'), extracted_content='Informe trimestral')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        genai = mock.patch('api.gemini_service.genai')
+        self.model = genai.start().GenerativeModel.return_value
+        self.addCleanup(genai.stop)
+        self.model.model_name = 'models/gemini-2.0-flash'
+        self.model.generate_content.side_effect = self._answer
+
+    def _answer(self, prompt):
+        if 'Eres un asistente' in prompt:
+            command = {'action': 'summarize', 'parameters': {'document_id': self.document.id}, 'message': ''}
+            return mock.Mock(text=json.dumps(command))
+        return mock.Mock(text='Resumen corto')
+
+    def _summarize(self, document):
+        from .gemini_service import GeminiAssistant
+
+        assistant = GeminiAssistant(self.user)
+        assistant._execute_action({'action': 'summarize', 'parameters': {'document_id': document.id}})
+        return assistant.model_calls
+
+    def test_same_content_is_summarized_once(self):
+        self.assertEqual(self._summarize(self.document), 1)
+        copy = Document.objects.create(
+            owner=self.user, file=ContentFile(b'x', name='copia.txt'), extracted_content='Informe trimestral')
+        self.assertEqual(self._summarize(copy), 0)
+        self.assertEqual(LLMCacheEntry.objects.get(operation='summarize').hit_count, 1)
+
+    def test_changing_the_content_invalidates_its_responses(self):
+        self._summarize(self.document)
+        self.document.folder = Folder.objects.create(name='Informes', owner=self.user)
+        self.document.save(update_fields=['folder', 'modified_at'])
+        renamed = Document.objects.get(pk=self.document.pk)
+        renamed.original_name = 'informe-final.txt'
+        renamed.save()
+        self.assertTrue(LLMCacheEntry.objects.filter(document=self.document).exists())
+
+        self.document.extracted_content = 'Informe anual'
+        self.document.save()
+        self.assertFalse(LLMCacheEntry.objects.filter(document=self.document).exists())
+        self.assertEqual(self._summarize(self.document), 1)
+
+    def test_repeated_summary_routes_again_but_spends_no_ai_quota(self):
+        for _ in range(2):
+            response = self.client.post(reverse('ai-assistant'), {'prompt': 'Resume el informe'})
+            self.assertEqual(response.status_code, 200)
+            Document.objects.exclude(pk=self.document.pk).delete()
+
+        # Dos decisiones de acción (sin caché) y un solo resumen (el segundo sale de la caché)
+        self.assertEqual(self.model.generate_content.call_count, 3)
+        self.assertFalse(LLMCacheEntry.objects.filter(operation='command').exists())
+        self.assertEqual(quotas.usage(self.user.id, quotas.AI_REQUESTS), 1)
+
+    def test_tag_all_skips_documents_already_tagged_from_the_cache(self):
+        model = FakeTaggingModel()
+        model.model_name = 'models/gemini-2.0-flash'
+        self.document.extracted_content = 'finanzas'
+        self.document.save()
+        auto_tagging.tag_all_documents(self.user, model)
+        self.document.tags.clear()
+
+        result = auto_tagging.tag_all_documents(self.user, model)
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(result, {'tagged': 1, 'failed_batches': 0, 'cached': 1})
+        self.assertEqual(self.document.tags.get().name, 'Finanzas')
+
+    def test_eviction_keeps_the_most_recently_used_entries(self):
+        for i in range(5):
+            llm_cache.put(llm_cache.make_key('summarize', 'modelo', f'texto {i}'), f'resumen {i}')
+        llm_cache.get(llm_cache.make_key('summarize', 'modelo', 'texto 0'))
+        llm_cache.evict(max_entries=2)
+        self.assertEqual(sorted(LLMCacheEntry.objects.values_list('response', flat=True)),
+                         ['resumen 0', 'resumen 4'])
+
+
+class FakeSummaryModel:
+    """Modelo de Gemini falso que guarda los prompts recibidos (desde cualquier hilo)."""
+    model_name = 'models/gemini-2.0-flash'
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return mock.Mock(text=f'Resumen {len(self.prompts)}.')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SUMMARY_CHUNK_CHARS=2000)
+class MapReduceSummaryTests(TestCase):
+    """Los documentos largos se resumen por fragmentos y los fragmentos sin cambios no se repiten."""
+
+    def setUp(self):
+        self.text = ' '.join(f'La frase número {i} habla del tema {i % 7} con bastante detalle.' for i in range(300))
+
+    def test_chunks_are_bounded_and_keep_every_sentence(self):
+        chunks = summarization.chunk_text(self.text)
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(all(len(chunk) <= 2000 for chunk in chunks))
+        self.assertEqual(' '.join(chunks), self.text)
+        self.assertTrue(all(chunk.endswith('.') for chunk in chunks))
+
+    def test_small_edit_only_changes_nearby_chunks(self):
+        edited = self.text.replace('La frase número 150 habla', 'La frase número 150, ya corregida, habla')
+        before, after = summarization.chunk_text(self.text), summarization.chunk_text(edited)
+        self.assertLessEqual(len(set(after) - set(before)), 2)
+
+    def test_long_text_is_summarized_per_chunk_and_merged(self):
+        model = FakeSummaryModel()
+        summary, calls = summarization.summarize(model, self.text)
+        chunks = summarization.chunk_text(self.text)
+        self.assertEqual(calls, len(chunks) + 1)
+        self.assertIn('Únelos en un único resumen', model.prompts[-1])
+        self.assertEqual(summary, f'Resumen {calls}.')
+
+        # Otra vez el mismo texto: todo de la caché
+        self.assertEqual(summarization.summarize(model, self.text), (summary, 0))
+
+        # Tras una edición pequeña solo se resumen los fragmentos nuevos y la unión
+        edited = self.text.replace('La frase número 150 habla', 'La frase número 150, ya corregida, habla')
+        _, calls = summarization.summarize(model, edited)
+        changed = len(set(summarization.chunk_text(edited)) - set(chunks))
+        self.assertEqual(calls, changed + 1)
+
+    def test_reduce_reports_what_it_cuts_at_the_maximum_depth(self):
+        model = FakeSummaryModel()
+        # Resúmenes que no encogen: la unión nunca llega a caber
+        model.generate_content = lambda prompt: mock.Mock(text='Un resumen que no encoge nada. ' * 40)
+        summarizer = summarization._Summarizer(model)
+
+        with self.assertLogs('api.summarization', 'WARNING') as logs:
+            summarizer.reduce(summarization.chunk_text(self.text))
+
+        self.assertIn(f'tras {summarization.MAX_REDUCE_DEPTH} rondas se recortan', logs.output[0])
+
+    def test_short_text_uses_a_single_call(self):
+        model = FakeSummaryModel()
+        self.assertEqual(summarization.summarize(model, 'Texto corto.'), ('Resumen 1.', 1))
+        self.assertIn('Resume el siguiente texto', model.prompts[0])
+
+    @mock.patch('api.gemini_service.genai')
+    def test_mindmap_of_a_long_document_uses_the_whole_content(self, genai):
+        from .gemini_service import GeminiAssistant
+
+        user = User.objects.create_user(username='wendy', password='clave-segura-123')
+        user.profile.subscription_plan = 'premium'
+        user.profile.save()
+        document = Document.objects.create(owner=user, file=ContentFile(b'x', name='largo.txt'),
+                                           extracted_content=self.text)
+        model = genai.GenerativeModel.return_value = FakeSummaryModel()
+
+        assistant = GeminiAssistant(user)
+        result = assistant._execute_action({'action': 'create_mindmap', 'parameters': {'document_id': document.id}})
+        self.assertTrue(result['success'])
+        # El último fragmento también se resumió, y el mapa se hizo a partir del resumen
+        self.assertTrue(any('número 299' in prompt for prompt in model.prompts))
+        self.assertIn(f'Resumen {len(model.prompts) - 1}.', model.prompts[-1])
@@ -1,45 +1,113 @@
 import os
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
 from pypdf import PdfReader
 from docx import Document
 import io
 
+# Pool de procesos compartido para la extracción de PDFs grandes (se crea bajo demanda)
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
 def _extract_text_from_txt(file_path):
     """Extrae texto de un archivo .txt simple."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        print(f"Error leyendo TXT: {e}")
-        return ""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _extract_pages(reader, start, stop):
+    """Extrae las páginas [start, stop). Una página con error queda vacía sin afectar al resto."""
+    text = []
+    for number in range(start, stop):
+        try:
+            text.append(reader.pages[number].extract_text() or "")
+        except Exception as e:
+            print(f"Error leyendo la página {number + 1} del PDF: {e}")
+            text.append("")
+    return text
+
+def _extract_page_range(file_path, start, stop):
+    """Se ejecuta en un proceso del pool: abre su propio lector y extrae un rango de páginas."""
+    return _extract_pages(PdfReader(file_path), start, stop)
+
+def _get_pdf_executor(workers):
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # 'spawn' evita heredar hilos y conexiones del servidor o del worker
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_executor
+
+def _reset_pdf_executor():
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is not None:
+            _pdf_executor.shutdown(wait=False, cancel_futures=True)
+        _pdf_executor = None
+
+def _page_ranges(page_count, workers):
+    """Divide las páginas en rangos contiguos (dos por worker para repartir mejor la carga)."""
+    size = max(1, math.ceil(page_count / (workers * 2)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
 
 def _extract_text_from_pdf(file_path):
-    """Extrae texto de un archivo .pdf."""
+    """
+    Extrae texto de un archivo .pdf.
+
+    Los PDFs con al menos PDF_PARALLEL_MIN_PAGES páginas se reparten por rangos
+    entre PDF_EXTRACTION_WORKERS procesos y se reensamblan en orden.
+    """
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    workers = getattr(settings, 'PDF_EXTRACTION_WORKERS', 1)
+    min_pages = getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 50)
+
+    if workers <= 1 or page_count < min_pages:
+        return "\n".join(_extract_pages(reader, 0, page_count))
+
+    ranges = _page_ranges(page_count, workers)
     try:
-        reader = PdfReader(file_path)
-        text = []
-        for page in reader.pages:
-            text.append(page.extract_text() or "")
-        return "\n".join(text)
-    except Exception as e:
-        print(f"Error leyendo PDF: {e}")
-        return ""
+        executor = _get_pdf_executor(workers)
+        futures = [executor.submit(_extract_page_range, file_path, start, stop)
+                   for start, stop in ranges]
+    except (BrokenProcessPool, RuntimeError) as e:
+        print(f"Pool de extracción no disponible, se usa un solo proceso: {e}")
+        _reset_pdf_executor()
+        return "\n".join(_extract_pages(reader, 0, page_count))
+
+    text = []
+    for (start, stop), future in zip(ranges, futures):
+        try:
+            text.extend(future.result())
+        except BrokenProcessPool as e:
+            # Un proceso murió: se rehace el rango aquí y el pool se recrea la próxima vez
+            print(f"Proceso de extracción caído en páginas {start + 1}-{stop}: {e}")
+            _reset_pdf_executor()
+            text.extend(_extract_pages(reader, start, stop))
+        except Exception as e:
+            print(f"Error leyendo las páginas {start + 1}-{stop} del PDF: {e}")
+            text.extend([""] * (stop - start))
+    return "\n".join(text)
 
 def _extract_text_from_docx(file_path):
     """Extrae texto de un archivo .docx."""
-    try:
-        doc = Document(file_path)
-        text = []
-        for para in doc.paragraphs:
-            text.append(para.text)
-        return "\n".join(text)
-    except Exception as e:
-        print(f"Error leyendo DOCX: {e}")
-        return ""
+    doc = Document(file_path)
+    text = []
+    for para in doc.paragraphs:
+        text.append(para.text)
+    return "\n".join(text)
 
-def extract_text(document):
+def extract_text(document, strict=False):
     """
     Función principal que recibe un objeto Documento de Django,
     revisa su extensión y llama al extractor correspondiente.
+
+    Con strict=True los errores se propagan (lo usa el worker en segundo plano
+    para marcar el documento como fallido); si no, se devuelve "".
     """
     try:
         file_path = document.file.path
@@ -49,17 +117,19 @@ def extract_text(document):
 
         if extension == '.txt':
             return _extract_text_from_txt(file_path)
-        
+
         elif extension == '.pdf':
             return _extract_text_from_pdf(file_path)
-        
+
         elif extension == '.docx':
             return _extract_text_from_docx(file_path)
-        
+
         else:
             # Tipo de archivo no soportado
             return ""
-            
+
     except Exception as e:
+        if strict:
+            raise
         print(f"Error general al extraer texto del documento {document.id}: {e}")
-        return ""
\ No newline at end of file
+        return ""
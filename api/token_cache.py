@@ -0,0 +1,95 @@
+"""
+Caché token -> usuario para la autenticación por token (REST y WebSocket).
+
+LRU en memoria del proceso con caducidad (TOKEN_CACHE_TTL segundos) y tamaño
+máximo (TOKEN_CACHE_SIZE). Se guardan los valores de las columnas, no las
+instancias: cada petición recibe su propio User/Token, así que nada de lo que
+una vista cachee en request.user se comparte con otra. También se recuerdan
+los tokens inexistentes, para que una avalancha de reconexiones con un token
+inválido no llegue a la base de datos.
+
+Borrar un token o guardar/borrar su usuario lo invalida en este proceso
+(api/signals.py); en los demás procesos dura como mucho TOKEN_CACHE_TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+_USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+_TOKEN_FIELDS = [field.attname for field in Token._meta.concrete_fields]
+
+
+def _build(model, field_names, values):
+    return model.from_db('default', field_names, values)
+
+
+def get_cached(key):
+    """
+    (user, token) si el token está en la caché; (None, None) si se sabe que no
+    existe; None si no está en la caché (hay que llamar a lookup()).
+    """
+    with _lock:
+        cached = _entries.get(key)
+        if cached is None:
+            return None
+        row, expires_at = cached
+        if expires_at <= time.monotonic():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+    if row is None:
+        return None, None
+    user_values, token_values = row
+    return _build(User, _USER_FIELDS, user_values), _build(Token, _TOKEN_FIELDS, token_values)
+
+
+def lookup(key):
+    """(user, token) del token, o (None, None) si no existe. Consulta la base de datos solo si no está en caché."""
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+
+    token = Token.objects.select_related('user').filter(key=key).first()
+    row = None
+    if token is not None:
+        row = ([getattr(token.user, name) for name in _USER_FIELDS],
+               [getattr(token, name) for name in _TOKEN_FIELDS])
+    _remember(key, row)
+    if token is None:
+        return None, None
+    return token.user, token
+
+
+def _remember(key, row):
+    max_size = getattr(settings, 'TOKEN_CACHE_SIZE', 10000)
+    with _lock:
+        _entries[key] = (row, time.monotonic() + getattr(settings, 'TOKEN_CACHE_TTL', 60))
+        _entries.move_to_end(key)
+        while len(_entries) > max_size:
+            _entries.popitem(last=False)
+
+
+def invalidate(key):
+    with _lock:
+        _entries.pop(key, None)
+
+
+def invalidate_user(user_id):
+    """Olvida los tokens del usuario (cambió su cuenta, p. ej. is_active)."""
+    user_index = _USER_FIELDS.index('id')
+    with _lock:
+        for key, (row, _) in list(_entries.items()):
+            if row is not None and row[0][user_index] == user_id:
+                del _entries[key]
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -1,31 +1,263 @@
-from googletrans import Translator, LANGUAGES
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from googletrans import LANGUAGES
+from . import translation_cache, translation_memory
+from .segmentation import join_segments, sentence_units
+from .translation_backends import BackendUnavailable, backend_chain
 # 1. No necesitamos importar asyncio
 
-def translate_text(text, target_language, source_language=None):
-    """
-    Traduce un texto usando la librería googletrans (versión síncrona).
-    """
+def _validate_languages(target_language, source_language):
+    """Devuelve (error, source_language normalizado)."""
     # Validar que el idioma de destino sea válido
     if target_language not in LANGUAGES:
-        return {'error': f"El idioma de destino '{target_language}' no es válido."}
-
-    # --- INICIO DE LA CORRECCIÓN ---
-    # La librería es síncrona. Eliminamos async/await.
-    try:
-        translator = Translator()
-        
-        # Simplemente llamamos a la función, sin 'await'
-        if source_language and source_language in LANGUAGES:
-            translation = translator.translate(text, dest=target_language, src=source_language)
+        return {'error': f"El idioma de destino '{target_language}' no es válido."}, None
+    if source_language not in LANGUAGES:
+        source_language = None
+    return None, source_language
+
+def _cache_key(text, target_language, source_language, backends):
+    """Clave de caché para el primer backend disponible (None si no hay ninguno)."""
+    if not backends:
+        return None
+    return translation_cache.make_key(text, target_language, source_language, backends[0].name)
+
+def translate_text(text, target_language, source_language=None, backend=None):
+    """
+    Traduce un texto con el backend preferido ('backend', normalmente
+    Profile.preferred_translation_api) y, si falla, con los siguientes de
+    TRANSLATION_BACKEND_ORDER (ver api/translation_backends.py).
+
+    Las traducciones correctas se guardan en la caché de dos niveles
+    (api/translation_cache.py), así que repetir la misma traducción no sale a la red.
+    """
+    error, source_language = _validate_languages(target_language, source_language)
+    if error:
+        return error
+
+    backends = backend_chain(backend)
+    key = _cache_key(text, target_language, source_language, backends)
+    cached = translation_cache.get(key) if key else None
+    if cached is not None:
+        return cached
+
+    result, backend_name = _translate_uncached(text, target_language, source_language, backends)
+    if 'error' not in result:
+        translation_cache.put(
+            translation_cache.make_key(text, target_language, source_language, backend_name), result)
+    return result
+
+async def translate_text_async(text, target_language, source_language=None, backend=None):
+    """
+    Variante asyncio de translate_text para el chat: la llamada de red se hace con
+    el cliente asíncrono (sin pasar por un hilo) y la LRU en memoria se consulta
+    directamente; solo el nivel de base de datos de la caché usa un hilo.
+    """
+    error, source_language = _validate_languages(target_language, source_language)
+    if error:
+        return error
+
+    backends = backend_chain(backend)
+    key = _cache_key(text, target_language, source_language, backends)
+    cached = translation_cache.get_local(key) if key else None
+    if cached is None and key:
+        cached = await sync_to_async(translation_cache.get_shared)(key)
+    if cached is not None:
+        return cached
+
+    last_error = 'No hay ningún backend de traducción disponible.'
+    for candidate in backends:
+        try:
+            translated, detected = await candidate.call_async(text, target_language, source_language)
+        except Exception as e:
+            last_error = f"{candidate.name}: {e!r}"
+            print(f"Error del backend de traducción {candidate.name}: {e!r}")
+            continue
+        result = {'translated_text': translated, 'detected_source_language': detected}
+        await sync_to_async(translation_cache.put)(
+            translation_cache.make_key(text, target_language, source_language, candidate.name), result)
+        return result
+    return {'error': f"Ocurrió un error durante la traducción: {last_error}"}
+
+def translate_document_text(text, target_language, source_language=None, on_progress=None, backend=None):
+    """
+    Traduce un texto largo frase a frase, consultando antes la memoria de
+    traducción (api/translation_memory.py): solo las frases nuevas se traducen,
+    agrupadas en lotes de como mucho TRANSLATION_SEGMENT_MAX_CHARS caracteres
+    (una frase por línea). Cada lote se busca en la caché de traducciones
+    (api/translation_cache.py) y los que no están se mandan al backend en
+    paralelo con TRANSLATION_WORKERS hilos. El resultado se reensambla en orden.
+
+    Además de translated_text y detected_source_language devuelve
+    reused_segments, total_segments y reuse_ratio (frases servidas por la memoria).
+
+    La memoria y la caché se consultan y se rellenan desde el hilo que llama: los
+    hilos del pool solo hacen llamadas de red (no abren conexiones a la base de datos).
+    on_progress(hechas, total) se llama, también desde ese hilo, tras cada lote.
+    """
+    error, source_language = _validate_languages(target_language, source_language)
+    if error:
+        return error
+
+    max_chars = getattr(settings, 'TRANSLATION_SEGMENT_MAX_CHARS', 4500)
+    units = sentence_units(text, max_chars)
+    results = [None] * len(units)
+    sentences = []
+    for index, (unit, _) in enumerate(units):
+        if not unit.strip():
+            # Solo espacios: no hace falta traducirlo
+            results[index] = unit
         else:
-            translation = translator.translate(text, dest=target_language)
-
-        return {
-            'translated_text': translation.text,
-            'detected_source_language': translation.src
-        }
-    # --- FIN DE LA CORRECCIÓN ---
-    except Exception as e:
-        # El error que viste (can't be used in 'await' expression)
-        # se estaba generando aquí.
-        return {'error': f"Ocurrió un error during la traducción: {str(e)}"}
\ No newline at end of file
+            sentences.append(index)
+
+    # La memoria y la caché se consultan para el backend preferido, como translate_text
+    backends = backend_chain(backend)
+    primary = backends[0].name if backends else None
+    known = translation_memory.lookup(
+        [units[index][0] for index in sentences], target_language, source_language, primary)
+    detected_languages = []
+    pending = []
+    for index, memory_hit in zip(sentences, known):
+        if memory_hit is None:
+            pending.append(index)
+            continue
+        translated, detected = memory_hit
+        results[index] = _restore_spacing(units[index][0], translated)
+        detected_languages.append(detected)
+    reused = len(sentences) - len(pending)
+
+    total = len(units)
+    done = total - len(pending)
+    learned = {}
+
+    def apply(batch, result):
+        nonlocal done
+        for (index, sentence), line in zip(batch, result['lines']):
+            results[index] = _restore_spacing(units[index][0], line)
+            learned.setdefault(result['backend'], []).append(
+                (sentence, line, result['detected_source_language']))
+        detected_languages.append(result['detected_source_language'])
+        done += len(batch)
+
+    batches = []
+    for batch in _pack_sentences([(index, units[index][0].strip()) for index in pending], max_chars):
+        key = _cache_key(_batch_text(batch), target_language, source_language, backends)
+        cached = translation_cache.get(key) if key else None
+        lines = cached['translated_text'].split('\n') if cached else []
+        if len(lines) == len(batch):
+            apply(batch, {'lines': lines, 'backend': primary,
+                          'detected_source_language': cached['detected_source_language']})
+        else:
+            batches.append(batch)
+    if on_progress:
+        on_progress(done, total)
+
+    workers = max(1, min(getattr(settings, 'TRANSLATION_WORKERS', 4), len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        translated = executor.map(
+            lambda batch: _translate_batch(batch, target_language, source_language, backend), batches)
+        for batch, result in zip(batches, translated):
+            if 'error' in result:
+                executor.shutdown(wait=False, cancel_futures=True)
+                return result
+            translation_cache.put(
+                translation_cache.make_key(_batch_text(batch), target_language, source_language,
+                                           result['backend']),
+                {'translated_text': '\n'.join(result['lines']),
+                 'detected_source_language': result['detected_source_language']})
+            apply(batch, result)
+            if on_progress:
+                on_progress(done, total)
+
+    for backend_name, pairs in learned.items():
+        translation_memory.store(pairs, target_language, source_language, backend_name)
+
+    detected = next((language for language in detected_languages if language), source_language)
+    return {
+        'translated_text': join_segments(results, units),
+        'detected_source_language': detected,
+        'reused_segments': reused,
+        'total_segments': len(sentences),
+        'reuse_ratio': reused / len(sentences) if sentences else 0.0,
+    }
+
+def _restore_spacing(original, translated):
+    """Conserva los espacios de los extremos de la frase original."""
+    stripped = original.strip()
+    start = original.index(stripped)
+    return original[:start] + translated + original[start + len(stripped):]
+
+def _pack_sentences(sentences, max_chars):
+    """Agrupa frases (índice, texto) consecutivas en lotes de como mucho max_chars (una por línea)."""
+    batches = []
+    size = 0
+    for item in sentences:
+        if batches and size + 1 + len(item[1]) <= max_chars:
+            batches[-1].append(item)
+            size += 1 + len(item[1])
+        else:
+            batches.append([item])
+            size = len(item[1])
+    return batches
+
+def _batch_text(batch):
+    return '\n'.join(sentence for _, sentence in batch)
+
+def _translate_batch(batch, target_language, source_language, backend=None):
+    """
+    Traduce un lote de frases en una sola llamada (unidas por saltos de línea).
+    Si el backend no devuelve una línea por frase, se traducen una a una.
+    Devuelve {'lines', 'detected_source_language', 'backend'} o {'error'}.
+    """
+    result, backend_name = _translate_segment_with_retry(
+        _batch_text(batch), target_language, source_language, backend)
+    if 'error' in result:
+        return result
+    lines = result['translated_text'].split('\n')
+    if len(lines) == len(batch):
+        return {'lines': [line.strip() for line in lines], 'backend': backend_name,
+                'detected_source_language': result['detected_source_language']}
+
+    lines = []
+    for _, sentence in batch:
+        single, _ = _translate_segment_with_retry(sentence, target_language, source_language, backend)
+        if 'error' in single:
+            return single
+        lines.append(single['translated_text'].strip())
+    return {'lines': lines, 'backend': backend_name,
+            'detected_source_language': result['detected_source_language']}
+
+def _translate_segment_with_retry(text, target_language, source_language, backend=None):
+    """Traduce un segmento reintentando con espera exponencial (TRANSLATION_SEGMENT_ATTEMPTS intentos)."""
+    attempts = getattr(settings, 'TRANSLATION_SEGMENT_ATTEMPTS', 3)
+    for attempt in range(attempts):
+        # La cadena se recalcula en cada intento: un backend puede haber abierto su circuito
+        result, backend_name = _translate_uncached(
+            text, target_language, source_language, backend_chain(backend))
+        if 'error' not in result:
+            return result, backend_name
+        print(f"Error traduciendo un segmento (intento {attempt + 1}/{attempts}): {result['error']}")
+        if attempt + 1 < attempts:
+            time.sleep(getattr(settings, 'TRANSLATION_RETRY_DELAY', 0.5) * 2 ** attempt)
+    return result, None
+
+def _translate_uncached(text, target_language, source_language, backends):
+    """
+    Prueba los backends en orden hasta que uno responda.
+    Devuelve (resultado, nombre del backend que tradujo).
+    """
+    last_error = 'No hay ningún backend de traducción disponible.'
+    for candidate in backends:
+        try:
+            translated, detected = candidate.call(text, target_language, source_language)
+        except BackendUnavailable as e:
+            last_error = str(e)
+            continue
+        except Exception as e:
+            last_error = f"{candidate.name}: {e!r}"
+            print(f"Error del backend de traducción {candidate.name}: {e!r}")
+            continue
+        return {'translated_text': translated, 'detected_source_language': detected}, candidate.name
+    return {'error': f"Ocurrió un error durante la traducción: {last_error}"}, None
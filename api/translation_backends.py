@@ -0,0 +1,267 @@
+"""
+Backends de traducción intercambiables.
+
+- Cada backend se registra con @register_backend y se elige por usuario con
+  Profile.preferred_translation_api; si falla, se prueba el siguiente de
+  TRANSLATION_BACKEND_ORDER.
+- Cada backend tiene su tiempo máximo (TRANSLATION_BACKEND_TIMEOUTS), también
+  en las llamadas síncronas (se esperan en un hilo con ese límite), y un
+  interruptor (circuit breaker) que lo saca de la rotación durante
+  TRANSLATION_CIRCUIT_COOLDOWN segundos cuando, en las últimas llamadas, la tasa
+  de error o la latencia p95 superan los umbrales configurados.
+- 'offline' es un backend determinista y sin red para pruebas de carga y CI.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .translation_client import get_async_translator, get_translator_pool
+
+BACKENDS = {}
+
+# Hilos para las llamadas síncronas con tiempo máximo (compartidos por todos los backends)
+SYNC_CALL_WORKERS = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def register_backend(cls):
+    """Decorador que registra una clase de backend bajo su atributo 'name'."""
+    BACKENDS[cls.name] = cls()
+    return cls
+
+
+class BackendUnavailable(Exception):
+    """No queda ningún backend disponible (todos fallaron o tienen el circuito abierto)."""
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SYNC_CALL_WORKERS,
+                                           thread_name_prefix='translation-backend')
+        return _executor
+
+
+class CircuitBreaker:
+    """
+    Ventana de las últimas llamadas (latencia, ok) de un backend.
+    closed -> open cuando se superan los umbrales; open -> half_open pasado el
+    enfriamiento (se deja pasar una llamada de prueba); half_open -> closed si va bien.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = deque(maxlen=getattr(settings, 'TRANSLATION_CIRCUIT_WINDOW', 50))
+            self.state = self.CLOSED
+            self.opened_at = None
+            self.total_calls = 0
+            self.total_errors = 0
+            self._trial_running = False
+
+    def available(self):
+        """¿Se le puede mandar trabajo? (no consume la llamada de prueba del estado half_open)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            cooldown = getattr(settings, 'TRANSLATION_CIRCUIT_COOLDOWN', 30)
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= cooldown
+            return not self._trial_running
+
+    def allow(self):
+        """Como available(), pero en half_open reserva la única llamada de prueba."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            cooldown = getattr(settings, 'TRANSLATION_CIRCUIT_COOLDOWN', 30)
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= cooldown:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.total_calls += 1
+            self.total_errors += 0 if ok else 1
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if ok:
+                    self.calls.clear()
+                    self.state = self.CLOSED
+                else:
+                    self._open()
+                return
+            self.calls.append((latency, ok))
+            if self.state == self.CLOSED and self._unhealthy():
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def _error_rate(self):
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+    def _percentile(self, fraction):
+        latencies = sorted(latency for latency, _ in self.calls)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, math.ceil(fraction * len(latencies)) - 1)]
+
+    def _unhealthy(self):
+        if len(self.calls) < getattr(settings, 'TRANSLATION_CIRCUIT_MIN_CALLS', 5):
+            return False
+        return (self._error_rate() > getattr(settings, 'TRANSLATION_CIRCUIT_MAX_ERROR_RATE', 0.5)
+                or self._percentile(0.95) > getattr(settings, 'TRANSLATION_CIRCUIT_MAX_P95', 8.0))
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'calls': self.total_calls,
+                'errors': self.total_errors,
+                'window_error_rate': self._error_rate(),
+                'p50_seconds': self._percentile(0.5),
+                'p95_seconds': self._percentile(0.95),
+            }
+
+
+class TranslationBackend:
+    """Base de los backends: translate() devuelve (texto_traducido, idioma_detectado) o lanza un error."""
+    name = None
+    default_timeout = 10.0
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+
+    @property
+    def timeout(self):
+        timeouts = getattr(settings, 'TRANSLATION_BACKEND_TIMEOUTS', {})
+        return timeouts.get(self.name, self.default_timeout)
+
+    def translate(self, text, target_language, source_language=None):
+        raise NotImplementedError
+
+    async def translate_async(self, text, target_language, source_language=None):
+        """Por defecto, la versión síncrona en un hilo."""
+        return await sync_to_async(self.translate, thread_sensitive=False)(
+            text, target_language, source_language)
+
+    def call(self, text, target_language, source_language=None):
+        """translate() con el tiempo máximo del backend, midiendo latencia y errores para el circuit breaker."""
+        if not self.breaker.allow():
+            raise BackendUnavailable(f"El backend '{self.name}' está fuera de servicio temporalmente.")
+        started = time.monotonic()
+        future = _get_executor().submit(self.translate, text, target_language, source_language)
+        try:
+            # Pasado el tiempo máximo se deja de esperar (el hilo termina con el timeout de httpx)
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.breaker.record(time.monotonic() - started, ok=False)
+            raise TimeoutError(f"El backend '{self.name}' no respondió en {self.timeout} s.")
+        except Exception:
+            self.breaker.record(time.monotonic() - started, ok=False)
+            raise
+        self.breaker.record(time.monotonic() - started, ok=True)
+        return result
+
+    async def call_async(self, text, target_language, source_language=None):
+        if not self.breaker.allow():
+            raise BackendUnavailable(f"El backend '{self.name}' está fuera de servicio temporalmente.")
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                self.translate_async(text, target_language, source_language), self.timeout)
+        except Exception:
+            self.breaker.record(time.monotonic() - started, ok=False)
+            raise
+        self.breaker.record(time.monotonic() - started, ok=True)
+        return result
+
+
+@register_backend
+class GoogleTranslateBackend(TranslationBackend):
+    """Google Translate a través de googletrans (pool síncrono y cliente asíncrono)."""
+    name = 'google_translate'
+
+    def translate(self, text, target_language, source_language=None):
+        with get_translator_pool(self.timeout).acquire() as translator:
+            # Timeout de este backend en cada petición (el del pool solo cuenta al crearlo)
+            translator.client.timeout = httpx.Timeout(self.timeout)
+            if source_language:
+                translation = translator.translate(text, dest=target_language, src=source_language)
+            else:
+                translation = translator.translate(text, dest=target_language)
+        return translation.text, translation.src
+
+    async def translate_async(self, text, target_language, source_language=None):
+        return await get_async_translator(self.timeout).translate(
+            text, target_language, source_language or 'auto')
+
+
+@register_backend
+class OfflineBackend(TranslationBackend):
+    """
+    Backend local y determinista (sin red): devuelve el texto marcado con el idioma
+    de destino. Pensado para pruebas de carga y CI, no para usuarios reales.
+    """
+    name = 'offline'
+    default_timeout = 1.0
+
+    def translate(self, text, target_language, source_language=None):
+        return f'[{target_language}] {text}', source_language or 'auto'
+
+    async def translate_async(self, text, target_language, source_language=None):
+        return self.translate(text, target_language, source_language)
+
+
+def get_backend(name):
+    return BACKENDS.get(name)
+
+
+def backend_chain(preferred=None):
+    """
+    Backends a probar, en orden: el preferido del usuario y después los de
+    TRANSLATION_BACKEND_ORDER. Se omiten los que tienen el circuito abierto.
+    """
+    names = []
+    for name in [preferred, *getattr(settings, 'TRANSLATION_BACKEND_ORDER', ['google_translate'])]:
+        if name in BACKENDS and name not in names:
+            names.append(name)
+    return [BACKENDS[name] for name in names if BACKENDS[name].breaker.available()]
+
+
+def selectable_backends():
+    """Backends que los usuarios pueden elegir como preferido (TRANSLATION_USER_BACKENDS)."""
+    return [name for name in getattr(settings, 'TRANSLATION_USER_BACKENDS', ['google_translate'])
+            if name in BACKENDS]
+
+
+def preferred_backend_for(user):
+    """Backend elegido en el perfil del usuario (None si no tiene perfil)."""
+    profile = getattr(user, 'profile', None) if user is not None else None
+    return getattr(profile, 'preferred_translation_api', None)
+
+
+def metrics():
+    """Latencia, errores y estado del circuito de cada backend (en este proceso)."""
+    return {name: backend.breaker.metrics() for name, backend in BACKENDS.items()}
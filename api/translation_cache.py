@@ -0,0 +1,160 @@
+"""
+Caché de traducciones en dos niveles.
+
+1. LRU en memoria del proceso (TRANSLATION_CACHE_LOCAL_SIZE entradas).
+2. Tabla TranslationCacheEntry compartida por todos los procesos, con caducidad
+   (TRANSLATION_CACHE_TTL segundos) y tamaño máximo (TRANSLATION_CACHE_MAX_ENTRIES).
+
+La clave es (sha256(texto), origen, destino, backend). Solo se guardan
+traducciones correctas; los errores nunca se cachean.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TranslationCacheEntry
+
+AUTO_SOURCE = 'auto'
+
+_local = OrderedDict()
+_lock = threading.Lock()
+_stats = {'local_hits': 0, 'db_hits': 0, 'misses': 0}
+_writes_since_eviction = 0
+
+
+def make_key(text, target_language, source_language, backend):
+    text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return (text_hash, source_language or AUTO_SOURCE, target_language, backend)
+
+
+def _count(counter):
+    with _lock:
+        _stats[counter] += 1
+
+
+def stats():
+    """Contadores de aciertos/fallos de este proceso (y la tasa de acierto)."""
+    with _lock:
+        counters = dict(_stats)
+    lookups = sum(counters.values())
+    hits = counters['local_hits'] + counters['db_hits']
+    counters['hit_ratio'] = hits / lookups if lookups else 0.0
+    return counters
+
+
+def clear_local():
+    """Vacía la LRU en memoria y reinicia los contadores (la tabla no se toca)."""
+    with _lock:
+        _local.clear()
+        for counter in _stats:
+            _stats[counter] = 0
+
+
+def _ttl():
+    return getattr(settings, 'TRANSLATION_CACHE_TTL', 30 * 24 * 3600)
+
+
+def _remember_locally(key, value):
+    max_size = getattr(settings, 'TRANSLATION_CACHE_LOCAL_SIZE', 1000)
+    with _lock:
+        _local[key] = (value, time.monotonic() + _ttl())
+        _local.move_to_end(key)
+        while len(_local) > max_size:
+            _local.popitem(last=False)
+
+
+def get(key):
+    """Devuelve {'translated_text', 'detected_source_language'} o None."""
+    cached = get_local(key)
+    if cached is not None:
+        return cached
+    return get_shared(key)
+
+
+def get_local(key):
+    """Solo el nivel en memoria (no toca la base de datos; seguro desde código async)."""
+    with _lock:
+        cached = _local.get(key)
+        if cached is None:
+            return None
+        value, expires_at = cached
+        if expires_at <= time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        _stats['local_hits'] += 1
+        return dict(value)
+
+
+def get_shared(key):
+    """Solo el nivel de base de datos; un acierto se copia también a la LRU en memoria."""
+    text_hash, source_language, target_language, backend = key
+    entry = TranslationCacheEntry.objects.filter(
+        text_hash=text_hash, source_language=source_language,
+        target_language=target_language, backend=backend,
+        last_used_at__gte=timezone.now() - timedelta(seconds=_ttl()),
+    ).values('pk', 'translated_text', 'detected_source_language').first()
+    if entry is None:
+        _count('misses')
+        return None
+
+    TranslationCacheEntry.objects.filter(pk=entry['pk']).update(
+        hit_count=F('hit_count') + 1, last_used_at=timezone.now())
+    value = {
+        'translated_text': entry['translated_text'],
+        'detected_source_language': entry['detected_source_language'],
+    }
+    _remember_locally(key, value)
+    _count('db_hits')
+    return dict(value)
+
+
+def put(key, value):
+    """Guarda una traducción correcta en ambos niveles."""
+    global _writes_since_eviction
+    _remember_locally(key, dict(value))
+
+    text_hash, source_language, target_language, backend = key
+    try:
+        with transaction.atomic():
+            TranslationCacheEntry.objects.update_or_create(
+                text_hash=text_hash, source_language=source_language,
+                target_language=target_language, backend=backend,
+                defaults={
+                    'translated_text': value['translated_text'],
+                    'detected_source_language': value.get('detected_source_language') or '',
+                    'last_used_at': timezone.now(),
+                })
+    except IntegrityError:
+        # Otro proceso la guardó a la vez: la suya vale igual
+        pass
+
+    with _lock:
+        _writes_since_eviction += 1
+        due = _writes_since_eviction >= getattr(settings, 'TRANSLATION_CACHE_EVICT_EVERY', 100)
+        if due:
+            _writes_since_eviction = 0
+    if due:
+        evict()
+
+
+def evict(max_entries=None):
+    """Borra las entradas caducadas y, si sobran, las usadas hace más tiempo."""
+    if max_entries is None:
+        max_entries = getattr(settings, 'TRANSLATION_CACHE_MAX_ENTRIES', 100000)
+    TranslationCacheEntry.objects.filter(
+        last_used_at__lt=timezone.now() - timedelta(seconds=_ttl())).delete()
+
+    cutoff = TranslationCacheEntry.objects.order_by('-last_used_at', '-pk').values_list(
+        'last_used_at', 'pk')[max_entries:max_entries + 1].first()
+    if cutoff is not None:
+        last_used_at, pk = cutoff
+        TranslationCacheEntry.objects.filter(last_used_at__lt=last_used_at).delete()
+        TranslationCacheEntry.objects.filter(last_used_at=last_used_at, pk__lte=pk).delete()
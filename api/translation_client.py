@@ -0,0 +1,205 @@
+"""
+Clientes de traducción reutilizables.
+
+- TranslatorPool: pool de googletrans.Translator de larga duración (cada uno con su
+  httpx.Client y sus conexiones keep-alive). Cada hilo toma uno en exclusiva, así
+  que es seguro usarlo desde el pool de segmentos o desde varias peticiones.
+- AsyncTranslator: variante asyncio para el chat. Hace la misma petición RPC que
+  googletrans con un httpx.AsyncClient compartido por bucle de eventos.
+
+La petición RPC y el análisis de la respuesta reproducen detalles internos de
+googletrans (Translator._translate, _build_rpc_request): solo se usan con la
+versión comprobada (RPC_COMPATIBLE_VERSION, fijada en requirements.txt y
+cubierta por pruebas de contrato en api/tests.py). Con otra versión,
+AsyncTranslator usa la API pública síncrona a través del pool, en un hilo.
+
+La concurrencia se limita con TRANSLATION_CLIENT_POOL_SIZE.
+"""
+import asyncio
+import json
+import queue
+import threading
+import weakref
+from contextlib import contextmanager
+
+import googletrans
+import httpx
+from django.conf import settings
+from googletrans import Translator
+from googletrans.client import RPC_ID
+from googletrans.constants import DEFAULT_CLIENT_SERVICE_URLS, DEFAULT_USER_AGENT
+from googletrans.urls import TRANSLATE_RPC
+
+# Versión de googletrans cuyo protocolo RPC reproduce AsyncTranslator
+RPC_COMPATIBLE_VERSION = '4.0.0'
+# Parámetros de la petición, tal como los envía Translator._translate en esa versión
+RPC_PARAMS = {
+    'rpcids': RPC_ID,
+    'bl': 'boq_translate-webserver_20201207.13_p0',
+    'soc-app': 1,
+    'soc-platform': 1,
+    'soc-device': 1,
+    'rt': 'c',
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+# Un AsyncTranslator por bucle de eventos (un httpx.AsyncClient no puede cambiar de bucle)
+_async_translators = weakref.WeakKeyDictionary()
+
+
+def _pool_size():
+    return getattr(settings, 'TRANSLATION_CLIENT_POOL_SIZE', 4)
+
+
+def _timeout(seconds=None):
+    return httpx.Timeout(seconds or getattr(settings, 'TRANSLATION_CLIENT_TIMEOUT', 10.0))
+
+
+class TranslatorPool:
+    """Pool acotado de Translator que se crean bajo demanda y se reutilizan."""
+
+    def __init__(self, size, timeout=None):
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_translator(self):
+        return Translator(timeout=self.timeout)
+
+    @contextmanager
+    def acquire(self):
+        """Presta un Translator en exclusiva; si están todos ocupados, espera a que se libere uno."""
+        try:
+            translator = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    translator = self._new_translator()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                translator = self._idle.get()
+        try:
+            yield translator
+        finally:
+            self._idle.put(translator)
+
+    def close(self):
+        while True:
+            try:
+                translator = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            translator.client.close()
+            with self._lock:
+                self._created -= 1
+
+
+def get_translator_pool(timeout=None):
+    """Pool compartido del proceso; 'timeout' (segundos) solo cuenta al crearlo."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TranslatorPool(_pool_size(), _timeout(timeout))
+        return _pool
+
+
+def reset_translator_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+
+
+def rpc_compatible():
+    """True si la versión instalada de googletrans es la del protocolo reproducido."""
+    return googletrans.__version__ == RPC_COMPATIBLE_VERSION and hasattr(Translator, '_build_rpc_request')
+
+
+def parse_rpc_response(data, src):
+    """
+    Interpreta la respuesta de batchexecute igual que googletrans.Translator.translate.
+    Devuelve (texto_traducido, idioma_origen_detectado).
+    """
+    brackets = [0, 0]
+    token_found = False
+    response = ''
+    for line in data.split('\n'):
+        token_found = token_found or f'"{RPC_ID}"' in line[:30]
+        if not token_found:
+            continue
+        in_string = False
+        for index, char in enumerate(line):
+            if char == '"' and line[max(0, index - 1)] != '\\':
+                in_string = not in_string
+            if not in_string:
+                if char == '[':
+                    brackets[0] += 1
+                elif char == ']':
+                    brackets[1] += 1
+        response += line
+        if brackets[0] == brackets[1]:
+            break
+
+    parsed = json.loads(json.loads(response)[0][2])
+    spacing = parsed[1][0][0][3]
+    translated = (' ' if spacing else '').join(part[0] for part in parsed[1][0][0][5])
+
+    if src == 'auto':
+        try:
+            src = parsed[2] or parsed[0][2]
+        except (IndexError, TypeError):
+            pass
+    return translated, src
+
+
+class AsyncTranslator:
+    """Cliente asyncio con conexiones keep-alive y un máximo de peticiones simultáneas."""
+
+    def __init__(self, size, timeout=None):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+            headers={'User-Agent': DEFAULT_USER_AGENT, 'Referer': 'https://translate.google.com'},
+        )
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def translate(self, text, dest, src='auto'):
+        """Devuelve (texto_traducido, idioma_origen_detectado)."""
+        if not rpc_compatible():
+            return await asyncio.to_thread(self._translate_with_pool, text, dest, src)
+        url = TRANSLATE_RPC.format(host=DEFAULT_CLIENT_SERVICE_URLS[0])
+        data = {'f.req': Translator._build_rpc_request(text, dest, src)}
+        async with self._semaphore:
+            response = await self.client.post(url, params=RPC_PARAMS, data=data)
+        response.raise_for_status()
+        return parse_rpc_response(response.text, src)
+
+    def _translate_with_pool(self, text, dest, src):
+        with get_translator_pool().acquire() as translator:
+            translation = translator.translate(text, dest=dest, src=src)
+        return translation.text, translation.src
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def get_async_translator(timeout=None):
+    """AsyncTranslator del bucle de eventos actual (se crea la primera vez)."""
+    loop = asyncio.get_running_loop()
+    translator = _async_translators.get(loop)
+    if translator is None:
+        translator = AsyncTranslator(_pool_size(), _timeout(timeout))
+        _async_translators[loop] = translator
+    return translator
@@ -0,0 +1,124 @@
+"""
+Memoria de traducción por frases (TranslationMemoryEntry).
+
+Antes de mandar un documento al backend se buscan todas sus frases en la
+memoria (consultas por lotes de hashes); solo las que no están se traducen, y
+después se guardan para los siguientes documentos.
+
+La clave incluye el backend que tradujo la frase, como en
+api/translation_cache.py: lo que devuelve un backend de reserva (p. ej. el
+'offline') nunca se sirve a quien pide otro. La tabla tiene caducidad
+(TRANSLATION_MEMORY_TTL segundos) y tamaño máximo
+(TRANSLATION_MEMORY_MAX_ENTRIES, se borran las usadas hace más tiempo).
+"""
+import hashlib
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TranslationMemoryEntry
+
+AUTO_SOURCE = 'auto'
+LOOKUP_BATCH = 500
+
+_WHITESPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_writes_since_eviction = 0
+
+
+def normalize(text):
+    """Forma canónica de una frase: espacios colapsados y sin espacios en los extremos."""
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def sentence_hash(text):
+    return hashlib.sha256(normalize(text).encode('utf-8')).hexdigest()
+
+
+def _ttl():
+    return getattr(settings, 'TRANSLATION_MEMORY_TTL', 90 * 24 * 3600)
+
+
+def lookup(texts, target_language, source_language, backend):
+    """
+    Busca las frases en la memoria del backend. Devuelve una lista alineada con
+    'texts' con (traducción, idioma_detectado) o None para las que no se conocen.
+    """
+    source_language = source_language or AUTO_SOURCE
+    hashes = [sentence_hash(text) for text in texts]
+    found = {}
+    unique_hashes = list(dict.fromkeys(hashes))
+    for start in range(0, len(unique_hashes), LOOKUP_BATCH):
+        batch = unique_hashes[start:start + LOOKUP_BATCH]
+        for entry in TranslationMemoryEntry.objects.filter(
+                source_hash__in=batch, source_language=source_language,
+                target_language=target_language, backend=backend,
+                last_used_at__gte=timezone.now() - timedelta(seconds=_ttl()),
+        ).values('pk', 'source_hash', 'target_text', 'detected_source_language'):
+            found[entry['source_hash']] = entry
+
+    if found:
+        TranslationMemoryEntry.objects.filter(pk__in=[entry['pk'] for entry in found.values()]).update(
+            use_count=F('use_count') + 1, last_used_at=timezone.now())
+
+    return [
+        (found[digest]['target_text'], found[digest]['detected_source_language'])
+        if digest in found else None
+        for digest in hashes
+    ]
+
+
+def store(pairs, target_language, source_language, backend):
+    """
+    Guarda pares (frase origen, traducción, idioma_detectado) que tradujo 'backend'.
+    Si la frase ya estaba (p. ej. caducada y aún sin borrar), se sustituye.
+    """
+    global _writes_since_eviction
+    source_language = source_language or AUTO_SOURCE
+    entries = {}
+    for source_text, target_text, detected in pairs:
+        digest = sentence_hash(source_text)
+        entries[digest] = TranslationMemoryEntry(
+            source_hash=digest,
+            source_language=source_language,
+            target_language=target_language,
+            backend=backend,
+            source_text=normalize(source_text),
+            target_text=target_text,
+            detected_source_language=detected or '',
+            last_used_at=timezone.now(),
+        )
+    if not entries:
+        return
+    TranslationMemoryEntry.objects.bulk_create(
+        entries.values(), batch_size=LOOKUP_BATCH, update_conflicts=True,
+        unique_fields=['source_hash', 'source_language', 'target_language', 'backend'],
+        update_fields=['source_text', 'target_text', 'detected_source_language', 'last_used_at'])
+
+    with _lock:
+        _writes_since_eviction += len(entries)
+        due = _writes_since_eviction >= getattr(settings, 'TRANSLATION_MEMORY_EVICT_EVERY', 500)
+        if due:
+            _writes_since_eviction = 0
+    if due:
+        evict()
+
+
+def evict(max_entries=None):
+    """Borra las frases caducadas y, si sobran, las usadas hace más tiempo."""
+    if max_entries is None:
+        max_entries = getattr(settings, 'TRANSLATION_MEMORY_MAX_ENTRIES', 500000)
+    TranslationMemoryEntry.objects.filter(
+        last_used_at__lt=timezone.now() - timedelta(seconds=_ttl())).delete()
+
+    cutoff = TranslationMemoryEntry.objects.order_by('-last_used_at', '-pk').values_list(
+        'last_used_at', 'pk')[max_entries:max_entries + 1].first()
+    if cutoff is not None:
+        last_used_at, pk = cutoff
+        TranslationMemoryEntry.objects.filter(last_used_at__lt=last_used_at).delete()
+        TranslationMemoryEntry.objects.filter(last_used_at=last_used_at, pk__lte=pk).delete()
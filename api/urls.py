@@ -2,7 +2,7 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import test_endpoint, ProfileDetailView, FolderViewSet, DocumentViewSet, TagViewSet, TranslationHistoryViewSet, ai_assistant, upgrade_to_premium
+from .views import test_endpoint, ProfileDetailView, FolderViewSet, DocumentViewSet, TagViewSet, TranslationHistoryViewSet, BackgroundJobViewSet, ai_assistant, upgrade_to_premium, translation_cache_stats, translation_backend_metrics
 
 # Creamos un router y registramos nuestros viewsets
 router = DefaultRouter()
@@ -10,12 +10,15 @@ router.register(r'folders', FolderViewSet, basename='folder')
 router.register(r'documents', DocumentViewSet, basename='document')
 router.register(r'tags', TagViewSet, basename='tag')
 router.register(r'translation-history', TranslationHistoryViewSet, basename='translation-history')
+router.register(r'jobs', BackgroundJobViewSet, basename='job')
 
 urlpatterns = [
     path('test/', test_endpoint, name='test_endpoint'),
     path('profile/', ProfileDetailView.as_view(), name='profile-detail'),
     path('ai-assistant/', ai_assistant, name='ai-assistant'),
     path('upgrade-premium/', upgrade_to_premium, name='upgrade-premium'),
+    path('translation-cache/stats/', translation_cache_stats, name='translation-cache-stats'),
+    path('translation-backends/metrics/', translation_backend_metrics, name='translation-backend-metrics'),
     # Las URLs para la API de documentos y carpetas son generadas por el router
     path('', include(router.urls)),
 ]
@@ -1,37 +1,40 @@
 from .models import TranslationHistory
 from .serializers import TranslationHistorySerializer
-from .translation import translate_text
+from .translation import LANGUAGES, translate_text
 import os
-from django.http import JsonResponse, FileResponse, HttpResponse
+from django.http import JsonResponse, FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics, permissions, viewsets
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter
 from rest_framework.decorators import action
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Count, Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from dj_rest_auth.registration.views import RegisterView, VerifyEmailView 
 from allauth.account.models import EmailConfirmation
 from django.urls import reverse
-from .models import Profile, Folder, Document, Tag, DocumentPermission
-from .serializers import ProfileSerializer, FolderSerializer, DocumentSerializer, TagSerializer, DocumentPermissionSerializer
+from .models import BackgroundJob, Profile, Folder, Document, Tag, DocumentPermission, TranslationCacheEntry
+from .serializers import group_folders_by_parent, BackgroundJobSerializer, ProfileSerializer, FolderSerializer, DocumentSerializer, DocumentListSerializer, TagSerializer, DocumentPermissionSerializer
+from .pagination import KeysetCursorPagination
 from .permissions import IsOwnerOrHasPermission
 from django.contrib.auth.models import User
-from .text_extractor import extract_text
+from .jobs import enqueue_job
+from .blobs import acquire_blob, release_blob
+from .search import DocumentFullTextSearchFilter, reindex_user_documents
 from django.shortcuts import redirect
-from io import BytesIO
 from docx import Document as DocxDocument
 from rest_framework.exceptions import PermissionDenied
 
-# IMPORTACIONES PARA PDF
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
-
 from .gemini_service import GeminiAssistant
 from rest_framework.decorators import api_view, permission_classes
-from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date
+from . import pdf_stream, quotas, render_cache, translation_backends, translation_cache
+from .translation_backends import preferred_backend_for
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def test_endpoint(request):
@@ -52,12 +55,26 @@ def upgrade_to_premium(request):
     """Simula el pago exitoso y actualiza el plan a Premium."""
     profile = request.user.profile
     profile.subscription_plan = 'premium'
-    profile.save()
+    profile.save(update_fields=['subscription_plan'])
     return Response({
         'message': '¡Pago simulado exitoso! Ahora eres usuario Premium.',
         'plan': 'premium'
     }, status=200)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def translation_cache_stats(request):
+    """Aciertos/fallos de la caché de traducciones (este proceso) y tamaño de la tabla."""
+    totals = TranslationCacheEntry.objects.aggregate(
+        entries=Count('id'), stored_hits=Coalesce(Sum('hit_count'), 0))
+    return Response({**translation_cache.stats(), **totals}, status=200)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def translation_backend_metrics(request):
+    """Latencia p50/p95, errores y estado del circuito de cada backend de traducción (este proceso)."""
+    return Response(translation_backends.metrics(), status=200)
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def ai_assistant(request):
@@ -65,31 +82,21 @@ def ai_assistant(request):
     if not prompt:
         return Response({'error': 'El prompt es requerido'}, status=400)
 
-    # --- LÓGICA DE LÍMITES DE IA ---
-    profile = request.user.profile
-    today = timezone.now().date()
-    
-    # Resetear contador si es un nuevo día
-    if profile.last_ai_request_date != today:
-        profile.daily_ai_requests_count = 0
-        profile.last_ai_request_date = today
-    
-    # Definir límites
-    limit = 30 if profile.subscription_plan == 'premium' else 5
-    
-    if profile.daily_ai_requests_count >= limit:
+    # --- LÓGICA DE LÍMITES DE IA (api/quotas.py) ---
+    plan = request.user.profile.subscription_plan
+    if not quotas.consume(request.user.id, quotas.AI_REQUESTS, plan):
+        limit = quotas.limit_for(plan, quotas.AI_REQUESTS)
         return Response({
             'error': f'Has alcanzado tu límite diario de {limit} peticiones de IA. Mejora a Premium para más.'
         }, status=403)
-    
-    # Incrementar contador
-    profile.daily_ai_requests_count += 1
-    profile.save()
     # --------------------------------
 
     try:
         assistant = GeminiAssistant(request.user)
         result = assistant.process_command(prompt)
+        if assistant.served_from_cache:
+            # Repetición de algo ya generado (api/llm_cache.py): no gasta cuota
+            quotas.release(request.user.id, quotas.AI_REQUESTS)
         return Response(result, status=200)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
@@ -127,6 +134,13 @@ class ProfileDetailView(generics.RetrieveUpdateAPIView):
             user=self.request.user)
         return profile
 
+    def perform_update(self, serializer):
+        previous_language = serializer.instance.language_preference
+        profile = serializer.save()
+        # El índice de búsqueda usa el idioma del propietario para el stemming
+        if profile.language_preference != previous_language:
+            reindex_user_documents(profile.user)
+
 
 class FolderViewSet(viewsets.ModelViewSet):
     """ViewSet para gestionar las carpetas de los usuarios."""
@@ -134,19 +148,43 @@ class FolderViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return self.request.user.folders.filter(parent=None)
+        return self.request.user.folders.all()
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def perform_destroy(self, instance):
+        # Borra todo el subárbol de una vez usando la ruta materializada
+        instance.get_subtree().delete()
+
+    def _tree_serializer(self, folders, children, many=True):
+        """Serializa carpetas con sus subcarpetas ya agrupadas en memoria (sin consultas por nodo)."""
+        context = self.get_serializer_context()
+        context['folder_children'] = children
+        return self.get_serializer(folders, many=many, context=context)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Devuelve las carpetas raíz con todo su árbol, cargado con una sola consulta.
+        """
+        folders = self.get_queryset().select_related('owner').order_by('id')
+        children = group_folders_by_parent(folders)
+        return Response(self._tree_serializer(children[None], children).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        folder = self.get_object()
+        subtree = folder.get_subtree().select_related('owner').order_by('id')
+        children = group_folders_by_parent(subtree)
+        return Response(self._tree_serializer(folder, children, many=False).data)
+
     @action(detail=False, methods=['get'], url_path='list-all')
     def list_all(self, request):
         """
         Devuelve una lista plana de TODAS las carpetas del usuario.
         """
-        queryset = self.request.user.folders.all()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        folders = list(self.get_queryset().select_related('owner').order_by('id'))
+        children = group_folders_by_parent(folders)
+        return Response(self._tree_serializer(folders, children).data)
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -165,140 +203,213 @@ class DocumentViewSet(viewsets.ModelViewSet):
     """ViewSet para gestionar los documentos de los usuarios."""
     serializer_class = DocumentSerializer
     permission_classes = [IsOwnerOrHasPermission]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         user = self.request.user
-        return Document.objects.filter(
-            Q(owner=user) | Q(permissions__user=user)
-        ).distinct()
-
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    search_fields = ['file', 'tags__name', 'extracted_content']
+        # Permiso del usuario, indicador de compartido y propietario se resuelven en
+        # la misma consulta; las etiquetas se precargan en una sola consulta extra.
+        caller_permission = DocumentPermission.objects.filter(
+            document=OuterRef('pk'), user=user).values('permission_level')[:1]
+        # El filtro usa un IN sin correlacionar; las anotaciones solo se calculan para las filas devueltas
+        shared_with_user = DocumentPermission.objects.filter(user=user).values('document')
+        queryset = Document.objects.filter(
+            Q(owner=user) | Q(pk__in=shared_with_user)
+        ).annotate(
+            caller_permission=Subquery(caller_permission),
+            has_shares=Exists(DocumentPermission.objects.filter(document=OuterRef('pk'))),
+        ).select_related('owner').prefetch_related('tags').defer('search_vector')
+
+        # El listado no carga el contenido extraído salvo que se pida con ?include_content=true;
+        # la descarga solo lo lee si el artefacto no está ya en caché.
+        if (self.action == 'list' and not self._include_content()) or self.action in ('download', 'translate_document'):
+            queryset = queryset.defer('extracted_content')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list' and not self._include_content():
+            return DocumentListSerializer
+        return DocumentSerializer
+
+    def _include_content(self):
+        value = self.request.query_params.get('include_content', '')
+        return value.lower() in ('true', '1', 't')
+
+    # UC-15: ?search= usa el índice de texto completo (ver api/search.py)
+    filter_backends = [DjangoFilterBackend, DocumentFullTextSearchFilter]
     filterset_fields = ['tags', 'folder']
 
     def perform_create(self, serializer):
         user = self.request.user
-        if user.profile.subscription_plan == 'free':
-            doc_count = Document.objects.filter(owner=user).count()
-            if doc_count >= 5:
-                raise PermissionDenied("Has alcanzado el límite de 5 documentos gratuitos. Pásate a Premium.")
+        # Reserva el hueco antes de subir (comprobación y suma atómicas); si la subida falla se devuelve
+        plan = user.profile.subscription_plan
+        if not quotas.consume(user.id, quotas.DOCUMENTS, plan):
+            limit = quotas.limit_for(plan, quotas.DOCUMENTS)
+            raise PermissionDenied(f"Has alcanzado el límite de {limit} documentos gratuitos. Pásate a Premium.")
 
-        document = serializer.save(owner=user)
         try:
-            content = extract_text(document)
-            if content:
-                document.extracted_content = content
-                document.save()
-        except Exception as e:
-            print(f"No se pudo extraer el contenido del documento {document.id}: {e}")
+            with transaction.atomic():
+                self._save_with_blob(serializer, owner=user)
+        except Exception:
+            quotas.release(user.id, quotas.DOCUMENTS)
+            raise
+
+    def perform_update(self, serializer):
+        if 'file' not in serializer.validated_data:
+            serializer.save()
+            return
+        # Se reemplaza el archivo: el documento pasa a otro blob y suelta el anterior
+        previous_blob_id = serializer.instance.blob_id
+        with transaction.atomic():
+            self._save_with_blob(serializer)
+            release_blob(previous_blob_id)
+
+    def _save_with_blob(self, serializer, **extra):
+        """
+        Guarda el archivo subido en el almacén por contenido (api/blobs.py). Si los mismos
+        bytes ya se subieron antes, se reutiliza el blob y su texto extraído; si no, la
+        extracción se hace en segundo plano (manage.py run_jobs) y el estado queda
+        visible en 'extraction_status'.
+        """
+        uploaded = serializer.validated_data['file']
+        upload_hashes = getattr(self.request, 'upload_sha256', {})
+        blob, created = acquire_blob(uploaded, sha256=upload_hashes.get('file'))
+
+        reuse_text = not created and blob.text_extracted
+        document = serializer.save(
+            file=blob.file.name,
+            blob=blob,
+            original_name=os.path.basename(uploaded.name),
+            extracted_content=blob.extracted_text if reuse_text else '',
+            extraction_status=Document.EXTRACTION_DONE if reuse_text else Document.EXTRACTION_PENDING,
+            **extra,
+        )
+        if not reuse_text:
+            enqueue_job('extract_text', {'document_id': document.id}, user=document.owner)
+        return document
+
+    # Formatos de descarga: extensión -> (formato, Content-Type)
+    DOWNLOAD_FORMATS = {
+        'pdf': 'application/pdf',
+        'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'txt': 'text/plain; charset=utf-8',
+    }
+    EMPTY_CONTENT_MESSAGE = "Este documento no tiene contenido de texto extraído."
 
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         """
         Acción personalizada que genera un documento en el formato original
         (PDF o DOCX) usando el contenido actual (extracted_content).
+
+        El archivo generado se guarda en la caché de artefactos (api/render_cache.py)
+        con clave (id, modified_at, formato), y la respuesta lleva ETag/Last-Modified
+        para que el navegador pueda revalidar con un 304. Los PDFs no cacheados se
+        envían en streaming mientras se generan (api/pdf_stream.py).
         """
         document = self.get_object()
 
-        # 1. Obtener el contenido de texto actual
-        content = document.extracted_content
-        if not content:
-            content = "Este documento no tiene contenido de texto extraído."
-
-        # 2. Detectar la extensión del archivo ORIGINAL
-        original_filename = document.file.name
+        # 1. Detectar la extensión del archivo ORIGINAL
+        original_filename = document.display_name
         _, original_extension = os.path.splitext(original_filename)
         original_extension = original_extension.lower()
         
         base_filename = os.path.basename(os.path.splitext(original_filename)[0])
 
-        try:
-            # 3. GENERAR PDF si el original era PDF
-            if original_extension == '.pdf':
-                return self._generate_pdf_response(content, base_filename)
-            
-            # 4. GENERAR DOCX si el original era DOCX/DOC
-            elif original_extension in ['.docx', '.doc']:
-                return self._generate_docx_response(content, base_filename)
-            
-            # 5. GENERAR TXT para otros formatos
-            else:
-                return self._generate_txt_response(content, base_filename)
+        # 2. PDF si el original era PDF, DOCX si era DOCX/DOC, TXT para otros formatos
+        if original_extension == '.pdf':
+            file_format = 'pdf'
+        elif original_extension in ['.docx', '.doc']:
+            file_format = 'docx'
+        else:
+            file_format = 'txt'
+
+        key = render_cache.cache_key(document.pk, document.modified_at, file_format)
+        etag = f'"{key}"'
+        last_modified = int(document.modified_at.timestamp())
+
+        # 3. Revalidación: si el cliente ya tiene esta versión, 304 sin generar nada
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return self._with_cache_headers(not_modified, etag, last_modified)
+
+        filename = f"{base_filename}_contenido.{file_format}"
+        cached = render_cache.open_cached(key, file_format)
+        if cached is None and file_format == 'pdf':
+            # 4a. PDF: se genera página a página mientras se envía y se guarda en la caché,
+            # leyendo el texto por trozos (memoria acotada aunque el documento sea enorme)
+            chunks = render_cache.stream_put(
+                key, file_format,
+                pdf_stream.iter_pdf(f"Documento: {base_filename}", self._pdf_lines(document)))
+            response = StreamingHttpResponse(
+                pdf_stream.streaming_content(request, chunks),
+                content_type=self.DOWNLOAD_FORMATS[file_format])
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+            return self._with_cache_headers(response, etag, last_modified)
+
+        if cached is None:
+            # 4b. Obtener el contenido de texto actual (diferido en la consulta)
+            content = document.extracted_content
+            if not content:
+                content = self.EMPTY_CONTENT_MESSAGE
+            try:
+                cached = self._render_to_cache(key, file_format, content, base_filename)
+            except Exception:
+                logger.exception("Error al generar el archivo %s del documento %s; se envía como TXT",
+                                 file_format, document.pk)
+                # Fallback: devolver como TXT
+                file_format = 'txt'
+                filename = f"{base_filename}_contenido.{file_format}"
+                key = render_cache.cache_key(document.pk, document.modified_at, file_format)
+                cached = self._render_to_cache(key, file_format, content, base_filename)
 
-        except Exception as e:
-            print(f"Error al generar el archivo: {e}")
-            # Fallback: devolver como TXT
-            return self._generate_txt_response(content, base_filename)
-
-    def _generate_pdf_response(self, content, base_filename):
-        """Genera un PDF con el contenido."""
-        buffer = BytesIO()
-        pdf = SimpleDocTemplate(buffer, pagesize=letter)
-        
-        # Estilos
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=12,
-        )
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['BodyText'],
-            fontSize=11,
-            leading=14,
+        response = FileResponse(
+            cached,
+            as_attachment=True,
+            filename=filename
         )
-        
-        # Contenido del PDF
-        story = []
-        title = Paragraph(f"Documento: {base_filename}", title_style)
-        story.append(title)
-        story.append(Spacer(1, 0.2 * inch))
-        
-        # Dividir en párrafos
-        for line in content.split('\n'):
-            if line.strip():
-                # Escapar caracteres especiales de XML
-                safe_line = line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                p = Paragraph(safe_line, body_style)
-                story.append(p)
-                story.append(Spacer(1, 0.1 * inch))
-        
-        pdf.build(story)
-        buffer.seek(0)
-        
-        response = HttpResponse(buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{base_filename}_contenido.pdf"'
+        response['Content-Type'] = self.DOWNLOAD_FORMATS[file_format]
+        return self._with_cache_headers(response, etag, last_modified)
+
+    @staticmethod
+    def _with_cache_headers(response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Descarga privada del usuario: el navegador puede guardarla pero debe revalidar
+        patch_cache_control(response, private=True, no_cache=True)
         return response
 
-    def _generate_docx_response(self, content, base_filename):
+    def _render_to_cache(self, key, file_format, content, base_filename):
+        renderers = {
+            'docx': self._render_docx,
+            'txt': self._render_txt,
+        }
+        render = renderers[file_format]
+        try:
+            return render_cache.put(key, file_format, lambda output: render(content, base_filename, output))
+        except FileNotFoundError:
+            # Otro proceso lo evictó antes de poder abrirlo: se genera de nuevo
+            return render_cache.put(key, file_format, lambda output: render(content, base_filename, output))
+
+    @classmethod
+    def _pdf_lines(cls, document):
+        """Líneas del contenido leídas por trozos, o el aviso si el documento no tiene texto."""
+        empty = True
+        for line in pdf_stream.iter_document_lines(document.pk, document.modified_at):
+            empty = False
+            yield line
+        if empty:
+            yield cls.EMPTY_CONTENT_MESSAGE
+
+    def _render_docx(self, content, base_filename, output):
         """Genera un DOCX con el contenido."""
         new_doc = DocxDocument()
         new_doc.add_paragraph(content)
-        
-        buffer = BytesIO()
-        new_doc.save(buffer)
-        buffer.seek(0)
+        new_doc.save(output)
 
-        response = FileResponse(
-            buffer,
-            as_attachment=True,
-            filename=f"{base_filename}_contenido.docx"
-        )
-        response['Content-Type'] = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        return response
-
-    def _generate_txt_response(self, content, base_filename):
+    def _render_txt(self, content, base_filename, output):
         """Genera un TXT con el contenido."""
-        buffer = BytesIO(content.encode('utf-8'))
-        response = FileResponse(
-            buffer,
-            as_attachment=True,
-            filename=f"{base_filename}_contenido.txt"
-        )
-        response['Content-Type'] = 'text/plain; charset=utf-8'
-        return response
+        output.write(content.encode('utf-8'))
 
     @action(detail=True, methods=['post'], url_path='share')
     def share(self, request, pk=None):
@@ -347,7 +458,8 @@ class DocumentViewSet(viewsets.ModelViewSet):
             return Response({'error': 'El campo "text" es requerido.'}, status=400)
 
         result = translate_text(
-            text_to_translate, target_language, source_language)
+            text_to_translate, target_language, source_language,
+            backend=preferred_backend_for(request.user))
 
         if 'error' in result:
             return Response(result, status=400)
@@ -366,6 +478,10 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def translate_document(self, request, pk=None):
         """
         UC-17 & UC-18: Traduce el contenido extraído de un documento.
+
+        La traducción se hace en segundo plano (trabajo 'translate_document'): se
+        responde 202 con el id del trabajo, el avance llega por ws/jobs/ y el
+        resultado queda en el historial de traducciones.
         """
         document = self.get_object()
         target_language = request.data.get('target_language')
@@ -374,24 +490,27 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if not target_language:
             return Response({'error': 'El campo "target_language" es requerido.'}, status=400)
 
-        if not document.extracted_content:
+        if target_language not in LANGUAGES:
+            return Response({'error': f"El idioma de destino '{target_language}' no es válido."}, status=400)
+
+        if not Document.objects.filter(pk=document.pk).exclude(extracted_content='').exists():
             return Response({'error': 'El documento no tiene contenido extraído para traducir.'}, status=400)
 
-        result = translate_text(
-            document.extracted_content, target_language, source_language)
+        job = enqueue_job('translate_document', {
+            'document_id': document.pk,
+            'target_language': target_language,
+            'source_language': source_language,
+        }, user=request.user)
+        return Response({'job_id': job.pk, 'status': job.status}, status=202)
 
-        if 'error' in result:
-            return Response(result, status=400)
 
-        TranslationHistory.objects.create(
-            original_document=document,
-            user=request.user,
-            source_language=result['detected_source_language'],
-            target_language=target_language,
-            translated_content=result['translated_text']
-        )
+class BackgroundJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado de los trabajos en segundo plano del usuario (alternativa al WebSocket)."""
+    serializer_class = BackgroundJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
-        return Response(result, status=200)
+    def get_queryset(self):
+        return BackgroundJob.objects.filter(user=self.request.user).order_by('-created_at')
 
 
 class TranslationHistoryViewSet(viewsets.ReadOnlyModelViewSet):
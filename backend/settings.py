@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Búsqueda de texto completo (SearchVector, GinIndex)
     'corsheaders',
     'api',
     'chat',
@@ -157,8 +159,8 @@ SITE_ID = 1
 # Configuración de Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        # Usaremos autenticación por Token
-        'rest_framework.authentication.TokenAuthentication',
+        # Usaremos autenticación por Token (con caché token -> usuario, api/token_cache.py)
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         # Habilitamos el backend de filtros de django-filter
@@ -186,8 +188,198 @@ CORS_ALLOWED_ORIGINS = [
 # Opcional: Permite que el frontend envíe cookies (necesario para sesiones)
 CORS_ALLOW_CREDENTIALS = True
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# --- Capa de canales (chat y avance de trabajos) ---
+# CHANNEL_LAYER_BACKEND:
+# - 'redis': channels_redis para varias máquinas. CHANNEL_REDIS_URLS admite varias
+#   URLs separadas por comas; los grupos (salas) y canales se reparten entre ellas
+#   por hash del nombre.
+# - 'postgres' (por defecto): LISTEN/NOTIFY de la base de datos (chat/layers.py),
+#   para varios procesos Daphne y 'run_jobs' en una máquina sin servicios extra.
+# - 'memory': un solo proceso (el avance de los trabajos solo llega si corren
+#   dentro de Daphne, con BACKGROUND_JOBS_INLINE). Es la que usa 'manage.py test'
+#   si no se indica otra: la base de datos de pruebas no puede borrarse con
+#   conexiones LISTEN abiertas.
+CHANNEL_REDIS_URLS = [url.strip() for url in os.environ.get('CHANNEL_REDIS_URLS', '').split(',') if url.strip()]
+TESTING = sys.argv[1:2] == ['test']
+CHANNEL_LAYER_BACKEND = os.environ.get(
+    'CHANNEL_LAYER_BACKEND',
+    'redis' if CHANNEL_REDIS_URLS else 'memory' if TESTING else 'postgres')
+CHANNEL_LAYER_CAPACITY = int(os.environ.get('CHANNEL_LAYER_CAPACITY', 100))
+CHANNEL_LAYER_EXPIRY = int(os.environ.get('CHANNEL_LAYER_EXPIRY', 60))
+
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': CHANNEL_REDIS_URLS or ['redis://localhost:6379/0'],
+                'capacity': CHANNEL_LAYER_CAPACITY,
+                'expiry': CHANNEL_LAYER_EXPIRY,
+            },
+        },
+    }
+elif CHANNEL_LAYER_BACKEND == 'postgres':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'chat.layers.PostgresChannelLayer',
+            'CONFIG': {
+                'capacity': CHANNEL_LAYER_CAPACITY,
+                'expiry': CHANNEL_LAYER_EXPIRY,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# --- Caché de tokens (api/token_cache.py) ---
+# Token -> usuario para REST y WebSocket. Un token borrado deja de valer al
+# momento en este proceso y, como mucho, TOKEN_CACHE_TTL segundos después en los demás.
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+
+# --- Cuotas por plan (api/quotas.py) ---
+# None = sin límite. Los mensajes y las peticiones a la IA se cuentan en una
+# ventana deslizante de QUOTA_WINDOWS segundos; los documentos no tienen ventana
+# (cuentan los que el usuario tiene guardados). Cada conexión de chat reserva
+# los mensajes de QUOTA_LEASE_SIZE en QUOTA_LEASE_SIZE (como mucho un cuarto
+# del límite, para que otras conexiones del usuario también puedan reservar).
+QUOTA_LIMITS = {
+    'free': {
+        'ai_requests': int(os.environ.get('QUOTA_FREE_AI_REQUESTS', 5)),
+        'chat_messages': int(os.environ.get('QUOTA_FREE_CHAT_MESSAGES', 10)),
+        'documents': int(os.environ.get('QUOTA_FREE_DOCUMENTS', 5)),
+    },
+    'premium': {
+        'ai_requests': int(os.environ.get('QUOTA_PREMIUM_AI_REQUESTS', 30)),
+        'chat_messages': None,
+        'documents': None,
     },
-}
\ No newline at end of file
+}
+QUOTA_WINDOWS = {
+    'ai_requests': int(os.environ.get('QUOTA_AI_REQUESTS_WINDOW', 24 * 3600)),
+    'chat_messages': int(os.environ.get('QUOTA_CHAT_MESSAGES_WINDOW', 24 * 3600)),
+}
+QUOTA_LEASE_SIZE = int(os.environ.get('QUOTA_LEASE_SIZE', 10))
+
+# --- Asistente de IA (api/assistant_context.py) ---
+# El prompt lleva como mucho ASSISTANT_CONTEXT_MAX_DOCUMENTS documentos (los más
+# relevantes para la petición) y ASSISTANT_CONTEXT_MAX_TOKENS tokens de contexto.
+# Las carpetas y etiquetas del usuario se guardan en memoria hasta que cambia su
+# versión (Profile.catalog_version), así que no hace falta caducidad.
+ASSISTANT_CONTEXT_MAX_DOCUMENTS = int(os.environ.get('ASSISTANT_CONTEXT_MAX_DOCUMENTS', 50))
+ASSISTANT_CONTEXT_MAX_TOKENS = int(os.environ.get('ASSISTANT_CONTEXT_MAX_TOKENS', 2000))
+
+# Etiquetado automático (api/auto_tagging.py): TAG_ALL_BATCH_SIZE documentos por
+# petición a Gemini, TAG_ALL_WORKERS peticiones a la vez y como mucho
+# TAG_ALL_REQUESTS_PER_MINUTE por minuto. De cada documento se envían TAG_ALL_EXCERPT_CHARS caracteres.
+TAG_ALL_BATCH_SIZE = int(os.environ.get('TAG_ALL_BATCH_SIZE', 20))
+TAG_ALL_WORKERS = int(os.environ.get('TAG_ALL_WORKERS', 4))
+TAG_ALL_REQUESTS_PER_MINUTE = int(os.environ.get('TAG_ALL_REQUESTS_PER_MINUTE', 60))
+TAG_ALL_EXCERPT_CHARS = int(os.environ.get('TAG_ALL_EXCERPT_CHARS', 500))
+
+# Caché de respuestas de Gemini (api/llm_cache.py): resúmenes, mapas conceptuales,
+# carpetas y etiquetas sugeridas para un mismo texto se reutilizan durante LLM_CACHE_TTL
+# segundos; como mucho LLM_CACHE_MAX_ENTRIES entradas (se borran las menos usadas
+# cada LLM_CACHE_EVICT_EVERY escrituras). Una petición servida entera desde la caché no gasta cuota.
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 30 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 20000))
+LLM_CACHE_EVICT_EVERY = int(os.environ.get('LLM_CACHE_EVICT_EVERY', 100))
+
+# Resúmenes (api/summarization.py): los textos de más de SUMMARY_CHUNK_CHARS caracteres
+# se resumen por fragmentos (SUMMARY_WORKERS a la vez) y después se unen los resúmenes.
+SUMMARY_CHUNK_CHARS = int(os.environ.get('SUMMARY_CHUNK_CHARS', 8000))
+SUMMARY_WORKERS = int(os.environ.get('SUMMARY_WORKERS', 4))
+
+# --- Chat (chat/consumers.py) ---
+# Historial (chat/history.py): los mensajes se guardan por lotes cada
+# CHAT_HISTORY_FLUSH_INTERVAL segundos (o al juntar CHAT_HISTORY_BATCH_SIZE).
+# Al reconectar con ?last_seen=<id> se reenvían como mucho CHAT_HISTORY_REPLAY_LIMIT;
+# el resto se pide a /api/chat/rooms/<sala>/messages/. Un mensaje que no se puede
+# guardar se reintenta CHAT_HISTORY_MAX_ATTEMPTS veces como mucho.
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.environ.get('CHAT_HISTORY_FLUSH_INTERVAL', 0.5))
+CHAT_HISTORY_BATCH_SIZE = int(os.environ.get('CHAT_HISTORY_BATCH_SIZE', 100))
+CHAT_HISTORY_ID_BLOCK = int(os.environ.get('CHAT_HISTORY_ID_BLOCK', 100))
+CHAT_HISTORY_REPLAY_LIMIT = int(os.environ.get('CHAT_HISTORY_REPLAY_LIMIT', 200))
+CHAT_HISTORY_MAX_ATTEMPTS = int(os.environ.get('CHAT_HISTORY_MAX_ATTEMPTS', 5))
+# Conexiones abiertas (chat/presence.py): cada proceso refresca las suyas cada
+# CHAT_MEMBER_REFRESH_INTERVAL segundos; las no refrescadas en CHAT_MEMBER_STALE_AFTER se borran.
+CHAT_MEMBER_REFRESH_INTERVAL = int(os.environ.get('CHAT_MEMBER_REFRESH_INTERVAL', 60))
+CHAT_MEMBER_STALE_AFTER = int(os.environ.get('CHAT_MEMBER_STALE_AFTER', 180))
+
+# --- Trabajos en segundo plano (api/jobs.py) ---
+# Se procesan con 'python manage.py run_jobs'. En desarrollo sin worker puede
+# activarse BACKGROUND_JOBS_INLINE para ejecutarlos en el mismo proceso.
+BACKGROUND_JOBS_INLINE = os.environ.get(
+    'BACKGROUND_JOBS_INLINE', 'False').lower() in ('true', '1', 't')
+# Mientras se ejecuta un trabajo, su worker renueva locked_at cada
+# JOB_HEARTBEAT_INTERVAL segundos (debe ser bastante menor que STALE_JOB_TIMEOUT).
+JOB_HEARTBEAT_INTERVAL = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', 60))
+
+# --- Extracción de texto de PDFs (api/text_extractor.py) ---
+# Los PDFs con al menos PDF_PARALLEL_MIN_PAGES páginas se extraen en paralelo
+# con un pool de PDF_EXTRACTION_WORKERS procesos; los pequeños, en un solo proceso.
+PDF_EXTRACTION_WORKERS = int(os.environ.get(
+    'PDF_EXTRACTION_WORKERS', min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 50))
+
+# --- Subidas ---
+# Sha256UploadHandler calcula el hash del archivo mientras se recibe, para el
+# almacén por contenido (api/blobs.py); los demás son los manejadores por defecto.
+FILE_UPLOAD_HANDLERS = [
+    'api.blobs.Sha256UploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# --- Caché de descargas generadas (api/render_cache.py) ---
+# PDFs/DOCX/TXT generados por /documents/<id>/download/, con evicción LRU.
+RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', str(BASE_DIR / 'render_cache'))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# --- Caché de traducciones (api/translation_cache.py) ---
+# LRU en memoria por proceso + tabla compartida con caducidad y tamaño máximo.
+TRANSLATION_CACHE_LOCAL_SIZE = int(os.environ.get('TRANSLATION_CACHE_LOCAL_SIZE', 1000))
+TRANSLATION_CACHE_TTL = int(os.environ.get('TRANSLATION_CACHE_TTL', 30 * 24 * 3600))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.environ.get('TRANSLATION_CACHE_MAX_ENTRIES', 100000))
+TRANSLATION_CACHE_EVICT_EVERY = int(os.environ.get('TRANSLATION_CACHE_EVICT_EVERY', 100))
+
+# --- Traducción de documentos por segmentos (api/translation.py) ---
+# Los documentos se cortan por párrafos/frases y se traducen en paralelo.
+TRANSLATION_SEGMENT_MAX_CHARS = int(os.environ.get('TRANSLATION_SEGMENT_MAX_CHARS', 4500))
+TRANSLATION_WORKERS = int(os.environ.get('TRANSLATION_WORKERS', 4))
+TRANSLATION_SEGMENT_ATTEMPTS = int(os.environ.get('TRANSLATION_SEGMENT_ATTEMPTS', 3))
+TRANSLATION_RETRY_DELAY = float(os.environ.get('TRANSLATION_RETRY_DELAY', 0.5))
+
+# --- Memoria de traducción (api/translation_memory.py) ---
+# Frases ya traducidas (por backend), con caducidad y tamaño máximo.
+TRANSLATION_MEMORY_TTL = int(os.environ.get('TRANSLATION_MEMORY_TTL', 90 * 24 * 3600))
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get('TRANSLATION_MEMORY_MAX_ENTRIES', 500000))
+TRANSLATION_MEMORY_EVICT_EVERY = int(os.environ.get('TRANSLATION_MEMORY_EVICT_EVERY', 500))
+
+# --- Clientes de traducción (api/translation_client.py) ---
+# Translators de larga duración con conexiones keep-alive; también limita las
+# peticiones simultáneas del cliente asíncrono del chat.
+TRANSLATION_CLIENT_POOL_SIZE = int(os.environ.get('TRANSLATION_CLIENT_POOL_SIZE', TRANSLATION_WORKERS))
+TRANSLATION_CLIENT_TIMEOUT = float(os.environ.get('TRANSLATION_CLIENT_TIMEOUT', 10))
+
+# --- Backends de traducción (api/translation_backends.py) ---
+# Se usa el preferido del usuario (Profile.preferred_translation_api) y, si falla,
+# los de esta lista en orden. 'offline' es determinista y sin red (CI, pruebas de carga).
+TRANSLATION_BACKEND_ORDER = os.environ.get('TRANSLATION_BACKEND_ORDER', 'google_translate').split(',')
+# Backends que cada usuario puede elegir en su perfil ('offline' no: es para pruebas).
+TRANSLATION_USER_BACKENDS = os.environ.get('TRANSLATION_USER_BACKENDS', 'google_translate').split(',')
+TRANSLATION_BACKEND_TIMEOUTS = {
+    'google_translate': TRANSLATION_CLIENT_TIMEOUT,
+    'offline': 1.0,
+}
+# Circuit breaker: sobre las últimas TRANSLATION_CIRCUIT_WINDOW llamadas de un backend,
+# se abre si la tasa de error o la latencia p95 superan el umbral.
+TRANSLATION_CIRCUIT_WINDOW = int(os.environ.get('TRANSLATION_CIRCUIT_WINDOW', 50))
+TRANSLATION_CIRCUIT_MIN_CALLS = int(os.environ.get('TRANSLATION_CIRCUIT_MIN_CALLS', 5))
+TRANSLATION_CIRCUIT_MAX_ERROR_RATE = float(os.environ.get('TRANSLATION_CIRCUIT_MAX_ERROR_RATE', 0.5))
+TRANSLATION_CIRCUIT_MAX_P95 = float(os.environ.get('TRANSLATION_CIRCUIT_MAX_P95', 8.0))
+TRANSLATION_CIRCUIT_COOLDOWN = float(os.environ.get('TRANSLATION_CIRCUIT_COOLDOWN', 30))
@@ -8,6 +8,7 @@ from django.shortcuts import redirect
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('api/chat/', include('chat.urls')),
     path('api/auth/register/', CustomRegisterView.as_view(), name='custom_register'),
     re_path(r'^api/auth/register/account-confirm-email/(?P<key>[-:\w]+)/$',
             CustomVerifyEmailView.as_view(), name='account_confirm_email'),
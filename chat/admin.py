@@ -1,3 +1,12 @@
 from django.contrib import admin
 
+from .models import ChatMessage
+
 # Register your models here.
+
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'room', 'username', 'source_language', 'created_at')
+    list_filter = ('room',)
+    search_fields = ('message', 'username')
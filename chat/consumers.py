@@ -1,13 +1,25 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
-from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from api.jobs import job_group_name
 from api.models import Profile 
-from api.translation import translate_text
+from api.quotas import CHAT_MESSAGES, QuotaBucket
+from api.signals import profile_group_name
+from api.translation import translate_text_async
+from . import history, presence
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Sala de chat con traducción. El idioma, el plan y el backend del usuario se
+    cargan una vez al conectar (self.state) y se recargan cuando llega
+    'profile.changed' (api/signals.py). La cuota de mensajes se reserva por lotes
+    (api/quotas.QuotaBucket) y lo que sobra se devuelve al desconectar.
+    """
     
     async def connect(self):
         # Obtenemos el nombre de la sala desde la URL
@@ -22,16 +34,32 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # 1. Unirse al grupo de la sala
+        # Estado del usuario para toda la conexión (una consulta)
+        self.state = await self.load_user_state()
+        self.quota = QuotaBucket(self.user.id, CHAT_MESSAGES, self.state['plan'])
+        self.room_languages = None
+
+        # 1. Unirse al grupo de la sala (y al del perfil, para enterarse de sus cambios)
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        self.profile_group_name = profile_group_name(self.user.id)
+        await self.channel_layer.group_add(self.profile_group_name, self.channel_name)
         
+        # Registrar el idioma de esta conexión para que los emisores traduzcan a él
+        await self.join_room(self.state['language'])
+
         # 2. Aceptar la conexiÃ³n WebSocket
         await self.accept()
         print(f"Usuario {self.user.username} conectado a la sala: {self.room_name}")
 
+        # Al reconectar (?last_seen=<id>&last_seen_at=<fecha>) se reenvían los mensajes que se perdió
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        last_seen = query.get('last_seen', [''])[0]
+        if last_seen.isdigit():
+            await self.replay_history(int(last_seen), self.parse_last_seen_at(query.get('last_seen_at', [''])[0]))
+
 
     async def disconnect(self, close_code):
         # Salir del grupo de la sala
@@ -39,6 +67,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        if hasattr(self, 'state'):
+            await self.channel_layer.group_discard(self.profile_group_name, self.channel_name)
+            await self.release_quota()
+            await self.leave_room()
         print(f"Usuario {self.user.username} desconectado de la sala: {self.room_name}")
 
 
@@ -47,97 +79,206 @@ class ChatConsumer(AsyncWebsocketConsumer):
         data = json.loads(text_data)
         message = data['message']
 
-        can_send = await self.check_message_limit(self.user)
+        can_send = await self.check_message_limit()
         if not can_send:
             await self.send(text_data=json.dumps({
-                'message': "Límite diario alcanzado (10 msgs). Actualiza tu Plan a Premium para continuar.",
+                'message': f"Límite diario alcanzado ({self.quota.limit} msgs). Actualiza tu Plan a Premium para continuar.",
                 'username': "Sistema"
             }))
             return
         
-        # Obtenemos el idioma de origen del usuario que envÃ­a
-        source_language = await self.get_user_language(self.user)
+        # Idioma de origen del usuario que envÃ­a
+        source_language = self.state['language']
+
+        # Traducir una sola vez por cada idioma presente en la sala (no una vez por receptor)
+        translations = await self.translate_for_room(message, source_language)
+
+        # Guardar en el historial (por lotes, sin esperar a la base de datos)
+        entry = await history.record(
+            self.room_name, self.user.id, self.user.username, message, source_language, translations)
 
         # Enviar el mensaje al grupo (esto llamarÃ¡ a la funciÃ³n 'chat_message')
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message', # Llama a la funciÃ³n chat_message
+                'id': entry.id,
+                'created_at': entry.created_at.isoformat(),
                 'message': message,
                 'username': self.user.username,
-                'source_lang': source_language
+                'source_lang': source_language,
+                'translations': translations,
             }
         )
 
-    @sync_to_async
-    def check_message_limit(self, user):
+    async def translate_for_room(self, message, source_language):
+        """
+        Traduce el mensaje a cada idioma distinto de los miembros de la sala, en
+        paralelo y con el backend preferido del emisor.
+        Devuelve {idioma: texto traducido (o el aviso de error)}.
+        """
+        if self.room_languages is None:
+            self.room_languages = await self.get_room_languages()
+        languages = [language for language in self.room_languages if language != source_language]
+        if not languages:
+            return {}
+
+        backend = self.state['backend']
+        results = await asyncio.gather(*(
+            translate_text_async(message, language, source_language, backend=backend)
+            for language in languages))
+        return {language: self.translated_or_error(message, result)
+                for language, result in zip(languages, results)}
+
+    async def check_message_limit(self):
+        """Cuota de mensajes del plan: solo va a la base de datos cuando se agota el lote reservado."""
+        if not self.quota.needs_refill:
+            return self.quota.take()
         try:
-            profile = user.profile
-            today = timezone.now().date()
-            
-            # Resetear si es otro dÃ­a
-            if profile.last_message_date != today:
-                profile.daily_messages_count = 0
-                profile.last_message_date = today
-            
-            # Validar
-            limit = 10 # Demo limit
-            if profile.subscription_plan == 'free' and profile.daily_messages_count >= limit:
-                profile.save()
-                return False
-            
-            # Contar
-            profile.daily_messages_count += 1
-            profile.save()
-            return True
-        except:
+            return await sync_to_async(self.quota.take)()
+        except Exception as e:
+            # Como antes: un fallo al contar no impide chatear
+            print(f"No se pudo reservar la cuota de mensajes de {self.user.username}: {e}")
             return True
 
+    async def release_quota(self):
+        try:
+            await sync_to_async(self.quota.release)()
+        except Exception as e:
+            print(f"No se pudo devolver la cuota de mensajes de {self.user.username}: {e}")
+
     # 4. Esta funciÃ³n se llama en CADA consumidor (usuario) del grupo
     async def chat_message(self, event):
         message = event['message']
         username = event['username']
         source_lang = event['source_lang']
         
-        # Obtenemos el idioma de destino de ESTE usuario (el receptor)
-        target_language = await self.get_user_language(self.scope['user'])
+        # Idioma de destino de ESTE usuario (el receptor)
+        target_language = self.state['language']
 
         translated_text = message
         
-        # 5. Usamos sync_to_async para la traducciÃ³n si los idiomas son diferentes
+        # 5. El emisor ya tradujo a los idiomas de la sala; solo se traduce aquí si
+        # este receptor se unió (o cambió de idioma) después de enviarse el mensaje
         if source_lang != target_language:
-            # Â¡AquÃ­ ocurre la magia!
-            translation_result = await self.perform_translation(message, target_language, source_lang)
-            
-            if 'error' not in translation_result:
-                translated_text = translation_result['translated_text']
+            translations = event.get('translations', {})
+            if target_language in translations:
+                translated_text = translations[target_language]
             else:
-                print(f"Error de traducción: {translation_result['error']}")
-                translated_text = f"Error al traducir: {message}" # Enviar error al cliente
+                translation_result = await self.perform_translation(message, target_language, source_lang)
+                translated_text = self.translated_or_error(message, translation_result)
 
         # 6. Enviar el mensaje (traducido o no) de vuelta al frontend de este usuario
         await self.send(text_data=json.dumps({
+            'id': event.get('id'),
+            'created_at': event.get('created_at'),
             'message': translated_text,
             'username': username
         }))
 
+    async def replay_history(self, last_seen_id, last_seen_at=None):
+        """Reenvía, en orden y en el idioma de este usuario, los mensajes posteriores a last_seen_id."""
+        await sync_to_async(history.flush)()
+        language = self.state['language']
+        for entry in await sync_to_async(history.messages_after)(self.room_name, last_seen_id, last_seen_at):
+            text = entry.text_for(language)
+            if language != entry.source_language and language not in entry.translations:
+                # Nadie en la sala hablaba este idioma cuando se envió
+                result = await self.perform_translation(entry.message, language, entry.source_language)
+                text = self.translated_or_error(entry.message, result)
+            await self.send(text_data=json.dumps({
+                'id': entry.id,
+                'created_at': entry.created_at.isoformat(),
+                'message': text,
+                'username': entry.username,
+            }))
+
+    async def profile_changed(self, event):
+        """El perfil del usuario cambió en otra parte: recargar el estado cacheado."""
+        previous_language, previous_plan = self.state['language'], self.state['plan']
+        self.state = await self.load_user_state()
+        if self.state['plan'] != previous_plan:
+            await self.release_quota()
+            self.quota = QuotaBucket(self.user.id, CHAT_MESSAGES, self.state['plan'])
+        if self.state['language'] != previous_language:
+            await self.join_room(self.state['language'])
+            await self.channel_layer.group_send(self.room_group_name, {'type': 'room.members_changed'})
+
+    async def room_members_changed(self, event):
+        """Alguien entró, salió o cambió de idioma: los idiomas de la sala se vuelven a leer."""
+        self.room_languages = None
+
     # --- Funciones de Ayuda ---
 
-    @sync_to_async
-    def get_user_language(self, user):
-        """
-        Obtiene la preferencia de idioma del perfil del usuario (acceso a BBDD).
-        """
+    @staticmethod
+    def parse_last_seen_at(value):
+        """Fecha del último mensaje que vio el cliente (None si no la envía o no es válida)."""
         try:
-            # Usamos el modelo Profile que ya tenÃ­as
-            return user.profile.language_preference
-        except Profile.DoesNotExist:
-            return 'es' # Idioma por defecto si no tiene perfil
+            return parse_datetime(value) if value else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def translated_or_error(message, translation_result):
+        if 'error' not in translation_result:
+            return translation_result['translated_text']
+        print(f"Error de traducción: {translation_result['error']}")
+        return f"Error al traducir: {message}" # Enviar error al cliente
+
+    async def join_room(self, language):
+        await sync_to_async(presence.join)(self.room_name, self.channel_name, language)
+        presence.schedule_refresh()
+        await self.channel_layer.group_send(self.room_group_name, {'type': 'room.members_changed'})
+
+    async def leave_room(self):
+        await sync_to_async(presence.leave)(self.channel_name)
+        await self.channel_layer.group_send(self.room_group_name, {'type': 'room.members_changed'})
+
+    async def get_room_languages(self):
+        """Idiomas distintos de las conexiones abiertas en la sala (una consulta)."""
+        return await sync_to_async(presence.room_languages)(self.room_name)
 
     @sync_to_async
-    def perform_translation(self, text, target_lang, source_lang):
+    def load_user_state(self):
+        """Idioma, plan y backend del perfil (una consulta)."""
+        profile = Profile.objects.filter(user_id=self.user.id).values(
+            'language_preference', 'subscription_plan', 'preferred_translation_api').first()
+        if profile is None:
+            # Idioma por defecto si no tiene perfil
+            return {'language': 'es', 'plan': 'free', 'backend': None}
+        return {
+            'language': profile['language_preference'],
+            'plan': profile['subscription_plan'],
+            'backend': profile['preferred_translation_api'],
+        }
+
+    async def perform_translation(self, text, target_lang, source_lang):
         """
-        Ejecuta la traducciÃ³n sÃ­ncrona (de translation.py) en un hilo separado.
+        Traduce con el cliente asíncrono compartido (sin ocupar un hilo por mensaje),
+        usando el backend preferido del receptor.
         """
-        # Usamos la funciÃ³n que ya tenÃ­as
-        return translate_text(text, target_lang, source_lang)
\ No newline at end of file
+        return await translate_text_async(text, target_lang, source_lang, backend=self.state['backend'])
+
+
+class JobProgressConsumer(AsyncWebsocketConsumer):
+    """
+    Reenvía al usuario el avance de sus trabajos en segundo plano
+    (traducciones, extracción de texto...) publicado por api/jobs.notify_job.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = job_group_name(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def job_update(self, event):
+        await self.send(text_data=json.dumps(event['job']))
@@ -0,0 +1,160 @@
+"""
+Historial de las salas de chat.
+
+Los consumidores no escriben en la base de datos al enviar: record() reserva un
+id (por bloques de CHAT_HISTORY_ID_BLOCK de la secuencia chat_message_id_seq) y
+deja el mensaje en un búfer del proceso, que se guarda con bulk_create cada
+CHAT_HISTORY_FLUSH_INTERVAL segundos o al llegar a CHAT_HISTORY_BATCH_SIZE
+mensajes (y al terminar el proceso).
+
+Si el lote falla, se guarda mensaje a mensaje: los que la base de datos rechaza
+(IntegrityError, p. ej. el usuario ya no existe) se descartan y los demás se
+reintentan como mucho CHAT_HISTORY_MAX_ATTEMPTS veces.
+"""
+import asyncio
+import atexit
+import threading
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChatMessage
+
+_pending = []
+_attempts = {}
+_ids = []
+_lock = threading.Lock()
+_flush_tasks = weakref.WeakKeyDictionary()
+
+
+def _reserve_ids():
+    block = getattr(settings, 'CHAT_HISTORY_ID_BLOCK', 100)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval('chat_message_id_seq') FROM generate_series(1, %s)", [block])
+        reserved = [row[0] for row in cursor.fetchall()]
+    with _lock:
+        _ids.extend(reserved)
+
+
+async def record(room, user_id, username, message, source_language, translations):
+    """Asigna id y fecha al mensaje y lo deja pendiente de guardar. Devuelve el ChatMessage."""
+    while True:
+        with _lock:
+            if _ids:
+                message_id = _ids.pop(0)
+                break
+        await sync_to_async(_reserve_ids)()
+
+    entry = ChatMessage(
+        id=message_id, room=room, user_id=user_id, username=username, message=message,
+        source_language=source_language, translations=translations, created_at=timezone.now())
+    with _lock:
+        _pending.append(entry)
+        full = len(_pending) >= getattr(settings, 'CHAT_HISTORY_BATCH_SIZE', 100)
+    if full:
+        await sync_to_async(flush)()
+    else:
+        _schedule_flush()
+    return entry
+
+
+def _schedule_flush():
+    """Una tarea de guardado por bucle de eventos; termina cuando no queda nada pendiente."""
+    loop = asyncio.get_running_loop()
+    task = _flush_tasks.get(loop)
+    if task is None or task.done():
+        _flush_tasks[loop] = loop.create_task(_flush_later())
+
+
+async def _flush_later():
+    while _pending:
+        await asyncio.sleep(getattr(settings, 'CHAT_HISTORY_FLUSH_INTERVAL', 0.5))
+        await sync_to_async(flush)()
+    _flush_tasks.pop(asyncio.get_running_loop(), None)
+
+
+def flush():
+    """Guarda los mensajes pendientes de este proceso (un INSERT por lote)."""
+    with _lock:
+        batch = _pending[:]
+        _pending.clear()
+    if not batch:
+        return
+    try:
+        ChatMessage.objects.bulk_create(batch, batch_size=getattr(settings, 'CHAT_HISTORY_BATCH_SIZE', 100))
+    except Exception as e:
+        print(f"Error guardando {len(batch)} mensajes del chat, se guardarán uno a uno: {e}")
+        _retry(_save_one_by_one(batch))
+    else:
+        _forget_attempts(batch)
+
+
+def _save_one_by_one(batch):
+    """Guarda cada mensaje por separado. Devuelve los que fallaron por un error que puede pasar."""
+    failed = []
+    for entry in batch:
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create([entry])
+        except IntegrityError as e:
+            # No se arreglará reintentando: no debe bloquear a los demás
+            print(f"Se descarta el mensaje {entry.id} del chat, la base de datos lo rechaza: {e}")
+            _forget_attempts([entry])
+        except Exception as e:
+            print(f"Error guardando el mensaje {entry.id} del chat: {e}")
+            failed.append(entry)
+        else:
+            _forget_attempts([entry])
+    return failed
+
+
+def _retry(failed):
+    """Vuelve a dejar pendientes los mensajes fallidos que aún tienen intentos."""
+    max_attempts = getattr(settings, 'CHAT_HISTORY_MAX_ATTEMPTS', 5)
+    retry = []
+    with _lock:
+        for entry in failed:
+            _attempts[entry.id] = _attempts.get(entry.id, 0) + 1
+            if _attempts[entry.id] < max_attempts:
+                retry.append(entry)
+            else:
+                print(f"Se descarta el mensaje {entry.id} del chat tras {max_attempts} intentos")
+                del _attempts[entry.id]
+        _pending[:0] = retry
+
+
+def _forget_attempts(entries):
+    if _attempts:
+        with _lock:
+            for entry in entries:
+                _attempts.pop(entry.id, None)
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception as e:
+        print(f"No se pudieron guardar los mensajes del chat pendientes al salir: {e}")
+
+
+# Lo que quede en el búfer al terminar el proceso se guarda antes de salir
+atexit.register(_flush_at_exit)
+
+
+def messages_after(room, last_seen_id, last_seen_at=None, limit=None):
+    """
+    Mensajes de la sala posteriores a last_seen_id, en orden (para reenviarlos al
+    reconectar). Si ese mensaje aún no está guardado (sigue en el búfer de otro
+    proceso), se usa la fecha que envía el cliente (last_seen_at) o, sin ella, el id.
+    """
+    limit = limit or getattr(settings, 'CHAT_HISTORY_REPLAY_LIMIT', 200)
+    messages = ChatMessage.objects.filter(room=room)
+    last_seen = messages.filter(pk=last_seen_id).values_list('created_at', flat=True).first() or last_seen_at
+    if last_seen is None:
+        return list(messages.filter(id__gt=last_seen_id).order_by('created_at', 'id')[:limit])
+    after = Q(created_at__gt=last_seen) | Q(created_at=last_seen, id__gt=last_seen_id)
+    return list(messages.filter(after).order_by('created_at', 'id')[:limit])
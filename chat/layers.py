@@ -0,0 +1,264 @@
+"""
+Capa de canales para varios procesos en una sola máquina, sin servicios externos:
+usa LISTEN/NOTIFY de la misma base de datos PostgreSQL que ya usa la aplicación.
+
+- Cada proceso tiene su propio canal de notificación (los nombres de canal
+  específicos llevan el id del proceso: 'specific.<id>!<aleatorio>').
+- Cada grupo (sala) tiene un canal de notificación y solo lo escuchan los
+  procesos con algún miembro del grupo: un group_send llega únicamente a los
+  procesos que alojan esa sala.
+- La entrega local reutiliza las colas de InMemoryChannelLayer.
+
+PostgreSQL limita el contenido de un NOTIFY a 8000 bytes: los mensajes más
+grandes se guardan en la tabla ChannelPayload y el NOTIFY solo lleva su id
+(las filas se borran pasado el tiempo de expiración de la capa). Las conexiones
+a la base de datos se abren y se consultan en hilos, nunca en el bucle de eventos.
+En producción con varias máquinas se usa channels_redis (ver CHANNEL_LAYERS en
+backend/settings.py).
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from copy import deepcopy
+
+import psycopg2
+from channels.layers import InMemoryChannelLayer
+from django.db import connections
+
+from .models import ChannelPayload
+
+MAX_PAYLOAD_BYTES = 7900
+
+
+def _notify_channel(kind, name):
+    """Identificador de PostgreSQL (máx. 63 caracteres) para un proceso o grupo."""
+    return f'chl_{kind}_{hashlib.sha1(name.encode("utf-8")).hexdigest()[:32]}'
+
+
+class PostgresChannelLayer(InMemoryChannelLayer):
+
+    def __init__(self, alias='default', **kwargs):
+        super().__init__(**kwargs)
+        self.alias = alias
+        self.process_id = uuid.uuid4().hex[:12]
+        self._listen_connection = None
+        self._listen_loop = None
+        self._listen_lock = None
+        self._listen_lock_loop = None
+        self._listening = set()
+        self._delivery = None
+        self._send_connection = None
+        self._send_lock = threading.Lock()
+
+    # --- Conexiones ---
+
+    def _connect(self):
+        connection = psycopg2.connect(**connections[self.alias].get_connection_params())
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    async def _ensure_listener(self):
+        """Abre (o reabre, si cambió el bucle de eventos) la conexión que recibe las notificaciones."""
+        loop = asyncio.get_running_loop()
+        if self._listen_lock is None or self._listen_lock_loop is not loop:
+            self._listen_lock, self._listen_lock_loop = asyncio.Lock(), loop
+        async with self._listen_lock:
+            if self._listen_connection is not None and self._listen_loop is loop \
+                    and not self._listen_connection.closed:
+                return
+            self._close_listener()
+            channels = {_notify_channel('process', self.process_id)}
+            channels.update(_notify_channel('group', group) for group in self.groups)
+            # Conectar y suscribirse en un hilo: el bucle de eventos no se bloquea
+            connection = await asyncio.to_thread(self._connect_listener, channels)
+            self._listen_connection = connection
+            self._listen_loop = loop
+            self._listening = channels
+            self._delivery = None
+            loop.add_reader(connection.fileno(), self._on_notify)
+
+    def _connect_listener(self, channels):
+        connection = self._connect()
+        with connection.cursor() as cursor:
+            for notify_channel in channels:
+                cursor.execute(f'LISTEN "{notify_channel}"')
+        return connection
+
+    def _close_listener(self):
+        if self._listen_connection is None:
+            return
+        try:
+            self._listen_loop.remove_reader(self._listen_connection.fileno())
+        except Exception:
+            pass  # El bucle anterior ya estaba cerrado
+        self._listen_connection.close()
+        self._listen_connection = None
+
+    async def _listen(self, notify_channel):
+        if notify_channel not in self._listening:
+            self._listening.add(notify_channel)
+            try:
+                await self._execute_listener(f'LISTEN "{notify_channel}"')
+            except Exception:
+                self._listening.discard(notify_channel)
+                raise
+
+    async def _unlisten(self, notify_channel):
+        if notify_channel in self._listening and self._listen_connection is not None:
+            self._listening.discard(notify_channel)
+            await self._execute_listener(f'UNLISTEN "{notify_channel}"')
+
+    async def _execute_listener(self, sql):
+        """
+        Ejecuta LISTEN/UNLISTEN en un hilo. Mientras tanto el bucle no lee de la
+        conexión: psycopg2 no admite un poll() a la vez que una consulta.
+        """
+        async with self._listen_lock:
+            connection, loop = self._listen_connection, self._listen_loop
+            if connection is None or connection.closed:
+                return
+            loop.remove_reader(connection.fileno())
+            try:
+                await asyncio.to_thread(self._execute, connection, sql)
+            finally:
+                if self._listen_connection is connection:
+                    loop.add_reader(connection.fileno(), self._on_notify)
+                    # Las notificaciones que llegaron durante la consulta
+                    self._on_notify()
+
+    @staticmethod
+    def _execute(connection, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+
+    def _send_cursor(self):
+        if self._send_connection is None or self._send_connection.closed:
+            self._send_connection = self._connect()
+        return self._send_connection.cursor()
+
+    def _notify(self, notify_channel, payload):
+        with self._send_lock, self._send_cursor() as cursor:
+            if len(payload.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+                # Demasiado grande para NOTIFY: se guarda y se avisa con el id de la fila
+                table = ChannelPayload._meta.db_table
+                cursor.execute(f"DELETE FROM {table} WHERE created_at < now() - %s * interval '1 second'",
+                               [self.expiry])
+                cursor.execute(f'INSERT INTO {table} (payload, created_at) VALUES (%s, now()) RETURNING id',
+                               [payload])
+                payload = json.dumps({'ref': cursor.fetchone()[0]})
+            cursor.execute('SELECT pg_notify(%s, %s)', [notify_channel, payload])
+
+    def _load_payloads(self, refs):
+        with self._send_lock, self._send_cursor() as cursor:
+            cursor.execute(f'SELECT id, payload FROM {ChannelPayload._meta.db_table} WHERE id = ANY(%s)',
+                           [list(refs)])
+            return {ref: json.loads(payload) for ref, payload in cursor.fetchall()}
+
+    async def _publish(self, notify_channel, envelope):
+        await asyncio.to_thread(self._notify, notify_channel, json.dumps(envelope))
+
+    def _on_notify(self):
+        connection = self._listen_connection
+        try:
+            connection.poll()
+        except psycopg2.Error as e:
+            print(f"Se perdió la conexión LISTEN de la capa de canales, reconectando: {e!r}")
+            self._close_listener()
+            self._listen_loop.create_task(self._ensure_listener())
+            return
+        envelopes = []
+        while connection.notifies:
+            envelopes.append(json.loads(connection.notifies.pop(0).payload))
+        if self._delivery is None and not any('ref' in envelope for envelope in envelopes):
+            self._dispatch(envelopes)
+        else:
+            # Hay que leer mensajes de la tabla: se entregan en una tarea, sin perder el orden
+            self._delivery = self._listen_loop.create_task(self._dispatch_later(self._delivery, envelopes))
+
+    async def _dispatch_later(self, previous, envelopes):
+        if previous is not None:
+            await previous
+        refs = [envelope['ref'] for envelope in envelopes if 'ref' in envelope]
+        stored = {}
+        if refs:
+            try:
+                stored = await asyncio.to_thread(self._load_payloads, refs)
+            except psycopg2.Error as e:
+                print(f"No se pudieron leer {len(refs)} mensajes grandes de la capa de canales: {e!r}")
+        self._dispatch(stored.get(envelope['ref']) if 'ref' in envelope else envelope
+                       for envelope in envelopes)
+        if self._delivery is asyncio.current_task():
+            self._delivery = None
+
+    def _dispatch(self, envelopes):
+        for envelope in envelopes:
+            if envelope is None:
+                continue  # Mensaje grande ya caducado
+            if 'group' in envelope:
+                channels = list(self.groups.get(envelope['group'], {}))
+            else:
+                channels = [envelope['channel']]
+            for channel in channels:
+                self._deliver(channel, envelope['message'])
+
+    def _deliver(self, channel, message):
+        queue = self.channels.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+        try:
+            queue.put_nowait((time.time() + self.expiry, deepcopy(message)))
+        except asyncio.QueueFull:
+            print(f"Canal {channel} lleno: se descarta un mensaje")
+
+    def _owner(self, channel):
+        """Id del proceso dueño de un canal específico (None si no es específico)."""
+        if '!' not in channel:
+            return None
+        return self.non_local_name(channel)[:-1].rsplit('.', 1)[-1]
+
+    # --- API de la capa ---
+
+    async def new_channel(self, prefix='specific'):
+        await self._ensure_listener()
+        return f'{prefix}.{self.process_id}!{uuid.uuid4().hex[:12]}'
+
+    async def send(self, channel, message):
+        owner = self._owner(channel)
+        if owner is None or owner == self.process_id:
+            return await super().send(channel, message)
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        await self._publish(_notify_channel('process', owner), {'channel': channel, 'message': message})
+
+    async def receive(self, channel):
+        await self._ensure_listener()
+        return await super().receive(channel)
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        await self._ensure_listener()
+        await self._listen(_notify_channel('group', group))
+
+    async def group_discard(self, group, channel):
+        await super().group_discard(group, channel)
+        if group not in self.groups:
+            await self._unlisten(_notify_channel('group', group))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+        # También los miembros de este proceso reciben el mensaje a través de NOTIFY
+        await self._publish(_notify_channel('group', group), {'group': group, 'message': message})
+
+    async def flush(self):
+        await super().flush()
+        self._close_listener()
+        self._listening = set()
+
+    async def close(self):
+        self._close_listener()
+        with self._send_lock:
+            if self._send_connection is not None:
+                self._send_connection.close()
+                self._send_connection = None
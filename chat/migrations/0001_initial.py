@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room', models.CharField(db_index=True, max_length=255)),
+                ('channel_name', models.CharField(max_length=255, unique=True)),
+                ('language', models.CharField(max_length=10)),
+                ('connected_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('room', models.CharField(max_length=255)),
+                ('username', models.CharField(max_length=150)),
+                ('message', models.TextField()),
+                ('source_language', models.CharField(max_length=10)),
+                ('translations', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room', 'created_at', 'id'], name='chat_message_room_time_idx')],
+            },
+        ),
+        # Los ids se reservan por bloques desde chat/history.py antes de guardar los mensajes
+        migrations.RunSQL(
+            'CREATE SEQUENCE chat_message_id_seq',
+            'DROP SEQUENCE chat_message_id_seq',
+        ),
+    ]
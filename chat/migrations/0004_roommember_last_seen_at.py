@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:47
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Substr
+
+
+def use_room_names(apps, schema_editor):
+    # Antes se guardaba el nombre del grupo de Channels ('chat_<sala>')
+    RoomMember = apps.get_model('chat', 'RoomMember')
+    RoomMember.objects.filter(room__startswith='chat_').update(room=Substr('room', len('chat_') + 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_channelpayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roommember',
+            name='last_seen_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(use_room_names, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,65 @@
+from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+
+class RoomMember(models.Model):
+    """
+    Conexión abierta a una sala de chat y el idioma en el que recibe los mensajes.
+    El emisor la consulta para traducir cada mensaje una sola vez por idioma.
+    'room' es el nombre de la sala (como en ChatMessage); el proceso que aloja la
+    conexión refresca last_seen_at (chat/presence.py).
+    """
+    room = models.CharField(max_length=255, db_index=True)
+    channel_name = models.CharField(max_length=255, unique=True)
+    language = models.CharField(max_length=10)
+    connected_at = models.DateTimeField(auto_now_add=True)
+    last_seen_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.channel_name} en {self.room} ({self.language})"
+
+
+class ChatMessage(models.Model):
+    """
+    Mensaje de una sala (solo se añaden, nunca se modifican). Se guardan por lotes
+    desde chat/history.py; el id se reserva al enviarlo, antes de guardarlo.
+    'translations' son las traducciones calculadas al enviarlo ({idioma: texto}).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    room = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='chat_messages')
+    username = models.CharField(max_length=150)
+    message = models.TextField()
+    source_language = models.CharField(max_length=10)
+    translations = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'created_at', 'id'], name='chat_message_room_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.username} en {self.room}: {self.message[:30]}"
+
+    def text_for(self, language):
+        """El mensaje en el idioma pedido (o el original si no se tradujo a él)."""
+        if language == self.source_language:
+            return self.message
+        return self.translations.get(language, self.message)
+
+
+class ChannelPayload(models.Model):
+    """
+    Mensaje de la capa de canales PostgreSQL (chat/layers.py) demasiado grande
+    para NOTIFY: la notificación solo lleva el id de la fila. Se borran pasado
+    el tiempo de expiración de la capa.
+    """
+    payload = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Mensaje de la capa de canales {self.pk} ({len(self.payload)} caracteres)"
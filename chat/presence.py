@@ -0,0 +1,75 @@
+"""
+Conexiones abiertas a las salas (RoomMember) de este proceso.
+
+Cada proceso refresca last_seen_at de sus conexiones cada
+CHAT_MEMBER_REFRESH_INTERVAL segundos y, de paso, borra las filas que nadie
+refresca desde hace CHAT_MEMBER_STALE_AFTER segundos: las de un proceso que
+terminó sin pasar por disconnect() (caída, reinicio) desaparecen solas, y
+mientras tanto ya no cuentan como idiomas de la sala.
+"""
+import asyncio
+import threading
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import RoomMember
+
+_channels = set()
+_lock = threading.Lock()
+_refresh_tasks = weakref.WeakKeyDictionary()
+
+
+def stale_before():
+    """Las conexiones no refrescadas desde esta fecha se consideran cerradas."""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'CHAT_MEMBER_STALE_AFTER', 180))
+
+
+def join(room, channel_name, language):
+    RoomMember.objects.update_or_create(
+        channel_name=channel_name,
+        defaults={'room': room, 'language': language, 'last_seen_at': timezone.now()})
+    with _lock:
+        _channels.add(channel_name)
+
+
+def leave(channel_name):
+    with _lock:
+        _channels.discard(channel_name)
+    RoomMember.objects.filter(channel_name=channel_name).delete()
+
+
+def room_languages(room):
+    """Idiomas distintos de las conexiones vivas de la sala (una consulta)."""
+    return list(RoomMember.objects.filter(room=room, last_seen_at__gte=stale_before())
+                .order_by().values_list('language', flat=True).distinct())
+
+
+def refresh():
+    """Marca como vivas las conexiones de este proceso y borra las abandonadas."""
+    with _lock:
+        channels = list(_channels)
+    if channels:
+        RoomMember.objects.filter(channel_name__in=channels).update(last_seen_at=timezone.now())
+    RoomMember.objects.filter(last_seen_at__lt=stale_before()).delete()
+
+
+def schedule_refresh():
+    """Una tarea de refresco por bucle de eventos; termina cuando no quedan conexiones."""
+    loop = asyncio.get_running_loop()
+    task = _refresh_tasks.get(loop)
+    if task is None or task.done():
+        _refresh_tasks[loop] = loop.create_task(_refresh_periodically())
+
+
+async def _refresh_periodically():
+    while _channels:
+        await asyncio.sleep(getattr(settings, 'CHAT_MEMBER_REFRESH_INTERVAL', 60))
+        try:
+            await sync_to_async(refresh)()
+        except Exception as e:
+            print(f"No se pudieron refrescar las conexiones del chat: {e}")
+    _refresh_tasks.pop(asyncio.get_running_loop(), None)
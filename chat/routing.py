@@ -4,4 +4,5 @@ from . import consumers
 websocket_urlpatterns = [
     # CAMBIO: Cambiamos \w+ por [^/]+ para aceptar guiones y otros símbolos
     re_path(r'^ws/chat/(?P<room_name>[^/]+)/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'^ws/jobs/$', consumers.JobProgressConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,19 @@
+from rest_framework import serializers
+
+from .models import ChatMessage
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    """
+    Mensaje del historial en el idioma de quien lo pide (context['language']),
+    con el original aparte.
+    """
+    message = serializers.SerializerMethodField()
+    original_message = serializers.CharField(source='message', read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'username', 'message', 'original_message', 'source_language', 'created_at']
+
+    def get_message(self, obj):
+        return obj.text_for(self.context['language'])
@@ -1,3 +1,416 @@
-from django.test import TestCase
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.db.backends.utils import CursorWrapper
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import re_path, reverse
+from django.utils import timezone
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.jobs import notify_job
+from api import quotas, token_cache
+from api.models import BackgroundJob, Profile
+from .consumers import ChatConsumer, JobProgressConsumer
+from . import history, presence
+from .layers import PostgresChannelLayer
+from .middleware import get_user
+from .models import ChatMessage, RoomMember
+
+
+class JobProgressConsumerTests(TestCase):
+    """El avance de los trabajos llega al usuario por ws/jobs/."""
+
+    async def test_user_receives_updates_of_own_jobs(self):
+        communicator = WebsocketCommunicator(JobProgressConsumer.as_asgi(), '/ws/jobs/')
+        communicator.scope['user'] = mock.Mock(is_authenticated=True, id=7)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        job = BackgroundJob(pk=3, kind='translate_document', user_id=7,
+                            status=BackgroundJob.STATUS_RUNNING, progress_done=2, progress_total=5)
+        await sync_to_async(notify_job)(job)
+        await sync_to_async(notify_job)(BackgroundJob(pk=4, kind='otro', user_id=8))
+
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['id'], message['progress_done'], message['progress_total']), (3, 2, 5))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_anonymous_connection_is_rejected(self):
+        communicator = WebsocketCommunicator(JobProgressConsumer.as_asgi(), '/ws/jobs/')
+        communicator.scope['user'] = mock.Mock(is_authenticated=False)
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+
+def chat_user(username, language, plan='premium'):
+    user, _ = User.objects.get_or_create(username=username)
+    Profile.objects.filter(user=user).update(language_preference=language, subscription_plan=plan)
+    return user
+
+
+class ChatConsumerTestCase(TransactionTestCase):
+    # TransactionTestCase: los consumidores cierran la conexión a la base de datos entre mensajes
+
+    application = URLRouter([re_path(r'^ws/chat/(?P<room_name>[^/]+)/$', ChatConsumer.as_asgi())])
+
+    def setUp(self):
+        # Que no queden mensajes del historial pendientes de guardar para la siguiente prueba
+        self.addCleanup(history.flush)
+
+    async def connect(self, room, username, language, plan='premium', query=''):
+        communicator = WebsocketCommunicator(self.application, f'/ws/chat/{room}/{query}')
+        communicator.scope['user'] = await sync_to_async(chat_user)(username, language, plan)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+
+class ChatTranslationFanOutTests(ChatConsumerTestCase):
+    """Cada mensaje se traduce una vez por idioma de la sala, no una vez por receptor."""
+
+    async def send_in_room(self, room, receivers):
+        """Sala con un emisor en español y 'receivers' receptores en inglés y francés."""
+        sender = await self.connect(room, 'emisor', 'es')
+        members = [await self.connect(room, f'r{i}', ('en', 'fr')[i % 2]) for i in range(receivers)]
+
+        async def fake_translate(text, target, source=None, backend=None):
+            return {'translated_text': f'[{target}] {text}', 'detected_source_language': source}
+
+        with mock.patch('chat.consumers.translate_text_async', side_effect=fake_translate) as translate:
+            await sender.send_json_to({'message': 'Hola'})
+            received = [await member.receive_json_from() for member in members]
+            self.assertEqual((await sender.receive_json_from())['message'], 'Hola')
+
+        for communicator in [sender, *members]:
+            await communicator.disconnect()
+        return translate.call_count, received
+
+    async def test_translation_calls_per_message_do_not_grow_with_room_size(self):
+        calls_by_size = {}
+        for size in (2, 10, 50):
+            calls, received = await self.send_in_room(f'sala-{size}', size)
+            calls_by_size[size] = calls
+            self.assertEqual([message['message'] for message in received[:2]], ['[en] Hola', '[fr] Hola'])
+
+        self.assertEqual(calls_by_size, {2: 2, 10: 2, 50: 2})
+        self.assertFalse(await sync_to_async(RoomMember.objects.exists)())
+
+    async def test_member_rows_use_the_room_name(self):
+        communicator = await self.connect('sala', 'nora', 'es')
+        rooms = await sync_to_async(list)(RoomMember.objects.values_list('room', flat=True))
+        self.assertEqual(rooms, ['sala'])
+        await communicator.disconnect()
+
+    def test_members_left_by_a_dead_worker_are_ignored_and_purged(self):
+        RoomMember.objects.create(room='sala', channel_name='muerto', language='de',
+                                  last_seen_at=timezone.now() - timedelta(hours=1))
+        RoomMember.objects.create(room='sala', channel_name='vivo', language='en')
+
+        self.assertEqual(presence.room_languages('sala'), ['en'])
+        presence.refresh()
+
+        self.assertEqual(list(RoomMember.objects.values_list('channel_name', flat=True)), ['vivo'])
+
+    async def test_receiver_without_precomputed_translation_translates_itself(self):
+        receiver = await self.connect('sala', 'tardio', 'de')
+
+        with mock.patch('chat.consumers.translate_text_async',
+                        return_value={'translated_text': 'Hallo'}) as translate:
+            await get_channel_layer().group_send('chat_sala', {
+                'type': 'chat_message', 'message': 'Hola', 'username': 'emisor',
+                'source_lang': 'es', 'translations': {'en': 'Hello'}})
+            self.assertEqual((await receiver.receive_json_from())['message'], 'Hallo')
+
+        translate.assert_called_once()
+        await receiver.disconnect()
+
+
+def count_queries(table):
+    """Cuenta las consultas SQL (de cualquier hilo) que mencionan la tabla."""
+    executed = []
+    original = CursorWrapper._execute_with_wrappers
+
+    def counting(cursor, sql, *args, **kwargs):
+        executed.append(sql)
+        return original(cursor, sql, *args, **kwargs)
+
+    patcher = mock.patch.object(CursorWrapper, '_execute_with_wrappers', counting)
+    return patcher, lambda: [sql for sql in executed if table in sql]
+
+
+class ChatUserStateTests(ChatConsumerTestCase):
+    """El estado del usuario se carga al conectar y la cuota de mensajes se reserva por lotes."""
+
+    async def test_messages_do_not_touch_the_profile(self):
+        sender = await self.connect('sala', 'ana', 'es')
+        receiver = await self.connect('sala', 'bruno', 'es')
+
+        patcher, profile_queries = count_queries('api_profile')
+        quota_patcher, quota_queries = count_queries('api_quotacounter')
+        with patcher, quota_patcher:
+            for i in range(6):
+                await sender.send_json_to({'message': f'mensaje {i}'})
+                await receiver.receive_json_from()
+                await sender.receive_json_from()
+
+        self.assertEqual(profile_queries(), [])
+        # Premium no tiene límite de mensajes: ni siquiera se reserva cuota
+        self.assertEqual(quota_queries(), [])
+        for communicator in (sender, receiver):
+            await communicator.disconnect()
+
+    @override_settings(QUOTA_LEASE_SIZE=3)
+    async def test_free_limit_is_reserved_in_batches_and_returned_on_disconnect(self):
+        sender = await self.connect('sala', 'carla', 'es', plan='free')
+        patcher, quota_queries = count_queries('api_quotacounter')
+        with patcher:
+            for i in range(11):
+                await sender.send_json_to({'message': f'mensaje {i}'})
+                reply = await sender.receive_json_from()
+
+        self.assertEqual(reply['username'], 'Sistema')
+        # Lotes de 3, 3, 3 y 1 (el de 3 no cabía) y los dos intentos del mensaje 11
+        self.assertEqual(len(quota_queries()), 7)
+        user_id = (await sync_to_async(User.objects.get)(username='carla')).id
+        self.assertEqual(await sync_to_async(quotas.usage)(user_id, quotas.CHAT_MESSAGES), 10)
+        await sender.disconnect()
+
+        second = await self.connect('sala', 'carla', 'es', plan='free')
+        await second.send_json_to({'message': 'otro'})
+        self.assertEqual((await second.receive_json_from())['username'], 'Sistema')
+        await second.disconnect()
+
+    @override_settings(QUOTA_LEASE_SIZE=5)
+    async def test_unused_reservation_is_returned_on_disconnect(self):
+        sender = await self.connect('sala', 'dora', 'es', plan='free')
+        await sender.send_json_to({'message': 'hola'})
+        await sender.receive_json_from()
+        await sender.disconnect()
+        user_id = (await sync_to_async(User.objects.get)(username='dora')).id
+        self.assertEqual(await sync_to_async(quotas.usage)(user_id, quotas.CHAT_MESSAGES), 1)
+
+    async def test_profile_change_refreshes_the_connection(self):
+        sender = await self.connect('sala', 'diego', 'es')
+        receiver = await self.connect('sala', 'eva', 'es')
+
+        profile = await sync_to_async(Profile.objects.get)(user__username='eva')
+        profile.language_preference = 'en'
+        await sync_to_async(profile.save)()
+        self.assertTrue(await receiver.receive_nothing())
+
+        async def fake_translate(text, target, source=None, backend=None):
+            return {'translated_text': f'[{target}] {text}', 'detected_source_language': source}
+
+        with mock.patch('chat.consumers.translate_text_async', side_effect=fake_translate):
+            await sender.send_json_to({'message': 'Hola'})
+            self.assertEqual((await receiver.receive_json_from())['message'], '[en] Hola')
+        for communicator in (sender, receiver):
+            await communicator.disconnect()
+
+
+@override_settings(CHAT_HISTORY_FLUSH_INTERVAL=3600)
+class ChatHistoryTests(ChatConsumerTestCase):
+    """Los mensajes se guardan por lotes, se paginan por cursor y se reenvían al reconectar."""
+
+    async def test_messages_are_stored_in_one_batch_insert(self):
+        sender = await self.connect('sala', 'fede', 'es')
+        ids = []
+        for i in range(5):
+            await sender.send_json_to({'message': f'mensaje {i}'})
+            ids.append((await sender.receive_json_from())['id'])
+        self.assertEqual(await sync_to_async(ChatMessage.objects.count)(), 0)
+
+        patcher, inserts = count_queries('INSERT INTO "chat_chatmessage"')
+        with patcher:
+            await sync_to_async(history.flush)()
+
+        self.assertEqual(len(inserts()), 1)
+        stored = await sync_to_async(list)(ChatMessage.objects.order_by('id').values_list('id', 'message'))
+        self.assertEqual(stored, [(message_id, f'mensaje {i}') for i, message_id in enumerate(ids)])
+        await sender.disconnect()
+
+    async def test_reconnecting_client_receives_missed_messages(self):
+        sender = await self.connect('sala', 'gala', 'es')
+        receiver = await self.connect('sala', 'hugo', 'en')
+
+        async def fake_translate(text, target, source=None, backend=None):
+            return {'translated_text': f'[{target}] {text}', 'detected_source_language': source}
+
+        with mock.patch('chat.consumers.translate_text_async', side_effect=fake_translate):
+            await sender.send_json_to({'message': 'antes'})
+            last_seen = (await receiver.receive_json_from())['id']
+            await receiver.disconnect()
+            for text in ('uno', 'dos'):
+                await sender.send_json_to({'message': text})
+            # El emisor recibe sus propios mensajes: 'antes', 'uno' y 'dos' ya se enviaron
+            for _ in range(3):
+                await sender.receive_json_from()
+
+            receiver = await self.connect('sala', 'hugo', 'en', query=f'?last_seen={last_seen}')
+            replayed = [await receiver.receive_json_from() for _ in range(2)]
+
+        self.assertEqual([message['message'] for message in replayed], ['[en] uno', '[en] dos'])
+        self.assertTrue(await receiver.receive_nothing())
+        for communicator in (sender, receiver):
+            await communicator.disconnect()
+
+    def test_rejected_message_does_not_block_the_rest(self):
+        user = chat_user('lola', 'es')
+        history._pending.extend([
+            ChatMessage(id=1001, room='sala', user_id=user.id + 1000, username='fantasma', message='x',
+                        source_language='es'),
+            ChatMessage(id=1002, room='sala', user_id=user.id, username='lola', message='hola',
+                        source_language='es'),
+        ])
+
+        history.flush()
+
+        self.assertEqual(list(ChatMessage.objects.values_list('id', flat=True)), [1002])
+        self.assertEqual(history._pending, [])
+
+    @override_settings(CHAT_HISTORY_MAX_ATTEMPTS=2)
+    def test_failing_messages_are_dropped_after_max_attempts(self):
+        history._pending.append(ChatMessage(id=1003, room='sala', username='lola', message='hola',
+                                            source_language='es'))
+
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError('caída')):
+            history.flush()
+            self.assertEqual([entry.id for entry in history._pending], [1003])
+            history.flush()
+
+        self.assertEqual(history._pending, [])
+
+    def test_replay_falls_back_when_last_seen_is_not_stored_yet(self):
+        start = timezone.now()
+        for message_id, seconds in ((5, 0), (3, 1), (7, 2)):
+            ChatMessage.objects.create(id=message_id, room='sala', username='juan', message=str(message_id),
+                                       source_language='es', created_at=start + timedelta(seconds=seconds))
+
+        by_time = history.messages_after('sala', 50, start + timedelta(milliseconds=500))
+        by_id = history.messages_after('sala', 4)
+
+        self.assertEqual([entry.id for entry in by_time], [3, 7])
+        self.assertEqual([entry.id for entry in by_id], [5, 7])
+
+    def test_history_endpoint_pages_by_cursor_in_the_reader_language(self):
+        reader = chat_user('ines', 'en')
+        for i in range(5):
+            ChatMessage.objects.create(id=i + 1, room='sala', username='juan', message=f'hola {i}',
+                                       source_language='es', translations={'en': f'hello {i}'})
+        ChatMessage.objects.create(id=99, room='otra', username='juan', message='x', source_language='es')
+        client = APIClient()
+        client.force_authenticate(user=reader)
+
+        first = client.get(reverse('chat-history', args=['sala']), {'page_size': 3}).data
+        second = client.get(first['next']).data
+
+        self.assertEqual([m['message'] for m in first['results']], ['hello 4', 'hello 3', 'hello 2'])
+        self.assertEqual([m['id'] for m in second['results']], [2, 1])
+        self.assertEqual(second['results'][0]['original_message'], 'hola 1')
+        self.assertIsNone(second['next'])
+
+
+class TokenAuthMiddlewareTests(TransactionTestCase):
+    """El handshake del WebSocket resuelve el token con la caché compartida con REST."""
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+    async def test_handshake_uses_token_cache(self):
+        user = await sync_to_async(User.objects.create)(username='kiko')
+        token = await sync_to_async(Token.objects.create)(user=user)
+
+        self.assertEqual((await get_user(token.key)).pk, user.pk)
+        with mock.patch('chat.middleware.lookup_token') as lookup:
+            self.assertEqual((await get_user(token.key)).pk, user.pk)
+        lookup.assert_not_called()
+
+        await sync_to_async(token.delete)()
+        self.assertIsInstance(await get_user(token.key), AnonymousUser)
+
+
+# Proceso trabajador: se une a las salas indicadas y responde a cada mensaje con su pid
+LAYER_WORKER = """
+import asyncio, os, sys
+import django
+django.setup()
+from chat.layers import PostgresChannelLayer
+
+async def main():
+    layer = PostgresChannelLayer()
+    channel = await layer.new_channel()
+    for room in sys.argv[1:]:
+        await layer.group_add(room, channel)
+    print('listo', flush=True)
+    while True:
+        message = await layer.receive(channel)
+        if message['type'] == 'stop':
+            break
+        await layer.send(message['reply_to'], {'type': 'ack', 'pid': os.getpid(), 'room': message['room']})
+    await layer.close()
+
+asyncio.run(main())
+"""
+
+
+class PostgresChannelLayerTests(SimpleTestCase):
+    """La capa LISTEN/NOTIFY reparte los mensajes entre varios procesos."""
+
+    def start_worker(self, *rooms):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings',
+                   DB_NAME=connection.settings_dict['NAME'])
+        worker = subprocess.Popen([sys.executable, '-c', LAYER_WORKER, *rooms], cwd=settings.BASE_DIR,
+                                  env=env, stdout=subprocess.PIPE, text=True)
+        self.addCleanup(worker.kill)
+        return worker
+
+    async def test_group_messages_reach_only_the_workers_hosting_the_room(self):
+        workers = [self.start_worker('sala_a'), self.start_worker('sala_a'), self.start_worker('sala_b')]
+        for worker in workers:
+            ready = await asyncio.wait_for(asyncio.to_thread(worker.stdout.readline), 30)
+            self.assertEqual(ready.strip(), 'listo')
+
+        layer = PostgresChannelLayer()
+        reply_to = await layer.new_channel()
+        for room in ('sala_a', 'sala_b'):
+            await layer.group_send(room, {'type': 'ping', 'room': room, 'reply_to': reply_to})
+        acks = [await asyncio.wait_for(layer.receive(reply_to), 10) for _ in workers]
+
+        for room in ('sala_a', 'sala_b'):
+            await layer.group_send(room, {'type': 'stop'})
+        await layer.close()
+        for worker in workers:
+            self.assertEqual(await asyncio.to_thread(worker.wait, 10), 0)
+
+        pids_by_room = {}
+        for ack in acks:
+            pids_by_room.setdefault(ack['room'], set()).add(ack['pid'])
+        self.assertEqual(pids_by_room, {'sala_a': {workers[0].pid, workers[1].pid}, 'sala_b': {workers[2].pid}})
+
+    async def test_messages_too_big_for_notify_are_delivered_in_order(self):
+        layer = PostgresChannelLayer()
+        channel = await layer.new_channel()
+        await layer.group_add('sala_grande', channel)
+        long_text = 'ñ' * 10000
+
+        await layer.group_send('sala_grande', {'type': 'chat.message', 'message': long_text})
+        await layer.group_send('sala_grande', {'type': 'chat.message', 'message': 'corto'})
+        received = [await asyncio.wait_for(layer.receive(channel), 10) for _ in range(2)]
+        await layer.close()
+
+        self.assertEqual([message['message'] for message in received], [long_text, 'corto'])
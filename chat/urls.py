@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import ChatHistoryView
+
+urlpatterns = [
+    path('rooms/<str:room_name>/messages/', ChatHistoryView.as_view(), name='chat-history'),
+]
@@ -1,3 +1,33 @@
-from django.shortcuts import render
+from rest_framework import generics, permissions
 
-# Create your views here.
+from api.models import Profile
+from api.pagination import KeysetCursorPagination
+from . import history
+from .models import ChatMessage
+from .serializers import ChatMessageSerializer
+
+
+class ChatHistoryPagination(KeysetCursorPagination):
+    """Del mensaje más reciente al más antiguo; 'next' lleva a los anteriores."""
+    ordering = ('-created_at', '-id')
+
+
+class ChatHistoryView(generics.ListAPIView):
+    """
+    Historial paginado (por cursor) de una sala. Se usa el índice (room, created_at, id),
+    así que pedir páginas antiguas cuesta lo mismo que la primera.
+    """
+    serializer_class = ChatMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ChatHistoryPagination
+
+    def get_queryset(self):
+        # Que los mensajes recién enviados desde este proceso aparezcan ya en el historial
+        history.flush()
+        return ChatMessage.objects.filter(room=self.kwargs['room_name'])
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['language'] = Profile.objects.filter(user=self.request.user).values_list(
+            'language_preference', flat=True).first() or 'es'
+        return context
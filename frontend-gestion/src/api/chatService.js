@@ -0,0 +1,18 @@
+import apiClient from "./axiosConfig";
+
+/**
+ * Historial de una sala, del mensaje más reciente al más antiguo.
+ * 'cursor' es la URL 'next' de la página anterior (null para la primera).
+ * Devuelve { next, previous, results }.
+ */
+export const getChatHistory = async (roomName, cursor = null) => {
+    try {
+        const response = cursor
+            ? await apiClient.get(cursor)
+            : await apiClient.get(`/chat/rooms/${encodeURIComponent(roomName)}/messages/`);
+        return response.data;
+    } catch (error) {
+        console.error('Error al obtener el historial del chat:', error);
+        throw error;
+    }
+};
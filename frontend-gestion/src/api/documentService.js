@@ -43,6 +43,8 @@ export const getTags = async () => {
 
 /**
  * UC-15: Listar y Buscar Documentos
+ * Devuelve una página: { results, next, previous }. Usa getDocumentsPage(next)
+ * para cargar la siguiente.
  */
 export const getDocuments = async (searchQuery, folderId, tagId) => {
     try {
@@ -64,6 +66,19 @@ export const getDocuments = async (searchQuery, folderId, tagId) => {
         throw error;
     }
 };
+
+/**
+ * Carga la página indicada por el cursor 'next' o 'previous' de una respuesta anterior.
+ */
+export const getDocumentsPage = async (pageUrl) => {
+    try {
+        const response = await apiClient.get(pageUrl);
+        return response.data;
+    } catch (error) {
+        console.error('Error al obtener la página de documentos:', error);
+        throw error;
+    }
+};
 /**
  * UC-09: Subir Documento (Actualizado)
  * Sube un nuevo archivo, ahora aceptando un folderId opcional.
@@ -235,7 +250,9 @@ export const assignTagsToDocument = async (documentId, tagIdList) => {
 
 /**
  * UC-17/18: Traducir un documento completo.
- * Llama a la API para traducir el 'extracted_content' del documento.
+ * La traducción se hace en segundo plano: devuelve { job_id, status }.
+ * El avance llega por WebSocket (jobSocketService) y el resultado, al
+ * terminar, queda en el historial (getTranslation).
  */
 export const translateDocument = async (documentId, targetLanguage, sourceLanguage = null) => {
     try {
@@ -250,13 +267,39 @@ export const translateDocument = async (documentId, targetLanguage, sourceLangua
             `/documents/${documentId}/translate-document/`, 
             payload
         );
-        return response.data; // Devuelve { translated_text: "...", ... }
+        return response.data; // Devuelve { job_id: 12, status: "pending" }
     } catch (error) {
         console.error('Error al traducir el documento:', error);
         throw error;
     }
 };
 
+/**
+ * Estado de un trabajo en segundo plano (status, progress_done, progress_total, result).
+ */
+export const getJob = async (jobId) => {
+    try {
+        const response = await apiClient.get(`/jobs/${jobId}/`);
+        return response.data;
+    } catch (error) {
+        console.error('Error al obtener el trabajo:', error);
+        throw error;
+    }
+};
+
+/**
+ * Una traducción del historial (incluye translated_content).
+ */
+export const getTranslation = async (translationId) => {
+    try {
+        const response = await apiClient.get(`/translation-history/${translationId}/`);
+        return response.data;
+    } catch (error) {
+        console.error('Error al obtener la traducción:', error);
+        throw error;
+    }
+};
+
 
 /**
  * Obtiene los detalles completos de un solo documento (incl. contenido)
@@ -0,0 +1,53 @@
+import { getJob } from './documentService';
+
+const FINISHED = ['done', 'failed'];
+const POLL_INTERVAL_MS = 2000;
+
+/**
+ * Sigue el avance de un trabajo en segundo plano.
+ * Escucha ws/jobs/ (el backend envía cada actualización) y, si el WebSocket
+ * no está disponible, consulta /jobs/<id>/ periódicamente.
+ * onUpdate recibe { id, status, progress_done, progress_total, result }.
+ * Devuelve una función para dejar de escuchar.
+ */
+export const subscribeToJob = (jobId, onUpdate) => {
+  let stopped = false;
+  let pollTimer = null;
+  let socket = null;
+
+  const stop = () => {
+    stopped = true;
+    clearTimeout(pollTimer);
+    if (socket) socket.close();
+  };
+
+  const handle = (job) => {
+    if (stopped || job.id !== jobId) return;
+    onUpdate(job);
+    if (FINISHED.includes(job.status)) stop();
+  };
+
+  const poll = async () => {
+    if (stopped) return;
+    try {
+      handle(await getJob(jobId));
+    } catch (error) {
+      console.error('Error al consultar el trabajo:', error);
+    }
+    if (!stopped) pollTimer = setTimeout(poll, POLL_INTERVAL_MS);
+  };
+
+  const token = localStorage.getItem('authToken');
+  if (token) {
+    socket = new WebSocket(`ws://localhost:8000/ws/jobs/?token=${token}`);
+    socket.onmessage = (e) => handle(JSON.parse(e.data));
+    // Consultar una vez al conectar por si el trabajo ya terminó antes
+    socket.onopen = () => getJob(jobId).then(handle).catch(() => {});
+    // Si el WebSocket falla o se cierra antes de terminar, se pasa a consultar
+    socket.onclose = () => { if (!stopped) poll(); };
+  } else {
+    poll();
+  }
+
+  return stop;
+};
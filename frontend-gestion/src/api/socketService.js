@@ -1,3 +1,5 @@
+const RECONNECT_DELAY_MS = 2000;
+
 class WebSocketService {
   static instance = null;
   callbacks = {}; // Almacena funciones para actualizar la UI
@@ -11,10 +13,14 @@ class WebSocketService {
 
   constructor() {
     this.socketRef = null;
+    this.roomName = null;
+    this.lastSeenId = null; // Último mensaje recibido, para recuperar los perdidos al reconectar
+    this.lastSeenAt = null; // Su fecha (por si el backend aún no lo ha guardado)
+    this.closedByUser = false;
   }
 
   // Iniciar conexiÃ³n
-  connect(roomName) {
+  connect(roomName, lastSeenId = null, lastSeenAt = null) {
     // 1. Recuperamos el token del almacenamiento local
     const token = localStorage.getItem('authToken'); 
 
@@ -23,8 +29,18 @@ class WebSocketService {
       return;
     }
 
-    // 2. Lo enviamos como parÃ¡metro en la URL (?token=...)
-    const path = `ws://localhost:8000/ws/chat/${roomName}/?token=${token}`;
+    if (lastSeenId !== null || roomName !== this.roomName) {
+      this.lastSeenId = lastSeenId;
+      this.lastSeenAt = lastSeenAt;
+    }
+    this.roomName = roomName;
+    this.closedByUser = false;
+
+    // 2. Lo enviamos como parÃ¡metro en la URL (?token=...); con last_seen el
+    // backend reenvía los mensajes posteriores
+    let lastSeen = this.lastSeenId ? `&last_seen=${this.lastSeenId}` : '';
+    if (this.lastSeenId && this.lastSeenAt) lastSeen += `&last_seen_at=${encodeURIComponent(this.lastSeenAt)}`;
+    const path = `ws://localhost:8000/ws/chat/${roomName}/?token=${token}${lastSeen}`;
     
     this.socketRef = new WebSocket(path);
 
@@ -32,11 +48,18 @@ class WebSocketService {
     this.socketRef.onopen = () => { console.log('âœ… WebSocket conectado correctamente'); };
     this.socketRef.onmessage = (e) => { this.socketNewMessage(e.data); };
     this.socketRef.onerror = (e) => { console.error('âŒ Error de WebSocket:', e); };
-    this.socketRef.onclose = () => { console.log('ðŸ”Œ WebSocket desconectado'); };
+    this.socketRef.onclose = () => {
+      console.log('ðŸ”Œ WebSocket desconectado');
+      // Reconectar si se cortó la conexión (no si la cerró el usuario)
+      if (!this.closedByUser) {
+        setTimeout(() => { if (!this.closedByUser) this.connect(this.roomName); }, RECONNECT_DELAY_MS);
+      }
+    };
   }
 
   // Desconectar
   disconnect() {
+    this.closedByUser = true;
     if (this.socketRef) {
       this.socketRef.close();
     }
@@ -59,6 +82,10 @@ class WebSocketService {
 
   socketNewMessage(data) {
     const parsedData = JSON.parse(data);
+    if (parsedData.id) {
+      this.lastSeenId = parsedData.id;
+      this.lastSeenAt = parsedData.created_at || null;
+    }
     const callback = this.callbacks['new_message'];
     if (callback) {
       callback(parsedData);
@@ -3,6 +3,7 @@ import { useClipboard } from '@mantine/hooks';
 import { IconCheck, IconCopy, IconMessageChatbot, IconMicrophone, IconMicrophoneOff, IconSend, IconVolume, IconX } from '@tabler/icons-react';
 import { useEffect, useRef, useState } from 'react';
 import { getProfile } from '../api/authService';
+import { getChatHistory } from '../api/chatService';
 import WebSocketInstance from '../api/socketService';
 import { useAuth } from '../context/AuthContext';
 import useSpeechRecognition from '../hooks/useSpeechRecognition';
@@ -58,19 +59,38 @@ const ChatWindow = ({ roomName, onClose }) => {
     window.speechSynthesis.speak(utterance);
   };
 
-  // ConexiÃ³n WebSocket
+  // ConexiÃ³n WebSocket: primero el historial reciente y después los mensajes en vivo
+  // (last_seen hace que el backend reenvíe lo enviado entre ambas cosas)
   useEffect(() => {
+    let cancelled = false;
     if (roomName) {
       setOpened(true);
-      WebSocketInstance.connect(roomName);
-      
+
       WebSocketInstance.addCallbacks((data) => {
-        setMessages((prev) => [...prev, data]);
-        
+        setMessages((prev) => (data.id && prev.some((m) => m.id === data.id) ? prev : [...prev, data]));
       });
+
+      const start = async () => {
+        let lastSeenId = null;
+        let lastSeenAt = null;
+        try {
+          const page = await getChatHistory(roomName);
+          const history = [...page.results].reverse();
+          setMessages(history);
+          if (history.length > 0) {
+            lastSeenId = history[history.length - 1].id;
+            lastSeenAt = history[history.length - 1].created_at;
+          }
+        } catch (error) {
+          console.error('No se pudo cargar el historial', error);
+        }
+        if (!cancelled) WebSocketInstance.connect(roomName, lastSeenId, lastSeenAt);
+      };
+      start();
     }
     
     return () => {
+      cancelled = true;
       WebSocketInstance.disconnect();
       if (isListening) stopListening();
       window.speechSynthesis.cancel();
@@ -54,6 +54,19 @@ const getSharedBadge = (isShared) => {
   );
 };
 
+/**
+ * Insignia para el estado de la extracción de texto (se procesa en segundo plano)
+ */
+const getExtractionBadge = (status) => {
+  if (status === 'pending' || status === 'running') {
+    return <Badge variant="light" color="yellow" size="sm">PROCESANDO</Badge>;
+  }
+  if (status === 'failed') {
+    return <Badge variant="light" color="red" size="sm">SIN TEXTO</Badge>;
+  }
+  return null;
+};
+
 // Función para formatear fechas
 const formatDate = (isoString) => {
   if (!isoString) return '---';
@@ -82,7 +95,8 @@ const DocumentItem = ({ document, onDeleteSuccess }) => {
     if (!url) return 'Documento';
     return url.split('/').pop(); 
   };
-  const filename = getFilename(document.file);
+  // 'name' es el nombre original; el archivo puede estar guardado con su hash
+  const filename = document.name || getFilename(document.file);
 
   const handleDownload = async () => {
     const userConfirmed = window.confirm(
@@ -155,6 +169,7 @@ const DocumentItem = ({ document, onDeleteSuccess }) => {
               </Anchor>
               {getPermissionBadge(document.permission_level)}
               {getSharedBadge(document.is_shared)}
+              {getExtractionBadge(document.extraction_status)}
             </Group>
           </Group>
 
@@ -1,12 +1,14 @@
 import React, { useState, useEffect } from 'react';
-import { SimpleGrid, Text, Loader, Center } from '@mantine/core';
+import { SimpleGrid, Text, Loader, Center, Button, Stack } from '@mantine/core';
 import DocumentItem from './DocumentItem';
 import { useAuth } from '../context/AuthContext';
-import { getDocuments } from '../api/documentService';
+import { getDocuments, getDocumentsPage } from '../api/documentService';
 
 // 1. Las props 'selectedFolderId' y 'selectedTagId' ya se están aceptando
 const DocumentList = ({ searchQuery, refetchTrigger, onDataChange, selectedFolderId, selectedTagId }) => {  
   const [documents, setDocuments] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const { loading: authLoading } = useAuth();
@@ -23,7 +25,8 @@ const DocumentList = ({ searchQuery, refetchTrigger, onDataChange, selectedFolde
         const data = await getDocuments(searchQuery, selectedFolderId, selectedTagId); 
         // ---------------------------------
         
-        setDocuments(data);
+        setDocuments(data.results);
+        setNextPage(data.next);
       } catch (err) {
         setError('No se pudieron cargar los documentos.');
         console.error(err);
@@ -37,6 +40,20 @@ const DocumentList = ({ searchQuery, refetchTrigger, onDataChange, selectedFolde
   // 3. El array de dependencias ya es correcto
   }, [authLoading, searchQuery, refetchTrigger, selectedFolderId, selectedTagId]); 
 
+  // Carga la siguiente página del cursor y la añade al final
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const data = await getDocumentsPage(nextPage);
+      setDocuments((prev) => [...prev, ...data.results]);
+      setNextPage(data.next);
+    } catch (err) {
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // ... (el resto de tu componente para manejar 'loading', 'error', y 'document.length === 0') ...
   if (authLoading || loading) {
     return (
@@ -55,18 +72,27 @@ const DocumentList = ({ searchQuery, refetchTrigger, onDataChange, selectedFolde
   }
 
   return (
-    <SimpleGrid
-      cols={{ base: 1, sm: 2, md: 3 }}
-      spacing="md"
-    >
-      {documents.map((doc) => (
-        <DocumentItem
-          key={doc.id}
-          document={doc}
-          onDeleteSuccess={onDataChange}
-        />
-      ))}
-    </SimpleGrid>
+    <Stack>
+      <SimpleGrid
+        cols={{ base: 1, sm: 2, md: 3 }}
+        spacing="md"
+      >
+        {documents.map((doc) => (
+          <DocumentItem
+            key={doc.id}
+            document={doc}
+            onDeleteSuccess={onDataChange}
+          />
+        ))}
+      </SimpleGrid>
+      {nextPage && (
+        <Center>
+          <Button variant="light" onClick={loadMore} loading={loadingMore}>
+            Cargar más
+          </Button>
+        </Center>
+      )}
+    </Stack>
   );
 };
 
@@ -1,7 +1,8 @@
-import React, { useState } from 'react';
-import { Modal, Button, Select, Loader, Textarea, Text, Group } from '@mantine/core';
+import React, { useState, useRef, useEffect } from 'react';
+import { Modal, Button, Select, Loader, Textarea, Text, Group, Progress } from '@mantine/core';
 import { notifications } from '@mantine/notifications';
-import { translateDocument, updateDocumentContent } from '../api/documentService';
+import { translateDocument, getTranslation, updateDocumentContent } from '../api/documentService';
+import { subscribeToJob } from '../api/jobSocketService';
 import { IconDownload, IconDeviceFloppy } from '@tabler/icons-react';
 
 // Lista de idiomas (puedes expandirla)
@@ -18,29 +19,66 @@ const TranslateModal = ({ opened, onClose, document }) => {
   const [translatedText, setTranslatedText] = useState('');
   const [loading, setLoading] = useState(false);
   const [isSaving, setIsSaving] = useState(false);
+  const [progress, setProgress] = useState(null); // { done, total } mientras se traduce
+  const unsubscribeRef = useRef(null);
+
+  const stopListening = () => {
+    if (unsubscribeRef.current) {
+      unsubscribeRef.current();
+      unsubscribeRef.current = null;
+    }
+  };
+
+  // Dejar de escuchar el trabajo si el componente se desmonta
+  useEffect(() => stopListening, []);
+
+  const showError = (message) => {
+    notifications.show({
+      title: 'Error de Traducción',
+      message: message,
+      color: 'red',
+    });
+  };
+
+  // La traducción corre en segundo plano: el avance llega por WebSocket
+  const handleJobUpdate = async (job) => {
+    setProgress({ done: job.progress_done, total: job.progress_total });
+    if (job.status === 'failed') {
+      showError('No se pudo traducir el documento.');
+      setLoading(false);
+      setProgress(null);
+    } else if (job.status === 'done') {
+      try {
+        const translation = await getTranslation(job.result.translation_id);
+        setTranslatedText(translation.translated_content);
+        notifications.show({
+          title: 'Traducción Completa',
+          message: `Traducido de ${translation.source_language} a ${targetLanguage}.`,
+          color: 'green',
+        });
+      } catch (err) {
+        showError('No se pudo obtener la traducción.');
+      } finally {
+        setLoading(false);
+        setProgress(null);
+      }
+    }
+  };
 
   const handleTranslate = async () => {
     if (!document) return;
     
+    stopListening();
     setLoading(true);
     setTranslatedText(''); // Limpiar traducción anterior
+    setProgress({ done: 0, total: 0 });
     try {
-      const result = await translateDocument(document.id, targetLanguage);
-      setTranslatedText(result.translated_text);
-      notifications.show({
-        title: 'Traducción Completa',
-        message: `Traducido de ${result.detected_source_language} a ${targetLanguage}.`,
-        color: 'green',
-      });
+      const { job_id } = await translateDocument(document.id, targetLanguage);
+      unsubscribeRef.current = subscribeToJob(job_id, handleJobUpdate);
     } catch (err) {
-      const message = err.response?.data?.error || 'No se pudo traducir el documento.';
-      notifications.show({
-        title: 'Error de Traducción',
-        message: message,
-        color: 'red',
-      });
-    } finally {
+      showError(err.response?.data?.error || 'No se pudo traducir el documento.');
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -79,7 +117,9 @@ const TranslateModal = ({ opened, onClose, document }) => {
 
   // Limpiar estado cuando se cierra el modal
   const handleClose = () => {
+    stopListening();
     setTranslatedText('');
+    setProgress(null);
     setLoading(false);
     setIsSaving(false);
     onClose();
@@ -106,6 +146,15 @@ const TranslateModal = ({ opened, onClose, document }) => {
         Traducir
       </Button>
 
+      {progress && progress.total > 0 && (
+        <>
+          <Progress value={(progress.done / progress.total) * 100} mt="md" animated />
+          <Text size="sm" c="dimmed" mt={4}>
+            Traduciendo... {progress.done} de {progress.total} segmentos
+          </Text>
+        </>
+      )}
+
       {translatedText && (
         <>
           <Textarea
@@ -50,7 +50,7 @@ const DocumentViewPage = () => {
   const handleDownloadContent = async () => {
     setDownloading(true);
     try {
-      const originalName = document?.file?.split('/').pop() || 'documento';
+      const originalName = document?.name || 'documento';
       await downloadDocument(document.id, originalName);
       
       notifications.show({
@@ -72,8 +72,8 @@ const DocumentViewPage = () => {
 
   // Función para obtener la extensión del archivo original
   const getFileExtension = () => {
-    if (!document?.file) return 'archivo';
-    const filename = document.file.split('/').pop();
+    if (!document?.name) return 'archivo';
+    const filename = document.name;
     const ext = filename.split('.').pop().toUpperCase();
     return ext;
   };
@@ -97,7 +97,7 @@ const DocumentViewPage = () => {
 
       <Paper withBorder shadow="md" p={30} radius="md">
         <Group justify="space-between" align="center" mb="lg">
-          <Title order={2}>{document?.file?.split('/').pop() || 'Documento'}</Title>
+          <Title order={2}>{document?.name || 'Documento'}</Title>
           <Text size="sm" c="dimmed">Formato original: {fileExtension}</Text>
         </Group>
         